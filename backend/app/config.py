@@ -9,14 +9,158 @@ class Settings:
     BASE_URL = os.getenv("base_url")
     GEMINI_MODEL = "google/gemini-3-flash-preview"
 
-    # 数据库配置
-    DATABASE_URL = "sqlite:///../../database/exam_reviewer.db"
+    # Gemini HTTP客户端配置（连接池与并发上限）
+    GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", 20))
+    GEMINI_MAX_KEEPALIVE = int(os.getenv("GEMINI_MAX_KEEPALIVE", 10))
+    GEMINI_KEEPALIVE_EXPIRY = float(os.getenv("GEMINI_KEEPALIVE_EXPIRY", 30))
+    GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 8))
+    GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", 60))  # 秒
+    GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", 10))
+
+    # PDF传输方式: inline=每次请求内联base64, file=上传到服务商后引用文件句柄（失败时回退inline）
+    PDF_TRANSPORT = os.getenv("PDF_TRANSPORT", "inline")
+    PROVIDER_FILE_PURPOSE = os.getenv("PROVIDER_FILE_PURPOSE", "user_data")
+    PROVIDER_FILE_TTL = int(os.getenv("PROVIDER_FILE_TTL", 47 * 3600))  # 服务商未返回过期时间时的默认有效期（秒）
+    PROVIDER_FILE_REFRESH_MARGIN = int(os.getenv("PROVIDER_FILE_REFRESH_MARGIN", 600))  # 提前多久视为过期（秒）
+    PROVIDER_FILE_FAILURE_TTL = float(os.getenv("PROVIDER_FILE_FAILURE_TTL", 60))  # 上传失败后多久内不再重试（秒）
+
+    # 页级上下文配置（用于带页码的解释/公式请求）
+    # full=发送整份PDF, pages=只发送所选页及前后N页的PDF切片, text=只发送这些页的提取文本
+    PDF_CONTEXT_MODE = os.getenv("PDF_CONTEXT_MODE", "pages")
+    PDF_CONTEXT_WINDOW = int(os.getenv("PDF_CONTEXT_WINDOW", 2))  # 前后各包含的页数
+
+    # 逐页文本提取配置
+    TEXT_EXTRACTION_WORKERS = int(os.getenv("TEXT_EXTRACTION_WORKERS", 2))
+    TEXT_EXTRACTION_BATCH_PAGES = int(os.getenv("TEXT_EXTRACTION_BATCH_PAGES", 50))  # 每批解析并提交的页数，中断后从已提交的页继续
+
+    # 后台任务（整篇摘要、结构分析）
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))  # 同时执行的任务总数
+    JOB_KIND_CONCURRENCY = int(os.getenv("JOB_KIND_CONCURRENCY", 1))  # 同一类任务同时执行的上限
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", 5))  # 秒，每次重试翻倍
+    JOB_RETRY_MAX_DELAY = float(os.getenv("JOB_RETRY_MAX_DELAY", 300))
+    JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", 600))  # 单次执行超时（秒）
+    PRECOMPUTE_ON_UPLOAD = os.getenv("PRECOMPUTE_ON_UPLOAD", "true").lower() == "true"  # 上传后预先生成摘要和结构分析
+
+    # 大文档分层摘要：超过页数阈值时按页段并行摘要，再逐级合并为章节和全文摘要
+    SUMMARY_SINGLE_PASS_PAGES = int(os.getenv("SUMMARY_SINGLE_PASS_PAGES", 40))  # 不超过此页数时一次调用生成
+    SUMMARY_RANGE_PAGES = int(os.getenv("SUMMARY_RANGE_PAGES", 20))  # 每个页段的页数
+    SUMMARY_REDUCE_FANOUT = int(os.getenv("SUMMARY_REDUCE_FANOUT", 8))  # 每次合并的摘要数
+    SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", 4))  # 同时摘要的页段数
+
+    # 对话历史：每次发送只读取最近N条消息；启用滚动摘要后更早的消息被折叠进对话摘要
+    CHAT_HISTORY_MESSAGES = int(os.getenv("CHAT_HISTORY_MESSAGES", 5))
+    CHAT_ROLLING_SUMMARY = os.getenv("CHAT_ROLLING_SUMMARY", "false").lower() == "true"
+    CHAT_SUMMARY_BATCH = int(os.getenv("CHAT_SUMMARY_BATCH", 10))  # 窗口外积累多少条消息后折叠一次
+    CHAT_SUMMARY_MAX_FOLD = int(os.getenv("CHAT_SUMMARY_MAX_FOLD", 100))  # 单次折叠的最大消息数
+
+    # 对话上下文模式: full=发送整份PDF, retrieval=只发送向量检索到的相关片段（无索引时回退full）
+    CHAT_CONTEXT_MODE = os.getenv("CHAT_CONTEXT_MODE", "full")
+    RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 6))
+    EMBEDDING_DIR = os.path.join(os.path.dirname(__file__), "../embeddings")
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "")  # 本地sentence-transformers模型名，留空使用哈希TF-IDF
+    EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", 4096))  # 哈希TF-IDF的向量维度
+    EMBEDDING_CHUNK_CHARS = int(os.getenv("EMBEDDING_CHUNK_CHARS", 800))
+    EMBEDDING_CHUNK_OVERLAP = int(os.getenv("EMBEDDING_CHUNK_OVERLAP", 120))
+
+    # AI回复缓存（解释/翻译/总结/公式）
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 30 * 24 * 3600))  # 秒
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 50000))
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 256 * 1024 * 1024))  # 回复文本总大小上限
+    RESPONSE_CACHE_FLUSH_INTERVAL = float(os.getenv("RESPONSE_CACHE_FLUSH_INTERVAL", 30))  # 命中统计写入数据库的周期（秒）
+    PROMPT_VERSION = "2026-10.1"  # 修改提示词模板时更新，使旧缓存失效
+
+    # 批量解释/翻译/总结：多个选中片段打包进尽量少的模型调用，PDF每次调用只发送一次
+    BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 50))  # 单个请求的最大片段数
+    BATCH_MAX_ITEMS_PER_CALL = int(os.getenv("BATCH_MAX_ITEMS_PER_CALL", 12))
+    BATCH_MAX_INPUT_TOKENS = int(os.getenv("BATCH_MAX_INPUT_TOKENS", 6000))  # 每次调用中片段文本的估算token上限
+    BATCH_MAX_OUTPUT_TOKENS = int(os.getenv("BATCH_MAX_OUTPUT_TOKENS", 8000))  # 每次调用的输出token上限
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 2))  # 同一请求中同时进行的模型调用数
+
+    # Token预算：发送前估算输入大小，对话历史和文本上下文按预算裁剪
+    PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 32000))  # 对话请求的估算输入上限（含文档）
+    CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", 4000))  # 对话历史最多占用的token
+    CHAT_HISTORY_MIN_MESSAGES = int(os.getenv("CHAT_HISTORY_MIN_MESSAGES", 2))  # 文档占满预算时仍保留的最近消息数
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 8000))  # 页文本/检索片段最多占用的token
+    PDF_TOKENS_PER_PAGE = int(os.getenv("PDF_TOKENS_PER_PAGE", 258))  # 以PDF/图片发送时每页的估算token
+    # 各操作的输出token上限覆盖，如 "chat=3000,explain=1500"（未列出的操作使用代码中的默认值）
+    OUTPUT_TOKEN_LIMITS = {
+        action.strip(): int(limit)
+        for action, _, limit in (
+            item.partition("=") for item in os.getenv("OUTPUT_TOKEN_LIMITS", "").split(",") if "=" in item
+        )
+    }
+    STREAM_INCLUDE_USAGE = os.getenv("STREAM_INCLUDE_USAGE", "true").lower() == "true"  # 流式调用请求返回用量
+    TOKEN_USAGE_FLUSH_INTERVAL = float(os.getenv("TOKEN_USAGE_FLUSH_INTERVAL", 30))  # 用量统计写入数据库的周期（秒）
+
+    # PDF最后访问时间批量写入周期（秒），读请求不再各自提交UPDATE
+    ACCESS_FLUSH_INTERVAL = float(os.getenv("ACCESS_FLUSH_INTERVAL", 30))
+
+    # 数据库配置：默认本地SQLite，多节点部署时可设为PostgreSQL URL（postgresql+psycopg2://...）
+    DATABASE_URL = os.getenv(
+        "DATABASE_URL",
+        f"sqlite:///{os.path.join(os.path.dirname(__file__), '../database/exam_reviewer.db')}"
+    )
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))  # 等待空闲连接的秒数
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # 非SQLite连接的最长复用秒数
+
+    # SQLite PRAGMA（每个连接建立时设置）
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")  # WAL下读不阻塞写
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # WAL下NORMAL可保证一致性
+    SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))  # 等待写锁的毫秒数
+    SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -64000))  # 负数单位为KiB，约64MB
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
 
     # 文件存储配置
     UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "../uploads")
     MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+    UPLOAD_FORM_OVERHEAD = 64 * 1024  # 按Content-Length预检时给multipart边界和表单字段留的余量
+    UPLOAD_CHUNK_SIZE = 1024 * 1024  # 上传分块写入大小 1MB
     ALLOWED_EXTENSIONS = {".pdf"}
 
+    # PDF文件下载：文件按uuid命名且内容不变，可长期缓存
+    FILE_CACHE_MAX_AGE = int(os.getenv("FILE_CACHE_MAX_AGE", 365 * 24 * 3600))
+    FILE_SERVE_CHUNK_SIZE = int(os.getenv("FILE_SERVE_CHUNK_SIZE", 256 * 1024))
+    # app：由本服务发送；x-accel-redirect（nginx）/ x-sendfile（Apache）：交给前置代理发送
+    FILE_SERVE_MODE = os.getenv("FILE_SERVE_MODE", "app")
+    FILE_ACCEL_PREFIX = os.getenv("FILE_ACCEL_PREFIX", "/protected-uploads")  # nginx internal location
+
+    # PDF CPU密集任务的共享进程池（元数据、文本提取、切片、渲染、OCR）
+    CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", min(4, os.cpu_count() or 1)))
+    CPU_POOL_MAX_QUEUE = int(os.getenv("CPU_POOL_MAX_QUEUE", 32))  # 超过后新任务直接拒绝
+    CPU_POOL_TIMEOUT = float(os.getenv("CPU_POOL_TIMEOUT", 60))  # 默认单任务超时，超时的子进程被终止
+    PDF_PARSE_TIMEOUT = float(os.getenv("PDF_PARSE_TIMEOUT", 30))  # 上传时解析元数据
+    PDF_TEXT_TIMEOUT = float(os.getenv("PDF_TEXT_TIMEOUT", 300))  # 逐页提取文本（每批）
+    RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", 60))  # 单页渲染
+    OCR_PAGE_TIMEOUT = float(os.getenv("OCR_PAGE_TIMEOUT", 180))  # 单页OCR
+
+    # 服务端页面渲染（pdf2image / poppler，在共享进程池中执行）
+    RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", 2))  # 后台预渲染缩略图的并发数
+    RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", os.path.join(os.path.dirname(__file__), "../render_cache"))
+    RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", 1024 * 1024 * 1024))  # 1GB
+    RENDER_MIN_DPI = int(os.getenv("RENDER_MIN_DPI", 24))
+    RENDER_MAX_DPI = int(os.getenv("RENDER_MAX_DPI", 300))
+    RENDER_DPI_STEP = int(os.getenv("RENDER_DPI_STEP", 12))  # DPI按步长取整，提高缓存命中率
+    RENDER_PAGE_DPI = int(os.getenv("RENDER_PAGE_DPI", 108))  # 相当于pdf.js的1.5倍缩放
+    RENDER_THUMBNAIL_DPI = int(os.getenv("RENDER_THUMBNAIL_DPI", 24))
+    RENDER_JPEG_QUALITY = int(os.getenv("RENDER_JPEG_QUALITY", 80))
+    RENDER_PRERENDER_THUMBNAILS = os.getenv("RENDER_PRERENDER_THUMBNAILS", "true").lower() == "true"
+    POPPLER_PATH = os.getenv("POPPLER_PATH") or None  # poppler不在PATH中时指定其bin目录
+
+    # 扫描版PDF本地OCR（pytesseract，需安装tesseract及语言包；与页面渲染共用进程池）
+    OCR_ENABLED = os.getenv("OCR_ENABLED", "true").lower() == "true"
+    OCR_LANGUAGES = os.getenv("OCR_LANGUAGES", "chi_sim+eng")
+    OCR_DPI = int(os.getenv("OCR_DPI", 300))
+    OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", 2))  # 同时识别的页数，其余渲染请求不被饿死
+    OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", 20))  # 文本层少于此字符数的页需要识别
+    TESSERACT_CMD = os.getenv("TESSERACT_CMD") or None  # tesseract不在PATH中时指定其路径
+
+    # PDF base64缓存配置（按编码后字节数计算上限）
+    PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", 256 * 1024 * 1024))  # 256MB
+
     # CORS配置
     CORS_ORIGINS = [
         "http://localhost:3000",
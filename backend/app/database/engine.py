@@ -0,0 +1,71 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from app.config import settings
+
+
+def create_db_engine(database_url: str = settings.DATABASE_URL) -> Engine:
+    """
+    按数据库URL创建引擎：SQLite开启WAL并在每个连接上设置性能相关的PRAGMA，
+    其他数据库（如多节点部署时的PostgreSQL）使用带健康检查的连接池
+
+    Args:
+        database_url: SQLAlchemy数据库URL
+
+    Returns:
+        数据库引擎
+    """
+    url = make_url(database_url)
+    pool_options = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+    }
+
+    if url.get_backend_name() != "sqlite":
+        return create_engine(
+            database_url,
+            pool_pre_ping=True,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            **pool_options
+        )
+
+    engine = create_engine(
+        database_url,
+        connect_args={
+            # 连接由线程池中的多个线程轮流使用
+            "check_same_thread": False,
+            # 驱动层等待写锁的秒数，与busy_timeout一致
+            "timeout": settings.SQLITE_BUSY_TIMEOUT / 1000,
+        },
+        **pool_options
+    )
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+    return engine
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """新建SQLite连接时设置PRAGMA（WAL模式写入数据库文件，其余设置按连接生效）"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT)}")
+        cursor.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def database_info(engine: Engine) -> dict:
+    """当前数据库配置（用于运行指标）"""
+    info = {
+        "dialect": engine.dialect.name,
+        "pool": engine.pool.status(),
+    }
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            info["journal_mode"] = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+            info["synchronous"] = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+            info["busy_timeout"] = conn.exec_driver_sql("PRAGMA busy_timeout").scalar()
+    return info
@@ -1,15 +1,17 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, Boolean, DateTime, ForeignKey, JSON
+from sqlalchemy import inspect, text, Column, Integer, String, Text, Boolean, Date, DateTime, ForeignKey, JSON, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from datetime import datetime
 import os
 
-# 数据库URL
-DATABASE_URL = os.path.join(os.path.dirname(__file__), "../../database/exam_reviewer.db")
-DATABASE_URL = f"sqlite:///{DATABASE_URL}"
+from app.config import settings
+from app.database.engine import create_db_engine
 
-# 创建数据库引擎
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# 数据库URL（由配置统一提供）
+DATABASE_URL = settings.DATABASE_URL
+
+# 创建数据库引擎（SQLite的WAL/PRAGMA与连接池设置见 engine.py）
+engine = create_db_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -19,25 +21,39 @@ class PDF(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String(255), nullable=False)
-    original_filename = Column(String(255), nullable=False)
-    file_path = Column(String(500), nullable=False)
+    original_filename = Column(String(255), nullable=False, index=True)
+    file_path = Column(String(500), nullable=False, index=True)
     file_size = Column(Integer, nullable=False)
+    content_hash = Column(String(64), index=True)  # 文件内容SHA-256
     page_count = Column(Integer, nullable=False)
     is_scanned = Column(Boolean, default=False)
-    upload_date = Column(DateTime, default=datetime.utcnow)
-    last_accessed = Column(DateTime, default=datetime.utcnow)
+    upload_date = Column(DateTime, default=datetime.utcnow, index=True)
+    last_accessed = Column(DateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # 列表ETag的校验值
+
+    # 服务商文件句柄（PDF_TRANSPORT=file 时使用）
+    provider_file_id = Column(String(255))
+    provider_file_uploaded_at = Column(DateTime)
+    provider_file_expires_at = Column(DateTime)
 
     # Relationships
     conversations = relationship("Conversation", back_populates="pdf", cascade="all, delete-orphan")
     annotations = relationship("Annotation", back_populates="pdf", cascade="all, delete-orphan")
     summary = relationship("PDFSummary", back_populates="pdf", uselist=False, cascade="all, delete-orphan")
+    page_texts = relationship("PDFPageText", back_populates="pdf", cascade="all, delete-orphan")
+    text_extraction = relationship("PDFTextExtraction", back_populates="pdf", uselist=False, cascade="all, delete-orphan")
+    structure = relationship("PDFStructure", back_populates="pdf", uselist=False, cascade="all, delete-orphan")
+    jobs = relationship("BackgroundJob", back_populates="pdf", cascade="all, delete-orphan")
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (Index("ix_conversations_pdf_updated", "pdf_id", "updated_at"),)
 
     id = Column(Integer, primary_key=True, index=True)
     pdf_id = Column(Integer, ForeignKey("pdfs.id", ondelete="CASCADE"), nullable=False)
     title = Column(String(255))
+    summary = Column(Text)  # 滚动摘要：已折叠的较早消息（CHAT_ROLLING_SUMMARY）
+    summarized_until_id = Column(Integer)  # 已折叠进摘要的最后一条消息ID
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -47,6 +63,7 @@ class Conversation(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (Index("ix_messages_conversation_created", "conversation_id", "created_at"),)
 
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
@@ -89,14 +106,179 @@ class PDFSummary(Base):
     # Relationships
     pdf = relationship("PDF", back_populates="summary")
 
+class PDFRangeSummary(Base):
+    __tablename__ = "pdf_range_summaries"
+    __table_args__ = (UniqueConstraint("content_hash", "level", "start_page", "end_page", "prompt_version"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), nullable=False, index=True)  # 按内容寻址，内容相同的PDF共用
+    level = Column(Integer, nullable=False, default=0)  # 0=页段摘要, >=1=由下一级合并的章节摘要
+    start_page = Column(Integer, nullable=False)
+    end_page = Column(Integer, nullable=False)
+    summary_text = Column(Text, nullable=False)
+    model = Column(String(100))
+    prompt_version = Column(String(20), nullable=False)
+    generated_at = Column(DateTime, default=datetime.utcnow)
+
+class PDFStructure(Base):
+    __tablename__ = "pdf_structures"
+
+    id = Column(Integer, primary_key=True, index=True)
+    pdf_id = Column(Integer, ForeignKey("pdfs.id", ondelete="CASCADE"), nullable=False, unique=True)
+    structure = Column(JSON)  # 解析出的JSON结构，模型未返回合法JSON时为空
+    raw_analysis = Column(Text, nullable=False)
+    generated_at = Column(DateTime, default=datetime.utcnow)
+
+    # Relationships
+    pdf = relationship("PDF", back_populates="structure")
+
+class BackgroundJob(Base):
+    __tablename__ = "background_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)  # 'summary', 'structure'
+    pdf_id = Column(Integer, ForeignKey("pdfs.id", ondelete="CASCADE"), nullable=False, index=True)
+    status = Column(String(20), nullable=False, default="queued", index=True)  # 'queued', 'running', 'completed', 'failed'
+    progress = Column(Integer, default=0)  # 0-100
+    message = Column(String(255))
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    result = Column(JSON)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    next_run_at = Column(DateTime)  # 重试时的最早执行时间
+
+    # Relationships
+    pdf = relationship("PDF", back_populates="jobs")
+
+class PDFPageText(Base):
+    __tablename__ = "pdf_page_texts"
+    __table_args__ = (UniqueConstraint("pdf_id", "page_number"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    pdf_id = Column(Integer, ForeignKey("pdfs.id", ondelete="CASCADE"), nullable=False)
+    page_number = Column(Integer, nullable=False)  # 从1开始
+    text = Column(Text, nullable=False, default="")
+    char_count = Column(Integer, nullable=False, default=0)
+    source = Column(String(20), default="text_layer")  # 'text_layer' or 'ocr'
+
+    # Relationships
+    pdf = relationship("PDF", back_populates="page_texts")
+
+class PDFTextExtraction(Base):
+    __tablename__ = "pdf_text_extractions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    pdf_id = Column(Integer, ForeignKey("pdfs.id", ondelete="CASCADE"), nullable=False, unique=True)
+    status = Column(String(20), nullable=False, default="pending")  # 'pending', 'running', 'completed', 'failed'
+    page_count = Column(Integer)
+    pages_done = Column(Integer, default=0)
+    error = Column(Text)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    duration_ms = Column(Integer)
+
+    # Relationships
+    pdf = relationship("PDF", back_populates="text_extraction")
+
+class AIResponseCache(Base):
+    __tablename__ = "ai_response_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), nullable=False, unique=True, index=True)
+    action = Column(String(50), nullable=False)  # 'explain', 'translate', 'summarize', 'formula'
+    model = Column(String(100), nullable=False)
+    pdf_hash = Column(String(64), index=True)
+    response = Column(Text, nullable=False)
+    size_bytes = Column(Integer, nullable=False, default=0)
+    hit_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_accessed_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class AITokenUsage(Base):
+    __tablename__ = "ai_token_usage"
+    __table_args__ = (UniqueConstraint("day", "pdf_hash", "action", "model"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False, index=True)  # UTC日期，按天累计
+    pdf_hash = Column(String(64), nullable=False, default="", index=True)  # 空字符串表示不附带PDF的调用
+    action = Column(String(50), nullable=False)  # 'chat', 'explain', 'batch', 'range_summary' ...
+    model = Column(String(100), nullable=False)
+    calls = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)  # API返回的实际用量
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    estimated_prompt_tokens = Column(Integer, nullable=False, default=0)  # 发送前的估算值
+    latency_ms = Column(Integer, nullable=False, default=0)  # 累计耗时
+
 # 创建所有表
 def init_db():
     """初始化数据库"""
-    # 确保database目录存在
-    db_dir = os.path.dirname(DATABASE_URL.replace("sqlite:///", ""))
-    os.makedirs(db_dir, exist_ok=True)
+    # 确保SQLite数据库目录存在
+    if engine.dialect.name == "sqlite" and engine.url.database:
+        os.makedirs(os.path.dirname(os.path.abspath(engine.url.database)), exist_ok=True)
 
     Base.metadata.create_all(bind=engine)
+    _migrate_schema()
+    _create_search_index()
+
+def _migrate_schema():
+    """为已存在的表补充新增的列和索引（create_all不会修改已有表）"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+def _create_search_index():
+    """
+    创建全文检索表（仅SQLite）
+
+    - search_index: FTS5主索引，中文使用trigram分词，保存原文用于摘要片段
+    - search_bigram: 无内容FTS5索引，中文按二元组切分，供少于3个字符的查询词使用
+    - search_entries: 普通表，按PDF和类型索引每条记录的rowid，过滤和删除时不必扫描FTS表
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    with engine.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+        )).first()
+        if not exists:
+            try:
+                tokenizer = "trigram"
+                conn.execute(text(_SEARCH_INDEX_DDL.format(tokenizer=tokenizer)))
+            except Exception:
+                # 旧版SQLite不支持trigram时退回unicode61
+                tokenizer = "unicode61"
+                conn.execute(text(_SEARCH_INDEX_DDL.format(tokenizer=tokenizer)))
+        for statement in _SEARCH_COMPANION_DDL:
+            conn.execute(text(statement))
+
+_SEARCH_INDEX_DDL = """
+CREATE VIRTUAL TABLE search_index USING fts5(
+    content,
+    kind UNINDEXED,
+    ref_id UNINDEXED,
+    pdf_id UNINDEXED,
+    page_number UNINDEXED,
+    tokenize = '{tokenizer}'
+)
+"""
+
+_SEARCH_COMPANION_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_bigram USING fts5(content, content = '', tokenize = 'unicode61')",
+    "CREATE TABLE IF NOT EXISTS search_entries (id INTEGER PRIMARY KEY, kind VARCHAR(20) NOT NULL, pdf_id INTEGER)",
+    "CREATE INDEX IF NOT EXISTS ix_search_entries_pdf_kind ON search_entries (pdf_id, kind)",
+]
 
 # 获取数据库会话
 def get_db():
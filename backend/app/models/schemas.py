@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Optional, List, Literal
+from app.config import settings
 from datetime import datetime
 
 class PDFUploadResponse(BaseModel):
@@ -9,6 +10,7 @@ class PDFUploadResponse(BaseModel):
     file_size: int
     is_scanned: bool
     upload_date: datetime
+    deduplicated: bool = False
 
 class PDFInfo(BaseModel):
     id: int
@@ -19,13 +21,37 @@ class PDFInfo(BaseModel):
     is_scanned: bool
     upload_date: datetime
     last_accessed: datetime
+    content_hash: Optional[str] = None  # 文件内容哈希，作为 ?v= 参数得到可长期缓存的文件和页面图片URL
+
+class PDFListResponse(BaseModel):
+    items: List[PDFInfo]
+    next_cursor: Optional[str] = None
+    has_more: bool
+    limit: int
+
+class PageText(BaseModel):
+    page_number: int
+    text: str
+    char_count: int
+    source: Optional[str] = None
+
+class PDFTextResponse(BaseModel):
+    pdf_id: int
+    status: str  # 'pending', 'running', 'completed', 'failed'
+    page_count: Optional[int] = None
+    pages_done: int = 0
+    duration_ms: Optional[int] = None
+    error: Optional[str] = None
+    pages: List[PageText] = []
 
 class ChatMessage(BaseModel):
+    id: Optional[int] = None
     role: str  # 'user' or 'assistant'
     content: str
     selected_text: Optional[str] = None
     page_number: Optional[int] = None
     action_type: Optional[str] = None
+    created_at: Optional[datetime] = None
 
 class ChatRequest(BaseModel):
     pdf_id: int
@@ -44,6 +70,31 @@ class ExplainRequest(BaseModel):
     selected_text: str
     page_number: int
     custom_prompt: Optional[str] = None
+    no_cache: bool = False  # 为True时绕过回复缓存
+
+class BatchItem(BaseModel):
+    action: Literal["explain", "translate", "summarize"]
+    selected_text: str
+    page_number: Optional[int] = None
+    target_language: str = "中文"  # 仅翻译使用
+    custom_prompt: Optional[str] = None  # 仅解释使用
+
+class BatchRequest(BaseModel):
+    pdf_id: int
+    items: List[BatchItem] = Field(..., min_length=1, max_length=settings.BATCH_MAX_ITEMS)
+    no_cache: bool = False  # 为True时绕过回复缓存
+
+class BatchItemResult(BaseModel):
+    index: int  # 对应请求中items的位置
+    action: str
+    result: Optional[str] = None
+    cached: bool = False  # 是否直接来自回复缓存
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    pdf_id: int
+    results: List[BatchItemResult]
+    api_calls: int  # 本次实际发起的模型API调用次数
 
 class SummaryRequest(BaseModel):
     pdf_id: int
@@ -53,6 +104,59 @@ class SummaryResponse(BaseModel):
     summary: str
     generated_at: datetime
 
+class RangeSummary(BaseModel):
+    level: int  # 0=页段摘要, >=1=合并后的章节摘要
+    start_page: int
+    end_page: int
+    summary: str
+    generated_at: datetime
+
+class StructureResponse(BaseModel):
+    pdf_id: int
+    structure: Optional[dict] = None  # 模型未返回合法JSON时为空，见raw_analysis
+    raw_analysis: str
+    generated_at: datetime
+
+class JobInfo(BaseModel):
+    id: int
+    kind: str  # 'summary', 'structure', 'thumbnails', 'ocr'
+    pdf_id: int
+    status: str  # 'queued', 'running', 'completed', 'failed'
+    progress: int = 0  # 0-100
+    message: Optional[str] = None
+    attempts: int = 0
+    max_attempts: int
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    next_run_at: Optional[datetime] = None
+
+class OCRStatus(BaseModel):
+    pdf_id: int
+    is_scanned: bool
+    available: bool  # 本机是否安装了OCR依赖
+    page_count: int
+    pages_ocr: int = 0  # 已识别的页数
+    pages_pending: int = 0  # 待识别的页数
+    job: Optional[JobInfo] = None  # 最近一次OCR任务
+
+class TokenUsageEntry(BaseModel):
+    action: str  # 'chat', 'explain', 'batch', 'range_summary' ...
+    calls: int
+    errors: int = 0
+    prompt_tokens: int  # API未返回用量的调用按估算值计入
+    completion_tokens: int
+    avg_latency_ms: float
+
+class PDFUsageResponse(BaseModel):
+    pdf_id: int
+    days: int
+    prompt_tokens: int
+    completion_tokens: int
+    actions: List[TokenUsageEntry]  # 按输入token数降序
+
 class Annotation(BaseModel):
     id: Optional[int] = None
     pdf_id: int
@@ -68,6 +172,35 @@ class ConversationHistory(BaseModel):
     conversation_id: int
     pdf_id: int
     title: Optional[str] = None
-    messages: List[ChatMessage]
+    messages: List[ChatMessage]  # 最近的若干条，按时间正序
+    message_count: int = 0
+    messages_cursor: Optional[str] = None  # 继续获取更早消息的游标，没有更早消息时为空
     created_at: datetime
     updated_at: datetime
+
+class ConversationPage(BaseModel):
+    conversations: List[ConversationHistory]
+    next_cursor: Optional[str] = None
+    has_more: bool
+
+class MessagePage(BaseModel):
+    conversation_id: int
+    messages: List[ChatMessage]  # 按时间正序
+    next_cursor: Optional[str] = None  # 获取更早消息的游标
+    has_more: bool
+
+class SearchHit(BaseModel):
+    kind: str  # 'page', 'annotation' or 'message'
+    ref_id: int
+    pdf_id: int
+    pdf_name: Optional[str] = None
+    page_number: Optional[int] = None
+    snippet: str
+    score: float
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchHit]
+    limit: int
+    offset: int
+    has_more: bool
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from typing import List
 from app.database.models import PDF, Annotation as AnnotationModel, get_db
 from app.models.schemas import Annotation
+from app.services.search_service import search_service
 from datetime import datetime
 
 router = APIRouter()
@@ -27,6 +28,8 @@ async def create_annotation(annotation: Annotation, db: Session = Depends(get_db
         )
 
         db.add(db_annotation)
+        db.flush()
+        search_service.index_annotation(db, db_annotation)
         db.commit()
         db.refresh(db_annotation)
 
@@ -94,6 +97,7 @@ async def update_annotation(
             db_annotation.note_text = annotation.note_text
 
         db_annotation.updated_at = datetime.utcnow()
+        search_service.index_annotation(db, db_annotation)
 
         db.commit()
         db.refresh(db_annotation)
@@ -124,6 +128,7 @@ async def delete_annotation(annotation_id: int, db: Session = Depends(get_db)):
     if not annotation:
         raise HTTPException(status_code=404, detail="Annotation not found")
 
+    search_service.remove_annotation(db, annotation.id)
     db.delete(annotation)
     db.commit()
 
@@ -1,17 +1,89 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from typing import List
-from app.database.models import PDF, Conversation, Message, get_db
+from typing import List, Optional
+from app.database.models import PDF, Conversation, Message, SessionLocal, get_db
 from app.services.gemini_service import GeminiService
+from app.services.streaming import sse_response
+from app.services.search_service import search_service
+from app.services.conversation_memory import conversation_memory
+from app.services.pagination import encode_cursor, decode_cursor, keyset_filter
+from app.config import settings
 from app.models.schemas import (
-    ChatRequest, ChatResponse, ExplainRequest,
-    ChatMessage, ConversationHistory
+    ChatRequest, ChatResponse, ExplainRequest, BatchRequest, BatchResponse,
+    ChatMessage, ConversationHistory, ConversationPage, MessagePage
 )
 from datetime import datetime
+import asyncio
 
 router = APIRouter()
 gemini_service = GeminiService()
 
+def _get_or_create_conversation(db: Session, pdf: PDF) -> Conversation:
+    """查找PDF最近的对话，不存在则创建"""
+    conversation = db.query(Conversation).filter(
+        Conversation.pdf_id == pdf.id
+    ).order_by(Conversation.updated_at.desc()).first()
+
+    if not conversation:
+        conversation = Conversation(
+            pdf_id=pdf.id,
+            title=f"Conversation with {pdf.original_filename}"
+        )
+        db.add(conversation)
+        db.commit()
+        db.refresh(conversation)
+
+    return conversation
+
+def _load_history(db: Session, conversation: Conversation) -> List[dict]:
+    """获取最近的对话历史（按 (conversation_id, created_at) 索引倒序取有限条数）"""
+    query = db.query(Message.role, Message.content).filter(
+        Message.conversation_id == conversation.id
+    )
+    limit = settings.CHAT_HISTORY_MESSAGES
+    if conversation_memory.enabled and conversation.summarized_until_id:
+        # 已折叠的消息由摘要代替；尚未折叠的最多一批加窗口大小，上下文不会出现空档
+        query = query.filter(Message.id > conversation.summarized_until_id)
+        limit += settings.CHAT_SUMMARY_BATCH
+
+    rows = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit).all()
+    return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+def _conversation_summary(conversation: Conversation) -> Optional[str]:
+    return conversation.summary if conversation_memory.enabled else None
+
+def _save_exchange(db: Session, conversation: Conversation, request: ChatRequest, ai_response: str) -> Message:
+    """保存用户消息和AI回复，并更新对话时间"""
+    user_message = Message(
+        conversation_id=conversation.id,
+        role="user",
+        content=request.message,
+        selected_text=request.selected_text,
+        page_number=request.page_number,
+        coordinates=request.coordinates
+    )
+    db.add(user_message)
+
+    assistant_message = Message(
+        conversation_id=conversation.id,
+        role="assistant",
+        content=ai_response
+    )
+    db.add(assistant_message)
+
+    # 更新对话时间
+    conversation.updated_at = datetime.utcnow()
+
+    # 写入全文检索索引
+    db.flush()
+    search_service.index_message(db, user_message, conversation.pdf_id)
+    search_service.index_message(db, assistant_message, conversation.pdf_id)
+
+    db.commit()
+    db.refresh(assistant_message)
+    return assistant_message
+
 @router.post("/send", response_model=ChatResponse)
 async def send_message(request: ChatRequest, db: Session = Depends(get_db)):
     """发送消息并获取AI回复"""
@@ -21,62 +93,20 @@ async def send_message(request: ChatRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="PDF not found")
 
     try:
-        # 查找或创建对话
-        conversation = db.query(Conversation).filter(
-            Conversation.pdf_id == request.pdf_id
-        ).order_by(Conversation.updated_at.desc()).first()
-
-        if not conversation:
-            conversation = Conversation(
-                pdf_id=request.pdf_id,
-                title=f"Conversation with {pdf.original_filename}"
-            )
-            db.add(conversation)
-            db.commit()
-            db.refresh(conversation)
-
-        # 获取对话历史
-        messages = db.query(Message).filter(
-            Message.conversation_id == conversation.id
-        ).order_by(Message.created_at.asc()).all()
-
-        conversation_history = [
-            {"role": msg.role, "content": msg.content}
-            for msg in messages[-5:]  # 只取最近5条
-        ]
-
-        # 保存用户消息
-        user_message = Message(
-            conversation_id=conversation.id,
-            role="user",
-            content=request.message,
-            selected_text=request.selected_text,
-            page_number=request.page_number,
-            coordinates=request.coordinates
-        )
-        db.add(user_message)
+        conversation = _get_or_create_conversation(db, pdf)
+        conversation_history = _load_history(db, conversation)
 
         # 调用AI获取回复
-        ai_response = gemini_service.chat_with_pdf(
+        ai_response = await gemini_service.chat_with_pdf(
             pdf_path=pdf.file_path,
             user_message=request.message,
             conversation_history=conversation_history,
-            selected_text=request.selected_text
-        )
-
-        # 保存AI回复
-        assistant_message = Message(
-            conversation_id=conversation.id,
-            role="assistant",
-            content=ai_response
+            selected_text=request.selected_text,
+            conversation_summary=_conversation_summary(conversation)
         )
-        db.add(assistant_message)
 
-        # 更新对话时间
-        conversation.updated_at = datetime.utcnow()
-
-        db.commit()
-        db.refresh(assistant_message)
+        assistant_message = _save_exchange(db, conversation, request, ai_response)
+        conversation_memory.schedule(conversation.id)
 
         return ChatResponse(
             message_id=assistant_message.id,
@@ -88,6 +118,51 @@ async def send_message(request: ChatRequest, db: Session = Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
 
+@router.post("/send/stream")
+async def send_message_stream(request: ChatRequest, db: Session = Depends(get_db)):
+    """发送消息并以SSE流式返回AI回复，流结束后保存完整消息"""
+    pdf = db.query(PDF).filter(PDF.id == request.pdf_id).first()
+    if not pdf:
+        raise HTTPException(status_code=404, detail="PDF not found")
+
+    try:
+        conversation = _get_or_create_conversation(db, pdf)
+        conversation_history = _load_history(db, conversation)
+        conversation_id = conversation.id
+
+        chunks = await gemini_service.chat_with_pdf(
+            pdf_path=pdf.file_path,
+            user_message=request.message,
+            conversation_history=conversation_history,
+            selected_text=request.selected_text,
+            stream=True,
+            conversation_summary=_conversation_summary(conversation)
+        )
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
+
+    def save(ai_response: str) -> dict:
+        # 请求作用域的会话可能已关闭，流结束时使用独立会话
+        session = SessionLocal()
+        try:
+            conv = session.query(Conversation).filter(Conversation.id == conversation_id).first()
+            assistant_message = _save_exchange(session, conv, request, ai_response)
+            return {"message_id": assistant_message.id, "conversation_id": conversation_id}
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    async def persist(ai_response: str) -> dict:
+        # 数据库写入在线程中执行，不阻塞事件循环；折叠任务须在事件循环上排队
+        saved = await asyncio.to_thread(save, ai_response)
+        conversation_memory.schedule(conversation_id)
+        return saved
+
+    return sse_response(chunks, on_complete=persist)
+
 @router.post("/explain")
 async def explain_text(request: ExplainRequest, db: Session = Depends(get_db)):
     """解释选中的文本"""
@@ -96,11 +171,12 @@ async def explain_text(request: ExplainRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="PDF not found")
 
     try:
-        explanation = gemini_service.explain_selected_text(
+        explanation = await gemini_service.explain_selected_text(
             pdf_path=pdf.file_path,
             selected_text=request.selected_text,
             page_num=request.page_number,
-            custom_prompt=request.custom_prompt
+            custom_prompt=request.custom_prompt,
+            use_cache=not request.no_cache
         )
 
         return {"explanation": explanation}
@@ -108,6 +184,27 @@ async def explain_text(request: ExplainRequest, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Explanation failed: {str(e)}")
 
+@router.post("/explain/stream")
+async def explain_text_stream(request: ExplainRequest, db: Session = Depends(get_db)):
+    """解释选中的文本（SSE流式返回）"""
+    pdf = db.query(PDF).filter(PDF.id == request.pdf_id).first()
+    if not pdf:
+        raise HTTPException(status_code=404, detail="PDF not found")
+
+    try:
+        chunks = await gemini_service.explain_selected_text(
+            pdf_path=pdf.file_path,
+            selected_text=request.selected_text,
+            page_num=request.page_number,
+            custom_prompt=request.custom_prompt,
+            stream=True,
+            use_cache=not request.no_cache
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Explanation failed: {str(e)}")
+
+    return sse_response(chunks)
+
 @router.post("/translate")
 async def translate_text(request: dict, db: Session = Depends(get_db)):
     """翻译选中的文本"""
@@ -120,10 +217,11 @@ async def translate_text(request: dict, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="PDF not found")
 
     try:
-        translation = gemini_service.translate_text(
+        translation = await gemini_service.translate_text(
             pdf_path=pdf.file_path,
             selected_text=selected_text,
-            target_language=target_language
+            target_language=target_language,
+            use_cache=not request.get("no_cache", False)
         )
 
         return {"translation": translation}
@@ -131,6 +229,30 @@ async def translate_text(request: dict, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Translation failed: {str(e)}")
 
+@router.post("/translate/stream")
+async def translate_text_stream(request: dict, db: Session = Depends(get_db)):
+    """翻译选中的文本（SSE流式返回）"""
+    pdf_id = request.get("pdf_id")
+    selected_text = request.get("selected_text")
+    target_language = request.get("target_language", "中文")
+
+    pdf = db.query(PDF).filter(PDF.id == pdf_id).first()
+    if not pdf:
+        raise HTTPException(status_code=404, detail="PDF not found")
+
+    try:
+        chunks = await gemini_service.translate_text(
+            pdf_path=pdf.file_path,
+            selected_text=selected_text,
+            target_language=target_language,
+            stream=True,
+            use_cache=not request.get("no_cache", False)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Translation failed: {str(e)}")
+
+    return sse_response(chunks)
+
 @router.post("/summarize")
 async def summarize_text(request: dict, db: Session = Depends(get_db)):
     """总结选中的文本"""
@@ -142,9 +264,10 @@ async def summarize_text(request: dict, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="PDF not found")
 
     try:
-        summary = gemini_service.summarize_text(
+        summary = await gemini_service.summarize_text(
             pdf_path=pdf.file_path,
-            selected_text=selected_text
+            selected_text=selected_text,
+            use_cache=not request.get("no_cache", False)
         )
 
         return {"summary": summary}
@@ -153,6 +276,21 @@ async def summarize_text(request: dict, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Summarization failed: {str(e)}")
 
 
+@router.post("/batch", response_model=BatchResponse)
+async def batch_selections(request: BatchRequest, db: Session = Depends(get_db)):
+    """批量解释/翻译/总结多个选中片段（打包进尽量少的模型调用，单个片段失败不影响其他片段）"""
+    pdf = db.query(PDF).filter(PDF.id == request.pdf_id).first()
+    if not pdf:
+        raise HTTPException(status_code=404, detail="PDF not found")
+
+    batch = await gemini_service.batch_selections(
+        pdf_path=pdf.file_path,
+        items=[item.model_dump() for item in request.items],
+        use_cache=not request.no_cache
+    )
+    return BatchResponse(pdf_id=pdf.id, **batch)
+
+
 @router.post("/explain-formula")
 async def explain_formula(request: dict, db: Session = Depends(get_db)):
     """解释公式 - 支持文本或图片输入"""
@@ -166,11 +304,12 @@ async def explain_formula(request: dict, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="PDF not found")
 
     try:
-        explanation = gemini_service.explain_formula(
+        explanation = await gemini_service.explain_formula(
             pdf_path=pdf.file_path,
             selected_text=selected_text,
             image_base64=image_base64,
-            page_num=page_number
+            page_num=page_number,
+            use_cache=not request.get("no_cache", False)
         )
 
         return {"explanation": explanation}
@@ -179,38 +318,126 @@ async def explain_formula(request: dict, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Formula explanation failed: {str(e)}")
 
 
-@router.get("/{pdf_id}/conversations", response_model=List[ConversationHistory])
-async def get_conversations(pdf_id: int, db: Session = Depends(get_db)):
-    """获取PDF的所有对话历史"""
-    conversations = db.query(Conversation).filter(
-        Conversation.pdf_id == pdf_id
-    ).order_by(Conversation.updated_at.desc()).all()
+def _chat_message(msg: Message) -> ChatMessage:
+    return ChatMessage(
+        id=msg.id,
+        role=msg.role,
+        content=msg.content,
+        selected_text=msg.selected_text,
+        page_number=msg.page_number,
+        action_type=msg.action_type,
+        created_at=msg.created_at
+    )
+
+@router.get("/{pdf_id}/conversations", response_model=ConversationPage)
+async def get_conversations(
+    pdf_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    messages: int = Query(50, ge=0, le=500),
+    db: Session = Depends(get_db)
+):
+    """
+    获取PDF的对话历史（按更新时间倒序，游标分页）
+
+    每个对话只附带最近 messages 条消息（0表示只返回对话头），更早的消息通过
+    /conversations/{conversation_id}/messages 按 messages_cursor 继续获取。
+    查询次数固定为3次，与对话数和消息数无关。
+    """
+    query = db.query(Conversation).filter(Conversation.pdf_id == pdf_id)
+    if cursor:
+        try:
+            values = decode_cursor(cursor, 2)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        query = query.filter(keyset_filter((Conversation.updated_at, Conversation.id), values))
+
+    conversations = query.order_by(
+        Conversation.updated_at.desc(), Conversation.id.desc()
+    ).limit(limit + 1).all()
+    has_more = len(conversations) > limit
+    conversations = conversations[:limit]
+    conversation_ids = [conv.id for conv in conversations]
+
+    # 一次查询统计所有对话的消息数
+    counts = dict(
+        db.query(Message.conversation_id, func.count(Message.id))
+        .filter(Message.conversation_id.in_(conversation_ids))
+        .group_by(Message.conversation_id)
+        .all()
+    ) if conversation_ids else {}
+
+    # 一次查询取出每个对话最近的N条消息（窗口函数按对话分组排序）
+    recent = {conversation_id: [] for conversation_id in conversation_ids}
+    if conversation_ids and messages:
+        ranked = db.query(
+            Message.id.label("message_id"),
+            func.row_number().over(
+                partition_by=Message.conversation_id,
+                order_by=(Message.created_at.desc(), Message.id.desc())
+            ).label("rank")
+        ).filter(Message.conversation_id.in_(conversation_ids)).subquery()
+        rows = db.query(Message).join(ranked, ranked.c.message_id == Message.id).filter(
+            ranked.c.rank <= messages
+        ).order_by(Message.conversation_id, Message.created_at.asc(), Message.id.asc()).all()
+        for msg in rows:
+            recent[msg.conversation_id].append(msg)
 
     result = []
     for conv in conversations:
-        messages = db.query(Message).filter(
-            Message.conversation_id == conv.id
-        ).order_by(Message.created_at.asc()).all()
-
+        conv_messages = recent[conv.id]
+        count = counts.get(conv.id, 0)
+        messages_cursor = None
+        if conv_messages and count > len(conv_messages):
+            messages_cursor = encode_cursor(conv_messages[0].created_at, conv_messages[0].id)
         result.append(ConversationHistory(
             conversation_id=conv.id,
             pdf_id=conv.pdf_id,
             title=conv.title,
-            messages=[
-                ChatMessage(
-                    role=msg.role,
-                    content=msg.content,
-                    selected_text=msg.selected_text,
-                    page_number=msg.page_number,
-                    action_type=msg.action_type
-                )
-                for msg in messages
-            ],
+            messages=[_chat_message(msg) for msg in conv_messages],
+            message_count=count,
+            messages_cursor=messages_cursor,
             created_at=conv.created_at,
             updated_at=conv.updated_at
         ))
 
-    return result
+    last = conversations[-1] if conversations else None
+    return ConversationPage(
+        conversations=result,
+        next_cursor=encode_cursor(last.updated_at, last.id) if has_more else None,
+        has_more=has_more
+    )
+
+@router.get("/conversations/{conversation_id}/messages", response_model=MessagePage)
+async def get_conversation_messages(
+    conversation_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    """按时间倒序分页获取对话消息：不带游标时返回最新的一页，游标指向更早的消息"""
+    exists = db.query(Conversation.id).filter(Conversation.id == conversation_id).first()
+    if not exists:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    query = db.query(Message).filter(Message.conversation_id == conversation_id)
+    if cursor:
+        try:
+            values = decode_cursor(cursor, 2)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        query = query.filter(keyset_filter((Message.created_at, Message.id), values))
+
+    rows = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return MessagePage(
+        conversation_id=conversation_id,
+        messages=[_chat_message(msg) for msg in reversed(rows)],
+        next_cursor=encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None,
+        has_more=has_more
+    )
 
 @router.delete("/{conversation_id}")
 async def delete_conversation(conversation_id: int, db: Session = Depends(get_db)):
@@ -222,6 +449,7 @@ async def delete_conversation(conversation_id: int, db: Session = Depends(get_db
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
+    search_service.remove_conversation(db, conversation.id)
     db.delete(conversation)
     db.commit()
 
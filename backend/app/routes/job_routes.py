@@ -0,0 +1,67 @@
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from app.database.models import SessionLocal, get_db
+from app.services.job_service import job_queue
+from app.services.streaming import sse_event
+from app.models.schemas import JobInfo
+
+router = APIRouter()
+
+# 进度流的轮询间隔（秒）
+PROGRESS_POLL_INTERVAL = 1.0
+
+@router.get("/{job_id}", response_model=JobInfo)
+async def get_job(job_id: int, db: Session = Depends(get_db)):
+    """查询后台任务状态"""
+    job = job_queue.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobInfo(**job)
+
+@router.get("/{job_id}/progress")
+async def stream_job_progress(job_id: int, db: Session = Depends(get_db)):
+    """以SSE推送任务进度：进度变化时发送 progress 事件，结束时发送 done 或 error 事件"""
+    if not job_queue.get_job(db, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    def load() -> dict:
+        session = SessionLocal()
+        try:
+            return job_queue.get_job(session, job_id)
+        finally:
+            session.close()
+
+    async def event_stream():
+        yield ": connected\n\n"
+        last = None
+        while True:
+            job = await asyncio.to_thread(load)
+            if job is None:
+                yield sse_event({"detail": "Job not found"}, event="error")
+                return
+
+            payload = jsonable_encoder(JobInfo(**job))
+            if job["status"] == "completed":
+                yield sse_event(payload, event="done")
+                return
+            if job["status"] == "failed":
+                yield sse_event(payload, event="error")
+                return
+
+            snapshot = (job["status"], job["progress"], job["message"], job["attempts"])
+            if snapshot != last:
+                last = snapshot
+                yield sse_event(payload, event="progress")
+            await asyncio.sleep(PROGRESS_POLL_INTERVAL)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
@@ -1,24 +1,66 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from app.database.models import PDF, get_db
 from app.services.pdf_service import PDFService
-from app.services.gemini_service import GeminiService
-from app.models.schemas import PDFUploadResponse, PDFInfo, SummaryResponse
-from datetime import datetime
+from app.services.job_service import job_queue
+from app.services.summarization_service import summarizer
+from app.services.text_index_service import text_index
+from app.services.search_service import search_service
+from app.services.blob_service import blob_store
+from app.services.access_tracker import access_tracker
+from app.services.file_serving import serve_file
+from app.services.pdf_cache import pdf_cache
+from app.services.render_service import page_renderer, MEDIA_TYPES
+from app.services.ocr_service import ocr_pipeline
+from app.services.token_usage import token_usage
+from app.services.pagination import encode_cursor, decode_cursor, keyset_filter
+from app.config import settings
+from app.models.schemas import (
+    PDFUploadResponse, PDFInfo, PDFListResponse, SummaryResponse, RangeSummary, StructureResponse,
+    JobInfo, OCRStatus, PDFTextResponse, PageText, PDFUsageResponse, TokenUsageEntry
+)
+import asyncio
+import hashlib
 import os
 
 router = APIRouter()
 pdf_service = PDFService()
-gemini_service = GeminiService()
+
+def _accepted(job: dict) -> JSONResponse:
+    """任务已排队：返回202及任务信息，客户端轮询 /api/jobs/{id}"""
+    return JSONResponse(status_code=202, content=jsonable_encoder(JobInfo(**job)))
 
 @router.post("/upload", response_model=PDFUploadResponse)
 async def upload_pdf(file: UploadFile = File(...), db: Session = Depends(get_db)):
     """上传PDF文件"""
+    # 复用已有文件时持有的内容哈希锁，新记录提交后释放，期间文件不会被删除（持锁期间没有await）
+    held = []
     try:
+        sources = {}
+
+        def find_blob(content_hash: str) -> Optional[dict]:
+            # 内容相同的PDF已存在时复用其文件
+            lock = blob_store.lock(content_hash)
+            lock.acquire()
+            source = blob_store.find(db, content_hash)
+            if not source:
+                lock.release()
+                return None
+            held.append(lock)
+            sources[content_hash] = source
+            return {
+                "filename": source.filename,
+                "file_path": source.file_path,
+                "page_count": source.page_count,
+                "is_scanned": source.is_scanned
+            }
+
         # 保存文件
-        file_info = await pdf_service.save_pdf(file)
+        file_info = await pdf_service.save_pdf(file, find_blob=find_blob)
 
         # 保存到数据库
         pdf_record = PDF(
@@ -26,44 +68,142 @@ async def upload_pdf(file: UploadFile = File(...), db: Session = Depends(get_db)
             original_filename=file_info['original_filename'],
             file_path=file_info['file_path'],
             file_size=file_info['file_size'],
+            content_hash=file_info['content_hash'],
             page_count=file_info['page_count'],
             is_scanned=file_info['is_scanned']
         )
 
         db.add(pdf_record)
+        db.flush()
+
+        # 重复上传不复制派生数据：页文本、摘要和结构分析保存在引用同一文件的owner记录上
+        owner = blob_store.owner_of(db, pdf_record)
         db.commit()
+        while held:
+            held.pop().release()
         db.refresh(pdf_record)
 
+        # 后台逐页提取文本（owner尚无提取记录或上次提取失败时）
+        extraction = owner.text_extraction
+        if not extraction or extraction.status == "failed":
+            text_index.schedule(owner.id)
+
+        # 扫描版复用已有页文本时，继续识别尚未OCR的页（新文件在文本提取完成后自动排队）
+        if owner.id != pdf_record.id and pdf_record.is_scanned and ocr_pipeline.available:
+            if await asyncio.to_thread(ocr_pipeline.pending_pages, owner.id):
+                await job_queue.enqueue("ocr", owner.id)
+
+        # 预先生成摘要和结构分析，用户首次点击时直接返回
+        if settings.PRECOMPUTE_ON_UPLOAD:
+            if not owner.summary:
+                await job_queue.enqueue("summary", owner.id)
+            if not owner.structure:
+                await job_queue.enqueue("structure", owner.id)
+
+        # 预先渲染缩略图（内容相同的PDF直接命中渲染缓存）
+        if settings.RENDER_PRERENDER_THUMBNAILS and page_renderer.available:
+            await job_queue.enqueue("thumbnails", pdf_record.id)
+
         return PDFUploadResponse(
             id=pdf_record.id,
             filename=pdf_record.filename,
             page_count=pdf_record.page_count,
             file_size=pdf_record.file_size,
             is_scanned=pdf_record.is_scanned,
-            upload_date=pdf_record.upload_date
+            upload_date=pdf_record.upload_date,
+            deduplicated=file_info['deduplicated']
         )
 
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        while held:
+            held.pop().release()
 
-@router.get("/", response_model=List[PDFInfo])
-async def list_pdfs(db: Session = Depends(get_db)):
-    """获取所有PDF列表"""
-    pdfs = db.query(PDF).order_by(PDF.upload_date.desc()).all()
-    return [
-        PDFInfo(
-            id=pdf.id,
-            filename=pdf.filename,
-            original_filename=pdf.original_filename,
-            page_count=pdf.page_count,
-            file_size=pdf.file_size,
-            is_scanned=pdf.is_scanned,
-            upload_date=pdf.upload_date,
-            last_accessed=pdf.last_accessed
-        )
-        for pdf in pdfs
-    ]
+# 列表排序字段；每种排序都以ID作为第二排序键，保证游标唯一
+_LIST_SORT_COLUMNS = {
+    "upload_date": PDF.upload_date,
+    "last_accessed": PDF.last_accessed,
+    "name": PDF.original_filename,
+}
+
+# 列表只查询这些列，不构建ORM对象
+_LIST_COLUMNS = (
+    PDF.id, PDF.filename, PDF.original_filename, PDF.page_count, PDF.file_size,
+    PDF.is_scanned, PDF.upload_date, PDF.last_accessed, PDF.content_hash
+)
+
+@router.get("/", response_model=PDFListResponse)
+async def list_pdfs(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    sort: str = Query("upload_date", pattern="^(upload_date|last_accessed|name)$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    is_scanned: Optional[bool] = None,
+    name_prefix: Optional[str] = Query(None, min_length=1),
+    db: Session = Depends(get_db)
+):
+    """
+    获取PDF列表（游标分页，可按上传时间、最后访问时间或文件名排序）
+
+    只查询列表需要的列；响应带ETag，由查询参数和过滤后记录的数量、最大ID、最近修改时间计算，
+    请求头 If-None-Match 一致时不查询列表直接返回304。
+    """
+    sort_column = _LIST_SORT_COLUMNS[sort]
+    descending = order == "desc"
+
+    filters = []
+    if is_scanned is not None:
+        filters.append(PDF.is_scanned == is_scanned)
+    if name_prefix:
+        # 范围条件可以使用 original_filename 索引（LIKE在SQLite中默认不走索引）
+        filters.append(PDF.original_filename >= name_prefix)
+        filters.append(PDF.original_filename < name_prefix + "\uffff")
+
+    # 增删记录改变数量或最大ID，任何列的修改（含批量写入的访问时间）都会更新 updated_at
+    validator = db.query(
+        func.count(PDF.id), func.max(PDF.id), func.max(PDF.updated_at)
+    ).filter(*filters).one()
+    digest = hashlib.sha256(repr((str(request.query_params), tuple(validator))).encode("utf-8"))
+    etag = f'W/"{digest.hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    query = db.query(*_LIST_COLUMNS).filter(*filters)
+    if cursor:
+        try:
+            values = decode_cursor(cursor, 2)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        query = query.filter(keyset_filter((sort_column, PDF.id), values, descending))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), PDF.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), PDF.id.asc())
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), last.id)
+
+    return PDFListResponse(
+        items=[PDFInfo(**row._mapping) for row in rows],
+        next_cursor=next_cursor,
+        has_more=has_more,
+        limit=limit
+    )
 
 @router.get("/{pdf_id}", response_model=PDFInfo)
 async def get_pdf(pdf_id: int, db: Session = Depends(get_db)):
@@ -72,9 +212,8 @@ async def get_pdf(pdf_id: int, db: Session = Depends(get_db)):
     if not pdf:
         raise HTTPException(status_code=404, detail="PDF not found")
 
-    # 更新最后访问时间
-    pdf.last_accessed = datetime.utcnow()
-    db.commit()
+    # 记录访问时间（批量延迟写入，读请求不占用数据库写锁）
+    last_accessed = access_tracker.touch(pdf.id)
 
     return PDFInfo(
         id=pdf.id,
@@ -84,34 +223,120 @@ async def get_pdf(pdf_id: int, db: Session = Depends(get_db)):
         file_size=pdf.file_size,
         is_scanned=pdf.is_scanned,
         upload_date=pdf.upload_date,
-        last_accessed=pdf.last_accessed
+        last_accessed=last_accessed,
+        content_hash=pdf.content_hash
+    )
+
+@router.get("/{pdf_id}/ocr", response_model=OCRStatus)
+async def get_ocr_status(pdf_id: int):
+    """获取扫描版PDF的OCR进度"""
+    status = await asyncio.to_thread(ocr_pipeline.status, pdf_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="PDF not found")
+    return OCRStatus(**status)
+
+@router.post("/{pdf_id}/ocr", response_model=JobInfo, status_code=202)
+async def start_ocr(pdf_id: int):
+    """手动提交OCR任务（只识别尚未识别的页，返回202及任务信息）"""
+    status = await asyncio.to_thread(ocr_pipeline.status, pdf_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="PDF not found")
+    if not ocr_pipeline.available:
+        raise HTTPException(status_code=503, detail="OCR is not available (pytesseract/tesseract/poppler missing)")
+    if not status["pages_pending"]:
+        raise HTTPException(status_code=409, detail="No pages need OCR")
+    return _accepted(await job_queue.enqueue("ocr", pdf_id))
+
+@router.get("/{pdf_id}/usage", response_model=PDFUsageResponse)
+async def get_token_usage(pdf_id: int, days: int = Query(30, ge=1, le=365), db: Session = Depends(get_db)):
+    """获取PDF最近若干天按操作汇总的AI调用token用量（内容相同的PDF共用统计，最多滞后 TOKEN_USAGE_FLUSH_INTERVAL 秒）"""
+    pdf = db.query(PDF.id, PDF.file_path, PDF.content_hash).filter(PDF.id == pdf_id).first()
+    if not pdf:
+        raise HTTPException(status_code=404, detail="PDF not found")
+
+    content_hash = pdf.content_hash or await asyncio.to_thread(pdf_cache.content_hash, pdf.file_path)
+    actions = await asyncio.to_thread(token_usage.pdf_usage, content_hash, days)
+    return PDFUsageResponse(
+        pdf_id=pdf.id,
+        days=days,
+        prompt_tokens=sum(entry["prompt_tokens"] for entry in actions),
+        completion_tokens=sum(entry["completion_tokens"] for entry in actions),
+        actions=[TokenUsageEntry(**entry) for entry in actions]
     )
 
 @router.get("/{pdf_id}/file")
-async def get_pdf_file(pdf_id: int, db: Session = Depends(get_db)):
-    """获取PDF文件"""
-    pdf = db.query(PDF).filter(PDF.id == pdf_id).first()
+async def get_pdf_file(
+    request: Request,
+    pdf_id: int,
+    v: Optional[str] = Query(None, description="文件内容哈希；与当前内容一致时响应可被长期缓存"),
+    db: Session = Depends(get_db)
+):
+    """
+    获取PDF文件
+
+    支持Range请求（pdf.js按需分段加载）；ETag为文件内容哈希，If-None-Match命中时返回304。
+    记录ID在删除后可能被新上传的文件复用，只有带 ?v=<内容哈希> 的URL标记为长期缓存，
+    不带版本的URL每次向服务端验证。
+    """
+    pdf = db.query(PDF.id, PDF.file_path, PDF.content_hash, PDF.original_filename).filter(
+        PDF.id == pdf_id
+    ).first()
     if not pdf:
         raise HTTPException(status_code=404, detail="PDF not found")
 
     if not os.path.exists(pdf.file_path):
         raise HTTPException(status_code=404, detail="PDF file not found on disk")
 
-    # 更新最后访问时间
-    pdf.last_accessed = datetime.utcnow()
-    db.commit()
+    access_tracker.touch(pdf.id)
 
-    return FileResponse(
-        path=pdf.file_path,
-        media_type="application/pdf",
-        filename=pdf.original_filename,
-        headers={
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, OPTIONS",
-            "Access-Control-Allow-Headers": "*",
-        }
+    # 旧记录没有存储哈希时按文件计算（按mtime/size记忆）
+    content_hash = pdf.content_hash or await asyncio.to_thread(pdf_cache.content_hash, pdf.file_path)
+    return serve_file(request, pdf.file_path, content_hash, pdf.original_filename, immutable=v == content_hash)
+
+async def _page_image(
+    request: Request, pdf_id: int, page: int, dpi: int, fmt: str, version: Optional[str]
+) -> Response:
+    if not page_renderer.available:
+        raise HTTPException(status_code=503, detail="Page rendering is not available (pdf2image/poppler missing)")
+    try:
+        path, key, content_hash = await page_renderer.render(pdf_id, page, dpi, fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error rendering page: {str(e)}")
+    etag = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+    return serve_file(
+        request, path, etag, f"page-{page}.{fmt}", MEDIA_TYPES[fmt],
+        disposition="inline", immutable=version == content_hash
     )
 
+@router.get("/{pdf_id}/pages/{page}/image")
+async def get_page_image(
+    request: Request,
+    pdf_id: int,
+    page: int,
+    dpi: int = Query(settings.RENDER_PAGE_DPI, ge=1),
+    format: str = Query("png", pattern="^(png|jpeg)$"),
+    v: Optional[str] = Query(None, description="文件内容哈希；与当前内容一致时响应可被长期缓存")
+):
+    """
+    获取服务端渲染的页面图片（DPI按 RENDER_DPI_STEP 取整并限制在配置范围内）
+
+    渲染结果按内容哈希缓存在磁盘上；带 ?v=<内容哈希> 时响应可被浏览器长期缓存。
+    """
+    return await _page_image(request, pdf_id, page, dpi, format, v)
+
+@router.get("/{pdf_id}/pages/{page}/thumbnail")
+async def get_page_thumbnail(
+    request: Request,
+    pdf_id: int,
+    page: int,
+    dpi: int = Query(settings.RENDER_THUMBNAIL_DPI, ge=1),
+    v: Optional[str] = Query(None, description="文件内容哈希；与当前内容一致时响应可被长期缓存")
+):
+    """获取页面缩略图（JPEG，上传后在后台预先渲染）"""
+    return await _page_image(request, pdf_id, page, dpi, "jpeg", v)
+
 @router.delete("/{pdf_id}")
 async def delete_pdf(pdf_id: int, db: Session = Depends(get_db)):
     """删除PDF文件"""
@@ -119,53 +344,42 @@ async def delete_pdf(pdf_id: int, db: Session = Depends(get_db)):
     if not pdf:
         raise HTTPException(status_code=404, detail="PDF not found")
 
-    # 删除物理文件
-    pdf_service.delete_pdf(pdf.file_path)
+    # 释放对文件的引用（owner的派生数据转给下一条记录）
+    file_path, content_hash = pdf.file_path, pdf.content_hash
+    blob_store.release(db, pdf)
 
     # 删除数据库记录（级联删除相关数据）
+    search_service.remove_pdf(db, pdf.id)
     db.delete(pdf)
     db.commit()
 
+    # 提交后复查引用数，没有记录再引用该文件时才删除物理文件及向量索引；
+    # 并发删除时 release 可能都看到对方仍在，因此不依赖其返回值
+    blob_store.discard(db, file_path, content_hash)
+
     return {"message": "PDF deleted successfully"}
 
-@router.post("/{pdf_id}/summary", response_model=SummaryResponse)
+@router.post(
+    "/{pdf_id}/summary",
+    response_model=SummaryResponse,
+    responses={202: {"model": JobInfo, "description": "摘要生成任务已排队"}}
+)
 async def generate_summary(pdf_id: int, db: Session = Depends(get_db)):
-    """生成PDF完整摘要"""
+    """获取PDF完整摘要；尚未生成时提交后台任务并返回202"""
     pdf = db.query(PDF).filter(PDF.id == pdf_id).first()
     if not pdf:
         raise HTTPException(status_code=404, detail="PDF not found")
 
-    try:
-        # 检查是否已有摘要
-        if pdf.summary:
-            return SummaryResponse(
-                pdf_id=pdf_id,
-                summary=pdf.summary.summary_text,
-                generated_at=pdf.summary.generated_at
-            )
-
-        # 生成摘要
-        from app.database.models import PDFSummary
-        summary_text = gemini_service.generate_full_summary(pdf.file_path)
-
-        # 保存摘要
-        summary = PDFSummary(
-            pdf_id=pdf_id,
-            summary_text=summary_text
-        )
-        db.add(summary)
-        db.commit()
-        db.refresh(summary)
-
+    # 检查是否已有摘要（内容相同的记录共用owner上的摘要）
+    existing = blob_store.owner_of(db, pdf).summary
+    if existing:
         return SummaryResponse(
             pdf_id=pdf_id,
-            summary=summary_text,
-            generated_at=summary.generated_at
+            summary=existing.summary_text,
+            generated_at=existing.generated_at
         )
 
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to generate summary: {str(e)}")
+    return _accepted(await job_queue.enqueue("summary", pdf_id))
 
 @router.get("/{pdf_id}/summary", response_model=SummaryResponse)
 async def get_summary(pdf_id: int, db: Session = Depends(get_db)):
@@ -174,27 +388,132 @@ async def get_summary(pdf_id: int, db: Session = Depends(get_db)):
     if not pdf:
         raise HTTPException(status_code=404, detail="PDF not found")
 
-    if not pdf.summary:
+    summary = blob_store.owner_of(db, pdf).summary
+    if not summary:
         raise HTTPException(status_code=404, detail="Summary not generated yet")
 
     return SummaryResponse(
         pdf_id=pdf_id,
-        summary=pdf.summary.summary_text,
-        generated_at=pdf.summary.generated_at
+        summary=summary.summary_text,
+        generated_at=summary.generated_at
     )
 
-@router.get("/{pdf_id}/file")
-async def get_pdf_file(pdf_id: int, db: Session = Depends(get_db)):
-    """获取PDF文件"""
+@router.get("/{pdf_id}/summary/sections", response_model=List[RangeSummary])
+async def list_summary_sections(pdf_id: int, db: Session = Depends(get_db)):
+    """获取分层摘要中已生成的页段和章节摘要"""
     pdf = db.query(PDF).filter(PDF.id == pdf_id).first()
     if not pdf:
         raise HTTPException(status_code=404, detail="PDF not found")
 
-    if not os.path.exists(pdf.file_path):
-        raise HTTPException(status_code=404, detail="File not found")
+    return [RangeSummary(**section) for section in summarizer.list_sections(pdf_id)]
+
+@router.post("/{pdf_id}/summary/range", response_model=RangeSummary)
+async def summarize_page_range(
+    pdf_id: int,
+    start: int = Query(..., ge=1),
+    end: int = Query(..., ge=1),
+    db: Session = Depends(get_db)
+):
+    """总结指定页码范围（如一个章节），复用已生成的页段摘要"""
+    pdf = db.query(PDF).filter(PDF.id == pdf_id).first()
+    if not pdf:
+        raise HTTPException(status_code=404, detail="PDF not found")
+    if start > end or start > pdf.page_count:
+        raise HTTPException(status_code=400, detail="Invalid page range")
+
+    try:
+        section = await summarizer.summarize_range(pdf_id, start, end)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to summarize pages: {str(e)}")
+    return RangeSummary(**section)
+
+@router.post(
+    "/{pdf_id}/structure",
+    response_model=StructureResponse,
+    responses={202: {"model": JobInfo, "description": "结构分析任务已排队"}}
+)
+async def analyze_structure(pdf_id: int, db: Session = Depends(get_db)):
+    """获取PDF结构分析；尚未生成时提交后台任务并返回202"""
+    pdf = db.query(PDF).filter(PDF.id == pdf_id).first()
+    if not pdf:
+        raise HTTPException(status_code=404, detail="PDF not found")
+
+    structure = blob_store.owner_of(db, pdf).structure
+    if structure:
+        return StructureResponse(
+            pdf_id=pdf_id,
+            structure=structure.structure,
+            raw_analysis=structure.raw_analysis,
+            generated_at=structure.generated_at
+        )
 
-    return FileResponse(
-        pdf.file_path,
-        media_type='application/pdf',
-        filename=pdf.original_filename
+    return _accepted(await job_queue.enqueue("structure", pdf_id))
+
+@router.get("/{pdf_id}/structure", response_model=StructureResponse)
+async def get_structure(pdf_id: int, db: Session = Depends(get_db)):
+    """获取PDF结构分析"""
+    pdf = db.query(PDF).filter(PDF.id == pdf_id).first()
+    if not pdf:
+        raise HTTPException(status_code=404, detail="PDF not found")
+
+    structure = blob_store.owner_of(db, pdf).structure
+    if not structure:
+        raise HTTPException(status_code=404, detail="Structure not analyzed yet")
+
+    return StructureResponse(
+        pdf_id=pdf_id,
+        structure=structure.structure,
+        raw_analysis=structure.raw_analysis,
+        generated_at=structure.generated_at
+    )
+
+@router.get("/{pdf_id}/jobs", response_model=List[JobInfo])
+async def list_pdf_jobs(
+    pdf_id: int,
+    kind: Optional[str] = Query(None, pattern="^(summary|structure|thumbnails|ocr)$"),
+    db: Session = Depends(get_db)
+):
+    """获取PDF的后台任务（摘要、结构分析、缩略图、OCR）及进度"""
+    pdf = db.query(PDF).filter(PDF.id == pdf_id).first()
+    if not pdf:
+        raise HTTPException(status_code=404, detail="PDF not found")
+
+    return [JobInfo(**job) for job in job_queue.list_jobs(db, pdf_id, kind)]
+
+@router.get("/{pdf_id}/text", response_model=PDFTextResponse)
+async def get_pdf_text(
+    pdf_id: int,
+    start: int = Query(1, ge=1),
+    end: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db)
+):
+    """获取逐页提取的文本及提取状态"""
+    pdf = db.query(PDF).filter(PDF.id == pdf_id).first()
+    if not pdf:
+        raise HTTPException(status_code=404, detail="PDF not found")
+
+    owner = blob_store.owner_of(db, pdf)
+    extraction = owner.text_extraction
+    if not extraction:
+        # 旧数据没有提取记录时补排任务
+        text_index.schedule(owner.id)
+        return PDFTextResponse(pdf_id=pdf_id, status="pending", page_count=pdf.page_count)
+
+    pages = text_index.get_pages(owner.id, start, end) if extraction.status == "completed" else []
+    return PDFTextResponse(
+        pdf_id=pdf_id,
+        status=extraction.status,
+        page_count=extraction.page_count,
+        pages_done=extraction.pages_done or 0,
+        duration_ms=extraction.duration_ms,
+        error=extraction.error,
+        pages=[
+            PageText(
+                page_number=page.page_number,
+                text=page.text,
+                char_count=page.char_count,
+                source=page.source
+            )
+            for page in pages
+        ]
     )
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+from app.database.models import get_db
+from app.services.blob_service import blob_store
+from app.services.search_service import search_service
+from app.models.schemas import SearchResponse, SearchHit
+
+router = APIRouter()
+
+@router.get("", response_model=SearchResponse)
+async def search(
+    q: str = Query(..., min_length=1),
+    pdf_id: Optional[int] = None,
+    kind: Optional[str] = Query(None, pattern="^(page|annotation|message)$"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    """全文检索PDF页文本、注释和聊天消息（内容相同的PDF的页命中只返回一次）"""
+    page_pdf_id = blob_store.owner_id(pdf_id, db) if pdf_id is not None else None
+    result = search_service.search(
+        db, q, pdf_id=pdf_id, kind=kind, limit=limit, offset=offset, page_pdf_id=page_pdf_id
+    )
+    return SearchResponse(
+        query=q,
+        results=[SearchHit(**hit) for hit in result["results"]],
+        limit=limit,
+        offset=offset,
+        has_more=result["has_more"]
+    )
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy import bindparam, update
+from app.config import settings
+from app.database.models import PDF, SessionLocal
+
+
+class AccessTracker:
+    """PDF最后访问时间的批量延迟写入 - 读请求只记录到内存，定期合并为一次批量UPDATE
+
+    语义：数据库中的 last_accessed 最多滞后 ACCESS_FLUSH_INTERVAL 秒，同一PDF在一个周期内的
+    多次访问只写入最后一次；正常关闭时会写入剩余记录，进程崩溃时最多丢失一个周期的访问时间。
+    单个PDF的接口返回内存中的最新值，列表排序使用数据库中的值。
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def touch(self, pdf_id: int) -> datetime:
+        """记录一次访问，返回访问时间"""
+        now = datetime.utcnow()
+        with self._lock:
+            self._pending[pdf_id] = now
+        return now
+
+    def flush(self) -> int:
+        """把累积的访问时间一次性写入数据库，返回写入的记录数"""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+
+        db = SessionLocal()
+        try:
+            db.connection().execute(
+                update(PDF.__table__)
+                .where(PDF.__table__.c.id == bindparam("pdf_id"))
+                .values(last_accessed=bindparam("accessed_at")),
+                [{"pdf_id": pdf_id, "accessed_at": accessed_at} for pdf_id, accessed_at in batch.items()]
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            # 写入失败时放回，下个周期重试（保留更新的访问时间）
+            with self._lock:
+                for pdf_id, accessed_at in batch.items():
+                    if self._pending.get(pdf_id, accessed_at) <= accessed_at:
+                        self._pending[pdf_id] = accessed_at
+            raise
+        finally:
+            db.close()
+
+        with self._lock:
+            self.flushes += 1
+            self.rows_written += len(batch)
+        return len(batch)
+
+    async def start(self):
+        """启动定期写入（在应用启动时调用）"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="access-flush")
+
+    async def stop(self):
+        """停止定期写入并写入剩余记录"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.ACCESS_FLUSH_INTERVAL)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                print(f"写入访问时间失败: {str(e)}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "flushes": self.flushes,
+                "rows_written": self.rows_written,
+                "flush_interval": settings.ACCESS_FLUSH_INTERVAL
+            }
+
+
+access_tracker = AccessTracker()
@@ -0,0 +1,140 @@
+import asyncio
+from typing import Callable, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from app.database.models import PDF, PDFStructure, PDFSummary, SessionLocal
+from app.services.gemini_service import GeminiService
+from app.services.blob_service import blob_store
+from app.services.pdf_cache import pdf_cache
+from app.services.single_flight import single_flight
+from app.services.summarization_service import summarizer
+
+Report = Callable[[int, Optional[str]], None]
+
+
+class DocumentAnalysisService:
+    """整篇摘要与结构分析 - 作为后台任务执行，结果写入数据库供后续请求直接读取"""
+
+    def __init__(self):
+        self.gemini_service = GeminiService()
+
+    async def summarize(self, pdf_id: int, report: Report) -> Optional[dict]:
+        """
+        生成并保存PDF的整篇摘要（summary任务处理函数）
+
+        Args:
+            pdf_id: PDF记录ID
+            report: 进度回调
+
+        Returns:
+            任务结果
+        """
+        owner_id, pdf_path, page_count, summary_id = await asyncio.to_thread(self._summary_state, pdf_id)
+        if summary_id is not None:
+            return {"summary_id": summary_id, "reused": True}
+        if pdf_path is None:
+            return None
+
+        # 大文档分层摘要，小文档一次调用
+        hierarchical = summarizer.should_split(page_count)
+
+        async def produce() -> str:
+            if hierarchical:
+                return await summarizer.summarize_document(owner_id, report)
+            report(10, "正在生成摘要")
+            return await self.gemini_service.generate_full_summary(pdf_path)
+
+        # 内容相同的PDF（去重上传）同时排队时只调用一次模型
+        pdf_hash = await asyncio.to_thread(pdf_cache.content_hash, pdf_path)
+        summary_text = await single_flight.do(f"summary:{pdf_hash}", produce)
+
+        report(95, "正在保存")
+        summary_id = await asyncio.to_thread(self._store_summary, owner_id, summary_text)
+        return {"summary_id": summary_id, "hierarchical": hierarchical}
+
+    async def analyze_structure(self, pdf_id: int, report: Report) -> Optional[dict]:
+        """
+        分析并保存PDF的章节结构（structure任务处理函数）
+
+        Args:
+            pdf_id: PDF记录ID
+            report: 进度回调
+
+        Returns:
+            任务结果
+        """
+        owner_id, pdf_path, structure_id = await asyncio.to_thread(self._structure_state, pdf_id)
+        if structure_id is not None:
+            return {"structure_id": structure_id, "reused": True}
+        if pdf_path is None:
+            return None
+
+        report(10, "正在分析文档结构")
+        pdf_hash = await asyncio.to_thread(pdf_cache.content_hash, pdf_path)
+        analysis = await single_flight.do(
+            f"structure:{pdf_hash}",
+            lambda: self.gemini_service.analyze_pdf_structure(pdf_path)
+        )
+
+        report(95, "正在保存")
+        structure_id = await asyncio.to_thread(self._store_structure, owner_id, analysis)
+        return {"structure_id": structure_id, "parsed": analysis["structure"] is not None}
+
+    def _summary_state(self, pdf_id: int) -> Tuple[Optional[int], Optional[str], int, Optional[int]]:
+        """返回 (摘要所在的owner记录ID, PDF路径, 页数, 已有摘要ID)；PDF已删除时路径为None"""
+        db = SessionLocal()
+        try:
+            pdf = db.query(PDF).filter(PDF.id == pdf_id).first()
+            if not pdf:
+                return None, None, 0, None
+            owner = blob_store.owner_of(db, pdf)
+            return owner.id, pdf.file_path, pdf.page_count, owner.summary.id if owner.summary else None
+        finally:
+            db.close()
+
+    def _structure_state(self, pdf_id: int) -> Tuple[Optional[int], Optional[str], Optional[int]]:
+        """返回 (结构分析所在的owner记录ID, PDF路径, 已有结构分析ID)；PDF已删除时均为None"""
+        db = SessionLocal()
+        try:
+            pdf = db.query(PDF).filter(PDF.id == pdf_id).first()
+            if not pdf:
+                return None, None, None
+            owner = blob_store.owner_of(db, pdf)
+            return owner.id, pdf.file_path, owner.structure.id if owner.structure else None
+        finally:
+            db.close()
+
+    def _store_summary(self, pdf_id: int, summary_text: str) -> Optional[int]:
+        db = SessionLocal()
+        try:
+            summary = PDFSummary(pdf_id=pdf_id, summary_text=summary_text)
+            db.add(summary)
+            db.commit()
+            return summary.id
+        except IntegrityError:
+            # 其他请求已先写入摘要
+            db.rollback()
+            existing = db.query(PDFSummary).filter(PDFSummary.pdf_id == pdf_id).first()
+            return existing.id if existing else None
+        finally:
+            db.close()
+
+    def _store_structure(self, pdf_id: int, analysis: dict) -> Optional[int]:
+        db = SessionLocal()
+        try:
+            structure = PDFStructure(
+                pdf_id=pdf_id,
+                structure=analysis["structure"],
+                raw_analysis=analysis["raw_analysis"]
+            )
+            db.add(structure)
+            db.commit()
+            return structure.id
+        except IntegrityError:
+            db.rollback()
+            existing = db.query(PDFStructure).filter(PDFStructure.pdf_id == pdf_id).first()
+            return existing.id if existing else None
+        finally:
+            db.close()
+
+
+document_analysis = DocumentAnalysisService()
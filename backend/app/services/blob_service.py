@@ -0,0 +1,226 @@
+import os
+import threading
+from typing import Dict, Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.database.models import PDF, PDFPageText, PDFRangeSummary, PDFStructure, PDFSummary, PDFTextExtraction, SessionLocal
+from app.services.pdf_cache import pdf_cache
+from app.services.pdf_service import PDFService
+from app.services.search_service import search_service
+from app.services.embedding_service import embedding_index
+
+
+class BlobStore:
+    """按内容哈希去重的PDF文件存储 - 相同内容的PDF记录共用一个文件及其派生数据
+
+    引用计数即引用同一file_path的PDF记录数，由数据库实时统计，不会与实际引用不一致。
+    派生数据（页文本、提取状态、摘要、结构分析、全文索引中的页）只保存一份，归属于引用同一文件的
+    ID最小的记录（owner），其他记录读取时解析到owner；owner被删除时转给下一条记录。
+    删除记录只在事务提交后才删除物理文件，并与按内容哈希复用文件的上传互斥。
+    """
+
+    def __init__(self):
+        self.pdf_service = PDFService()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def lock(self, content_hash: Optional[str]) -> threading.Lock:
+        """
+        同一内容哈希的去重查找与文件删除共用的锁
+
+        上传从查找已有文件到提交新记录、删除从复查引用数到删除文件都须持有该锁，
+        否则上传可能引用一个随后被删除的文件。
+
+        Args:
+            content_hash: 内容哈希（旧记录可能为空）
+
+        Returns:
+            该哈希对应的锁
+        """
+        with self._locks_guard:
+            return self._locks.setdefault(content_hash or "", threading.Lock())
+
+    def find(self, db: Session, content_hash: str) -> Optional[PDF]:
+        """查找内容相同且文件仍存在的PDF记录"""
+        candidates = db.query(PDF).filter(PDF.content_hash == content_hash).order_by(PDF.id).all()
+        for pdf in candidates:
+            if os.path.exists(pdf.file_path):
+                return pdf
+        return None
+
+    def ref_count(self, db: Session, file_path: str) -> int:
+        """引用该文件的PDF记录数"""
+        return db.query(PDF).filter(PDF.file_path == file_path).count()
+
+    @staticmethod
+    def owner_ids():
+        """每个文件的owner记录ID（子查询）"""
+        return select(func.min(PDF.id)).group_by(PDF.file_path)
+
+    def owner_of(self, db: Session, pdf: PDF) -> PDF:
+        """
+        派生数据所在的PDF记录
+
+        Args:
+            db: 数据库会话
+            pdf: PDF记录
+
+        Returns:
+            引用同一文件的ID最小的记录（pdf本身即owner时返回pdf）
+        """
+        owner_id = db.query(func.min(PDF.id)).filter(PDF.file_path == pdf.file_path).scalar()
+        if owner_id is None or owner_id == pdf.id:
+            return pdf
+        return db.query(PDF).filter(PDF.id == owner_id).first()
+
+    def owner_id(self, pdf_id: int, db: Optional[Session] = None) -> Optional[int]:
+        """
+        派生数据所在记录的ID（后台任务中按ID解析）
+
+        Args:
+            pdf_id: PDF记录ID
+            db: 数据库会话（可选，不传时使用独立会话）
+
+        Returns:
+            owner记录ID；PDF不存在时返回None
+        """
+        session = db or SessionLocal()
+        try:
+            file_path = session.query(PDF.file_path).filter(PDF.id == pdf_id).scalar()
+            if file_path is None:
+                return None
+            return session.query(func.min(PDF.id)).filter(PDF.file_path == file_path).scalar()
+        finally:
+            if db is None:
+                session.close()
+
+    def release(self, db: Session, pdf: PDF) -> bool:
+        """
+        释放一条PDF记录对文件的引用，只判断文件是否应删除，不删除文件
+
+        被删除的记录是owner且仍有其他引用时，派生数据转给下一条记录（调用方负责提交）。
+        调用方提交删除后调用 discard，由其复查引用数后删除文件。
+
+        Args:
+            db: 数据库会话
+            pdf: 即将删除的PDF记录
+
+        Returns:
+            是否为最后一个引用（文件应删除）
+        """
+        successor = db.query(func.min(PDF.id)).filter(
+            PDF.file_path == pdf.file_path,
+            PDF.id != pdf.id
+        ).scalar()
+        if successor is None:
+            return True
+        if pdf.id < successor:
+            self._adopt(db, pdf.id, successor)
+            # 重新加载关系属性，删除记录时不会级联删除已转移的数据
+            db.expire(pdf)
+        return False
+
+    def discard(self, db: Session, file_path: str, content_hash: Optional[str]) -> bool:
+        """
+        删除记录提交后，文件已无引用时删除文件及按文件/内容存储的索引和分层摘要
+
+        持有内容哈希锁并重新统计引用数：并发删除共用同一文件的记录时，各自的 release
+        都可能看到对方仍在，最后提交的一方在此处删除文件。
+
+        Args:
+            db: 数据库会话（删除记录已提交）
+            file_path: 文件路径
+            content_hash: 内容哈希
+
+        Returns:
+            文件是否被删除
+        """
+        with self.lock(content_hash):
+            db.expire_all()
+            if self.ref_count(db, file_path):
+                return False
+            self.pdf_service.delete_pdf(file_path)
+            embedding_index.remove(file_path)
+            if content_hash and not db.query(PDF.id).filter(PDF.content_hash == content_hash).first():
+                db.query(PDFRangeSummary).filter(
+                    PDFRangeSummary.content_hash == content_hash
+                ).delete(synchronize_session=False)
+                db.commit()
+            return True
+
+    def _adopt(self, db: Session, source_id: int, target_id: int):
+        """
+        把source记录的派生数据转给target；target已有的同类数据优先保留，source的副本被删除
+
+        页文本与提取状态作为整体处理：只有source已完成提取而target未完成时才转移。
+        """
+        for model in (PDFSummary, PDFStructure):
+            if db.query(model.id).filter(model.pdf_id == target_id).first():
+                db.query(model).filter(model.pdf_id == source_id).delete(synchronize_session=False)
+            else:
+                db.query(model).filter(model.pdf_id == source_id).update(
+                    {"pdf_id": target_id}, synchronize_session=False
+                )
+
+        source_status = db.query(PDFTextExtraction.status).filter(PDFTextExtraction.pdf_id == source_id).scalar()
+        target_status = db.query(PDFTextExtraction.status).filter(PDFTextExtraction.pdf_id == target_id).scalar()
+        moved = source_status == "completed" and target_status != "completed"
+        keep, drop = (source_id, target_id) if moved else (target_id, source_id)
+        for model in (PDFPageText, PDFTextExtraction):
+            db.query(model).filter(model.pdf_id == drop).delete(synchronize_session=False)
+        if moved:
+            for model in (PDFPageText, PDFTextExtraction):
+                db.query(model).filter(model.pdf_id == keep).update(
+                    {"pdf_id": target_id}, synchronize_session=False
+                )
+
+        # 页的全文索引按PDF ID分区，按转移后的页文本重建两条记录的分区
+        search_service.index_pages(db, source_id)
+        search_service.index_pages(db, target_id)
+
+    def collapse_duplicates(self) -> int:
+        """
+        合并升级前按记录复制的派生数据：内容相同的记录只在owner上保留一份（启动时调用）
+
+        Returns:
+            合并的记录数
+        """
+        db = SessionLocal()
+        try:
+            shared_paths = [
+                file_path for (file_path,) in db.query(PDF.file_path)
+                .group_by(PDF.file_path).having(func.count(PDF.id) > 1)
+            ]
+            merged = 0
+            for file_path in shared_paths:
+                ids = [pdf_id for (pdf_id,) in db.query(PDF.id).filter(PDF.file_path == file_path).order_by(PDF.id)]
+                for duplicate_id in ids[1:]:
+                    has_artifacts = any(
+                        db.query(model.id).filter(model.pdf_id == duplicate_id).first()
+                        for model in (PDFTextExtraction, PDFPageText, PDFSummary, PDFStructure)
+                    )
+                    if has_artifacts:
+                        self._adopt(db, duplicate_id, ids[0])
+                        merged += 1
+            db.commit()
+            return merged
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def backfill_hashes(self):
+        """为升级前上传、尚无内容哈希的PDF记录补算哈希"""
+        db = SessionLocal()
+        try:
+            pdfs = db.query(PDF).filter(PDF.content_hash.is_(None)).all()
+            for pdf in pdfs:
+                if os.path.exists(pdf.file_path):
+                    pdf.content_hash = pdf_cache.content_hash(pdf.file_path)
+            db.commit()
+        finally:
+            db.close()
+
+
+blob_store = BlobStore()
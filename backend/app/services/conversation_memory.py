@@ -0,0 +1,92 @@
+import asyncio
+from typing import List, Optional, Set, Tuple
+from app.config import settings
+from app.database.models import Conversation, Message, SessionLocal
+from app.services.gemini_service import GeminiService
+
+
+class ConversationMemory:
+    """滚动对话摘要 - 把最近窗口之外的旧消息折叠进 Conversation.summary，对话上下文大小保持恒定
+
+    折叠在消息保存后于后台执行，不增加发送消息的延迟；同一对话同时只有一个折叠任务，
+    折叠期间保存的新消息在该任务结束后重新检查。
+    """
+
+    def __init__(self):
+        self.gemini_service = GeminiService()
+        self._folding: Set[int] = set()
+        self._recheck: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.CHAT_ROLLING_SUMMARY
+
+    def schedule(self, conversation_id: int):
+        """消息保存后调用：窗口外积累的消息足够多时在后台折叠"""
+        if not self.enabled:
+            return
+        if conversation_id in self._folding:
+            self._recheck.add(conversation_id)
+            return
+        self._folding.add(conversation_id)
+        task = asyncio.get_running_loop().create_task(self._fold(conversation_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fold(self, conversation_id: int):
+        try:
+            pending = await asyncio.to_thread(self._pending_messages, conversation_id)
+            if not pending:
+                return
+            pdf_path, summary, messages = pending
+            new_summary = await self.gemini_service.fold_conversation(summary, messages, pdf_path=pdf_path)
+            await asyncio.to_thread(self._store, conversation_id, new_summary, messages[-1]["id"])
+        except Exception as e:
+            print(f"对话摘要折叠失败 (conversation {conversation_id}): {str(e)}")
+        finally:
+            self._folding.discard(conversation_id)
+            if conversation_id in self._recheck:
+                self._recheck.discard(conversation_id)
+                self.schedule(conversation_id)
+
+    def _pending_messages(self, conversation_id: int) -> Optional[Tuple[str, Optional[str], List[dict]]]:
+        """返回 (对话所属PDF路径, 已有摘要, 待折叠消息)；窗口外的未折叠消息不足一批时返回None"""
+        db = SessionLocal()
+        try:
+            conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+            if not conversation:
+                return None
+
+            query = db.query(Message).filter(Message.conversation_id == conversation_id)
+            if conversation.summarized_until_id:
+                query = query.filter(Message.id > conversation.summarized_until_id)
+            overflow = query.count() - settings.CHAT_HISTORY_MESSAGES
+            if overflow < settings.CHAT_SUMMARY_BATCH:
+                return None
+
+            rows = query.order_by(Message.id.asc()).limit(
+                min(overflow, settings.CHAT_SUMMARY_MAX_FOLD)
+            ).all()
+            return conversation.pdf.file_path, conversation.summary, [
+                {"id": row.id, "role": row.role, "content": row.content}
+                for row in rows
+            ]
+        finally:
+            db.close()
+
+    def _store(self, conversation_id: int, summary: str, until_id: int):
+        db = SessionLocal()
+        try:
+            db.query(Conversation).filter(Conversation.id == conversation_id).update({
+                Conversation.summary: summary,
+                Conversation.summarized_until_id: until_id,
+                # 折叠不算对话活动，保持原更新时间
+                Conversation.updated_at: Conversation.updated_at
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+conversation_memory = ConversationMemory()
@@ -0,0 +1,224 @@
+import asyncio
+import functools
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from app.config import settings
+from app.services import pdf_workers
+
+
+class PoolBusyError(RuntimeError):
+    """等待执行的任务数已达上限"""
+
+
+class TaskTimeoutError(TimeoutError):
+    """任务超时，执行它的子进程已被终止"""
+
+
+class _Worker:
+    """一个子进程及其管道"""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=pdf_workers.worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class CPUPool:
+    """PDF CPU密集任务的共享进程池 - 元数据、文本提取、页面切片、渲染和OCR都在子进程中执行，不占用事件循环和GIL
+
+    每个子进程独占一条管道，任务超时时只终止执行它的子进程并在下次使用时重建，
+    不影响其他任务；等待中和执行中的任务总数超过 CPU_POOL_WORKERS + CPU_POOL_MAX_QUEUE
+    时直接拒绝（PoolBusyError）。按任务类型统计排队等待时间和执行时间。
+    """
+
+    def __init__(self):
+        self._context = multiprocessing.get_context("spawn")  # 子进程不继承父进程的线程和数据库连接
+        self._slots: Optional[queue.Queue] = None
+        self._waiters: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.RLock()
+        self._pending = 0
+        self._stats: Dict[str, dict] = {}
+        self.restarts = 0
+
+    def run_sync(self, fn, *args, kind: str = "default", timeout: Optional[float] = None):
+        """
+        在子进程中执行 pdf_workers 中的函数并等待结果（在线程中调用）
+
+        Args:
+            fn: 模块级函数（需可pickle）
+            *args: 参数
+            kind: 任务类型（用于统计）
+            timeout: 执行超时秒数，默认 CPU_POOL_TIMEOUT
+
+        Returns:
+            函数返回值
+
+        Raises:
+            PoolBusyError: 排队任务已满
+            TaskTimeoutError: 执行超时
+        """
+        self._admit(kind)
+        return self._execute(fn, args, kind, timeout, time.perf_counter())
+
+    async def run(self, fn, *args, kind: str = "default", timeout: Optional[float] = None):
+        """run_sync 的异步版本（等待在专用线程中进行，不占用默认线程池）
+
+        在提交到等待线程之前计数和拒绝，排队时间从此刻开始计算。
+        """
+        self._ensure_started()
+        self._admit(kind)
+        queued_at = time.perf_counter()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._waiters,
+                functools.partial(self._execute, fn, args, kind, timeout, queued_at)
+            )
+        except BaseException:
+            self._release()
+            raise
+        return await future
+
+    def _admit(self, kind: str):
+        """登记一个等待执行的任务；等待中和执行中的任务已达上限时拒绝"""
+        with self._lock:
+            if self._pending >= settings.CPU_POOL_WORKERS + settings.CPU_POOL_MAX_QUEUE:
+                self._record(kind, "rejected")
+                raise PoolBusyError("PDF processing queue is full")
+            self._pending += 1
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def _execute(self, fn, args: tuple, kind: str, timeout: Optional[float], queued_at: float):
+        """取得空闲子进程并执行已登记的任务，结束后释放名额"""
+        worker = None
+        slots = None
+        try:
+            slots = self._ensure_started()
+            worker = slots.get()
+            if worker is None or not worker.alive():
+                worker = _Worker(self._context)
+            started_at = time.perf_counter()
+            wait_ms = (started_at - queued_at) * 1000
+            timeout = timeout or settings.CPU_POOL_TIMEOUT
+
+            try:
+                worker.conn.send((fn, args))
+                finished = worker.conn.poll(timeout)
+                if finished:
+                    ok, value = worker.conn.recv()
+            except (EOFError, OSError):
+                # 子进程崩溃（段错误、内存耗尽等）
+                worker.kill()
+                worker = None
+                with self._lock:
+                    self.restarts += 1
+                self._record(kind, "errors", wait_ms, (time.perf_counter() - started_at) * 1000)
+                raise RuntimeError(f"PDF worker process died while running {kind} task")
+
+            exec_ms = (time.perf_counter() - started_at) * 1000
+            if not finished:
+                worker.kill()
+                worker = None
+                with self._lock:
+                    self.restarts += 1
+                self._record(kind, "timeouts", wait_ms, exec_ms)
+                raise TaskTimeoutError(f"{kind} task exceeded {timeout}s")
+
+            self._record(kind, "completed" if ok else "errors", wait_ms, exec_ms)
+            if not ok:
+                raise value
+            return value
+        finally:
+            # 被终止的子进程以None占位，下次取用时重建
+            if slots is not None:
+                slots.put(worker)
+            self._release()
+
+    def shutdown(self):
+        """停止所有空闲子进程（在应用关闭时调用）"""
+        with self._lock:
+            slots, self._slots = self._slots, None
+            waiters, self._waiters = self._waiters, None
+        if slots is None:
+            return
+        while True:
+            try:
+                worker = slots.get_nowait()
+            except queue.Empty:
+                break
+            if worker is not None:
+                worker.stop()
+        waiters.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            kinds = {}
+            for kind, entry in self._stats.items():
+                timed = entry["completed"] + entry["errors"] + entry["timeouts"]
+                kinds[kind] = {
+                    **{key: entry[key] for key in ("completed", "errors", "timeouts", "rejected")},
+                    "avg_wait_ms": round(entry["wait_ms"] / timed, 1) if timed else 0.0,
+                    "max_wait_ms": round(entry["max_wait_ms"], 1),
+                    "avg_exec_ms": round(entry["exec_ms"] / timed, 1) if timed else 0.0,
+                    "max_exec_ms": round(entry["max_exec_ms"], 1)
+                }
+            return {
+                "workers": settings.CPU_POOL_WORKERS,
+                "max_queue": settings.CPU_POOL_MAX_QUEUE,
+                "pending": self._pending,
+                "restarts": self.restarts,
+                "kinds": kinds
+            }
+
+    def _ensure_started(self) -> queue.Queue:
+        with self._lock:
+            if self._slots is None:
+                # 子进程在首次使用时按需启动
+                self._slots = queue.Queue()
+                for _ in range(settings.CPU_POOL_WORKERS):
+                    self._slots.put(None)
+                self._waiters = ThreadPoolExecutor(
+                    max_workers=settings.CPU_POOL_WORKERS + settings.CPU_POOL_MAX_QUEUE,
+                    thread_name_prefix="cpu-pool-wait"
+                )
+            return self._slots
+
+    def _record(self, kind: str, outcome: str, wait_ms: float = 0.0, exec_ms: float = 0.0):
+        with self._lock:
+            entry = self._stats.setdefault(kind, {
+                "completed": 0, "errors": 0, "timeouts": 0, "rejected": 0,
+                "wait_ms": 0.0, "max_wait_ms": 0.0, "exec_ms": 0.0, "max_exec_ms": 0.0
+            })
+            entry[outcome] += 1
+            entry["wait_ms"] += wait_ms
+            entry["max_wait_ms"] = max(entry["max_wait_ms"], wait_ms)
+            entry["exec_ms"] += exec_ms
+            entry["max_exec_ms"] = max(entry["max_exec_ms"], exec_ms)
+
+
+cpu_pool = CPUPool()
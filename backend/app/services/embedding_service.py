@@ -0,0 +1,287 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import numpy as np
+from typing import List, Optional
+from app.config import settings
+from app.database.models import PDF, PDFPageText, PDFTextExtraction, SessionLocal
+
+try:
+    # 可选依赖：本地CPU嵌入模型；未安装时使用哈希TF-IDF
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+# 查询时每次转换为float32参与计算的行数，避免把整个内存映射矩阵复制一份
+_SCORE_BLOCK_ROWS = 4096
+
+_TOKEN_PATTERN = re.compile(r"[a-zA-Z0-9]+|[一-鿿]")
+
+
+def _tokenize(text: str) -> List[str]:
+    """英文按单词、中文按字的二元组切分"""
+    tokens = []
+    pending_cjk = []
+    for match in _TOKEN_PATTERN.findall(text.lower()):
+        if len(match) == 1 and "一" <= match <= "鿿":
+            pending_cjk.append(match)
+            continue
+        tokens.extend(_cjk_bigrams(pending_cjk))
+        pending_cjk = []
+        tokens.append(match)
+    tokens.extend(_cjk_bigrams(pending_cjk))
+    return tokens
+
+
+def _cjk_bigrams(chars: List[str]) -> List[str]:
+    if len(chars) == 1:
+        return chars
+    return [chars[i] + chars[i + 1] for i in range(len(chars) - 1)]
+
+
+def _hash_token(token: str, dim: int) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little") % dim
+
+
+class EmbeddingIndex:
+    """每个PDF一个向量矩阵（.npy，内存映射读取），用于检索增强对话"""
+
+    def __init__(self):
+        self.base_dir = settings.EMBEDDING_DIR
+        self.dim = settings.EMBEDDING_DIM
+        self._model = None
+        self._loaded = {}
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        os.makedirs(self.base_dir, exist_ok=True)
+
+    @property
+    def backend(self) -> str:
+        if settings.EMBEDDING_MODEL and SentenceTransformer is not None:
+            return "model"
+        return "tfidf"
+
+    @staticmethod
+    def _index_key(pdf_path: str) -> str:
+        # 以存储文件名为键，引用同一文件的PDF记录共用一份索引
+        return os.path.splitext(os.path.basename(pdf_path))[0]
+
+    def _index_dir(self, pdf_path: str) -> str:
+        return os.path.join(self.base_dir, self._index_key(pdf_path))
+
+    def _get_model(self):
+        if self._model is None:
+            self._model = SentenceTransformer(settings.EMBEDDING_MODEL, device="cpu")
+        return self._model
+
+    @staticmethod
+    def _chunk_pages(pages: List[tuple]) -> List[dict]:
+        """按字符数把页文本切成有重叠的片段，片段不跨页"""
+        size = settings.EMBEDDING_CHUNK_CHARS
+        overlap = settings.EMBEDDING_CHUNK_OVERLAP
+        chunks = []
+        for page_number, page_text in pages:
+            page_text = (page_text or "").strip()
+            start = 0
+            while start < len(page_text):
+                chunk = page_text[start:start + size]
+                if chunk.strip():
+                    chunks.append({"page_number": page_number, "text": chunk})
+                if start + size >= len(page_text):
+                    break
+                start += size - overlap
+        return chunks
+
+    def _term_counts(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, chunk_text in enumerate(texts):
+            for token in _tokenize(chunk_text):
+                matrix[row, _hash_token(token, self.dim)] += 1.0
+        return matrix
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _embed_tfidf(self, texts: List[str], idf: np.ndarray, counts: Optional[np.ndarray] = None) -> np.ndarray:
+        if counts is None:
+            counts = self._term_counts(texts)
+        # 次线性TF
+        return self._normalize(np.log1p(counts) * idf)
+
+    def build(self, pdf_id: int):
+        """
+        为PDF建立向量索引（读取已存储的页文本）
+
+        Args:
+            pdf_id: PDF记录ID
+        """
+        db = SessionLocal()
+        try:
+            pdf = db.query(PDF).filter(PDF.id == pdf_id).first()
+            if not pdf:
+                return
+            pdf_path = pdf.file_path
+            pages = db.query(PDFPageText.page_number, PDFPageText.text).filter(
+                PDFPageText.pdf_id == pdf_id
+            ).order_by(PDFPageText.page_number).all()
+        finally:
+            db.close()
+
+        with self._build_lock:
+            self._write_index(pdf_path, pages)
+
+    def _write_index(self, pdf_path: str, pages: List[tuple]):
+        """切分页文本、计算向量并原子替换索引目录（调用方持有 _build_lock）"""
+        chunks = self._chunk_pages(pages)
+        if not chunks:
+            return
+
+        texts = [chunk["text"] for chunk in chunks]
+        index_dir = self._index_dir(pdf_path)
+        tmp_dir = index_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        backend = self.backend
+        if backend == "model":
+            vectors = self._get_model().encode(texts, normalize_embeddings=True).astype(np.float32)
+        else:
+            counts = self._term_counts(texts)
+            document_frequency = np.count_nonzero(counts, axis=0)
+            idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+            vectors = self._embed_tfidf(texts, idf, counts)
+            np.save(os.path.join(tmp_dir, "idf.npy"), idf)
+
+        np.save(os.path.join(tmp_dir, "vectors.npy"), vectors.astype(np.float16))
+        with open(os.path.join(tmp_dir, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump({"backend": backend, "dim": int(vectors.shape[1]), "chunks": chunks}, f, ensure_ascii=False)
+
+        # 整个目录替换，查询时不会读到写了一半的索引
+        with self._lock:
+            shutil.rmtree(index_dir, ignore_errors=True)
+            os.replace(tmp_dir, index_dir)
+            self._loaded.pop(self._index_key(pdf_path), None)
+
+    def _load(self, pdf_path: str) -> Optional[dict]:
+        key = self._index_key(pdf_path)
+        with self._lock:
+            if key in self._loaded:
+                return self._loaded[key]
+
+            index_dir = self._index_dir(pdf_path)
+            if not os.path.exists(os.path.join(index_dir, "chunks.json")):
+                return None
+
+            with open(os.path.join(index_dir, "chunks.json"), encoding="utf-8") as f:
+                index = json.load(f)
+            index["vectors"] = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r")
+            idf_path = os.path.join(index_dir, "idf.npy")
+            index["idf"] = np.load(idf_path) if os.path.exists(idf_path) else None
+            self._loaded[key] = index
+            return index
+
+    def _build_missing(self, pdf_path: str) -> Optional[dict]:
+        """
+        索引不存在时按已完成提取的页文本补建（检索模式开启前上传的PDF在首次查询时建立）
+
+        Returns:
+            建好的索引；页文本尚未提取完成或没有文本时返回None
+        """
+        with self._build_lock:
+            # 等锁期间其他线程可能已经建好
+            index = self._load(pdf_path)
+            if index:
+                return index
+
+            db = SessionLocal()
+            try:
+                pdf_id = db.query(PDF.id).join(
+                    PDFTextExtraction, PDFTextExtraction.pdf_id == PDF.id
+                ).filter(
+                    PDF.file_path == pdf_path,
+                    PDFTextExtraction.status == "completed"
+                ).order_by(PDF.id).limit(1).scalar()
+                if pdf_id is None:
+                    return None
+                pages = db.query(PDFPageText.page_number, PDFPageText.text).filter(
+                    PDFPageText.pdf_id == pdf_id
+                ).order_by(PDFPageText.page_number).all()
+            finally:
+                db.close()
+
+            self._write_index(pdf_path, pages)
+            return self._load(pdf_path)
+
+    @staticmethod
+    def _score(vectors: np.ndarray, query_vector: np.ndarray) -> np.ndarray:
+        """按块把float16向量转换为float32计算相似度，内存占用与文档大小无关"""
+        scores = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), _SCORE_BLOCK_ROWS):
+            block = vectors[start:start + _SCORE_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query_vector
+        return scores
+
+    def search(self, pdf_path: str, query: str, top_k: Optional[int] = None) -> List[dict]:
+        """
+        检索与问题最相关的片段
+
+        Args:
+            pdf_path: PDF文件路径
+            query: 查询文本
+            top_k: 返回片段数（默认使用配置）
+
+        Returns:
+            按相关度降序的片段列表 [{"page_number", "text", "score"}]；页文本尚未提取完成时返回空列表
+        """
+        if not query.strip():
+            return []
+        index = self._load(pdf_path) or self._build_missing(pdf_path)
+        if not index:
+            return []
+
+        if index["backend"] == "model":
+            if SentenceTransformer is None:
+                return []
+            query_vector = self._get_model().encode([query], normalize_embeddings=True)[0].astype(np.float32)
+        else:
+            query_vector = self._embed_tfidf([query], index["idf"])[0]
+
+        scores = self._score(index["vectors"], query_vector)
+        k = min(top_k or settings.RETRIEVAL_TOP_K, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [
+            {**index["chunks"][i], "score": float(scores[i])}
+            for i in top
+            if scores[i] > 0
+        ]
+
+    def on_pages_updated(self, pdf_id: int):
+        """页文本更新后的回调：检索模式下立即重建索引，否则删除过期的索引（下次查询时补建）"""
+        if settings.CHAT_CONTEXT_MODE == "retrieval":
+            self.build(pdf_id)
+            return
+
+        db = SessionLocal()
+        try:
+            pdf_path = db.query(PDF.file_path).filter(PDF.id == pdf_id).scalar()
+        finally:
+            db.close()
+        if pdf_path:
+            self.remove(pdf_path)
+
+    def remove(self, pdf_path: str):
+        """删除PDF的向量索引"""
+        with self._lock:
+            shutil.rmtree(self._index_dir(pdf_path), ignore_errors=True)
+            self._loaded.pop(self._index_key(pdf_path), None)
+
+
+embedding_index = EmbeddingIndex()
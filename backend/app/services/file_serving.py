@@ -0,0 +1,153 @@
+import os
+import re
+from typing import Dict, Iterator, Optional
+from urllib.parse import quote
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from app.config import settings
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# 跨域时pdf.js需要读取这些响应头才能使用分段加载
+EXPOSED_HEADERS = ["Accept-Ranges", "Content-Range", "Content-Length", "ETag"]
+
+
+def serve_file(
+    request: Request,
+    path: str,
+    etag_value: str,
+    filename: str,
+    media_type: str = "application/pdf",
+    disposition: str = "attachment",
+    immutable: bool = False
+) -> Response:
+    """
+    返回文件：强ETag、304和单段Range请求（pdf.js分段加载）
+
+    FILE_SERVE_MODE 为 x-accel-redirect / x-sendfile 时只返回头部，由前置代理发送文件内容。
+
+    Args:
+        request: 当前请求（读取 Range / If-None-Match / If-Range）
+        path: 文件路径
+        etag_value: ETag值（文件内容哈希）
+        filename: 下载文件名
+        media_type: 内容类型
+        disposition: Content-Disposition类型（attachment / inline）
+        immutable: URL中带有内容版本时为True，允许长期缓存；否则要求每次用ETag验证
+
+    Returns:
+        200 / 206 / 304 / 416 响应
+    """
+    etag = f'"{etag_value}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.FILE_CACHE_MAX_AGE}, immutable" if immutable else "no-cache",
+        "Accept-Ranges": "bytes",
+    }
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    headers["Content-Disposition"] = _content_disposition(disposition, filename)
+
+    offload = _offload_headers(path)
+    if offload:
+        # 代理自行处理Range和文件发送
+        headers.update(offload)
+        return Response(media_type=media_type, headers=headers)
+
+    file_size = os.path.getsize(path)
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range与当前ETag不一致时按完整文件返回
+    if range_header and (not if_range or if_range.strip() == etag):
+        byte_range = _parse_range(range_header, file_size)
+        if byte_range == "unsatisfiable":
+            headers["Content-Range"] = f"bytes */{file_size}"
+            return Response(status_code=416, headers=headers)
+
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        status_code = 206
+    else:
+        start, end = 0, file_size - 1
+        status_code = 200
+    headers["Content-Length"] = str(end - start + 1)
+
+    return StreamingResponse(
+        _read_file(path, start, end),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers
+    )
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(",")]
+    # 弱比较：W/前缀不影响匹配
+    return "*" in candidates or etag in (value[2:] if value.startswith("W/") else value for value in candidates)
+
+
+def _parse_range(header: str, file_size: int):
+    """
+    解析单段Range头
+
+    Returns:
+        (起始, 结束) 字节位置（包含）；"unsatisfiable" 表示范围超出文件；
+        格式不支持（如多段范围）时返回None，按完整文件响应
+    """
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # 后缀范围：最后N个字节
+        length = int(last)
+        if length == 0:
+            return "unsatisfiable"
+        return max(file_size - length, 0), file_size - 1
+    start = int(first)
+    end = min(int(last), file_size - 1) if last else file_size - 1
+    if start >= file_size or start > end:
+        return "unsatisfiable"
+    return start, end
+
+
+def _read_file(path: str, start: int, end: int) -> Iterator[bytes]:
+    """按块读取文件的指定范围（同步生成器，由线程池执行）"""
+    chunk_size = settings.FILE_SERVE_CHUNK_SIZE
+    remaining = end - start + 1
+    with open(path, "rb") as file:
+        file.seek(start)
+        while remaining > 0:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _content_disposition(disposition: str, filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+
+def _offload_headers(path: str) -> Optional[Dict[str, str]]:
+    """按 FILE_SERVE_MODE 生成交给前置代理发送文件的响应头"""
+    mode = settings.FILE_SERVE_MODE
+    if mode == "x-accel-redirect":
+        # nginx：内部location（internal）映射到上传目录
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(settings.UPLOAD_DIR))
+        return {"X-Accel-Redirect": settings.FILE_ACCEL_PREFIX.rstrip("/") + "/" + quote(relative.replace(os.sep, "/"))}
+    if mode == "x-sendfile":
+        # Apache mod_xsendfile / lighttpd
+        return {"X-Sendfile": os.path.abspath(path)}
+    return None
@@ -1,91 +1,434 @@
-import base64
-import requests
-import os
-from typing import List, Optional
+import asyncio
+import hashlib
+import json
+import time
+import httpx
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 from app.config import settings
+from app.services.pdf_cache import pdf_cache
+from app.services.http_client import gemini_http
+from app.services.provider_file_service import provider_files
+from app.services.pdf_service import PDFService
+from app.services.text_index_service import text_index
+from app.services.embedding_service import embedding_index
+from app.services.response_cache import response_cache
+from app.services.single_flight import single_flight
+from app.services.token_usage import token_usage
 
 class GeminiService:
     """Gemini AI服务 - 处理PDF读取和AI对话"""
 
     def __init__(self):
-        self.api_key = settings.API_KEY
-        self.base_url = settings.BASE_URL
         self.model = settings.GEMINI_MODEL
-        self.headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
+        self.pdf_service = PDFService()
+
+    async def _pdf_to_base64(self, pdf_path: str) -> str:
+        """将PDF文件转换为base64编码（经内容哈希缓存，读盘与编码在线程中执行）"""
+        return await asyncio.to_thread(pdf_cache.get_pdf_base64, pdf_path)
+
+    async def _pdf_content_part(self, pdf_path: str, allow_file: bool = True) -> dict:
+        """
+        构建PDF消息片段：文件模式下引用服务商文件句柄，否则内联base64
+
+        Args:
+            pdf_path: PDF文件路径
+            allow_file: 是否允许使用文件句柄（句柄被拒绝后重试时为False）
+
+        Returns:
+            消息内容片段
+        """
+        if allow_file:
+            file_id = await provider_files.get_file_id(pdf_path)
+            if file_id:
+                return {
+                    "type": "file",
+                    "file": {"file_id": file_id}
+                }
+
+        pdf_base64 = await self._pdf_to_base64(pdf_path)
+        return {
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:application/pdf;base64,{pdf_base64}"
+            }
         }
 
-    def _pdf_to_base64(self, pdf_path: str) -> str:
-        """将PDF文件转换为base64编码"""
-        with open(pdf_path, "rb") as pdf_file:
-            pdf_base64 = base64.b64encode(pdf_file.read()).decode('utf-8')
-        return pdf_base64
+    def _page_slice_base64(self, pdf_path: str, page_num: int, window: int) -> Tuple[str, int, int]:
+        """页面切片的base64编码（与整份PDF共用内容哈希缓存）及其在原文档中的起止页"""
+        digest = pdf_cache.content_hash(pdf_path)
+        start, end = self.pdf_service.page_window(token_usage.page_count(pdf_path), page_num, window)
 
-    def _call_gemini_api(self, messages: List[dict], max_tokens: int = 2000) -> str:
-        """调用Gemini API"""
+        def load() -> bytes:
+            content, _, _ = self.pdf_service.slice_pages(pdf_path, page_num, window)
+            return content
+
+        return pdf_cache.get_or_encode(f"{digest}:p{page_num}w{window}", load), start, end
+
+    async def _document_parts(
+        self,
+        pdf_path: str,
+        page_num: Optional[int] = None,
+        allow_file: bool = True
+    ) -> List[dict]:
+        """
+        构建文档上下文片段：有页码且启用页级上下文时只发送所选页附近的内容
+
+        Args:
+            pdf_path: PDF文件路径
+            page_num: 用户所在页码（可选）
+            allow_file: 是否允许使用文件句柄
+
+        Returns:
+            消息内容片段列表
+        """
+        mode = settings.PDF_CONTEXT_MODE
+        window = settings.PDF_CONTEXT_WINDOW
+
+        if page_num and mode in ("pages", "text"):
+            try:
+                if mode == "text":
+                    # 优先读取上传时建立的页文本索引，未完成时再现场解析
+                    stored = await asyncio.to_thread(text_index.get_text_window, pdf_path, page_num, window)
+                    text, start, end = stored or await asyncio.to_thread(
+                        self.pdf_service.extract_text_window, pdf_path, page_num, window
+                    )
+                    # 扫描版没有文本层时退回页面切片
+                    if len(text.strip()) > 20 * (end - start + 1):
+                        text, _ = token_usage.truncate_text(text, settings.CONTEXT_TOKEN_BUDGET)
+                        return [{
+                            "type": "text",
+                            "text": f"以下是PDF文档第{start}-{end}页的文本内容：\n\n{text}"
+                        }]
+
+                pdf_base64, start, end = await asyncio.to_thread(
+                    self._page_slice_base64, pdf_path, page_num, window
+                )
+                # 切片中的页从1开始重新编号，告知模型与原文档页码的对应关系
+                return [{
+                    "type": "text",
+                    "text": f"附带的PDF是原文档第{start}-{end}页的节选：节选的第1页即原文档第{start}页，"
+                            f"提问中的页码均指原文档页码。"
+                }, {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:application/pdf;base64,{pdf_base64}"
+                    }
+                }]
+            except Exception as e:
+                print(f"页级上下文提取失败，回退整份PDF: {str(e)}")
+
+        return [await self._pdf_content_part(pdf_path, allow_file)]
+
+    @staticmethod
+    def _file_rejected(error: BaseException, messages: List[dict]) -> bool:
+        """
+        服务商是否拒绝了消息中引用的文件句柄（过期/被删除）
+
+        只有4xx响应（429除外）且错误内容提到文件时才算拒绝；超时、限流和5xx等故障
+        与句柄无关，清除句柄并重试只会多一次上传。
+
+        Args:
+            error: 调用API时抛出的异常（沿异常链查找HTTP状态错误）
+            messages: 发送的消息
+
+        Returns:
+            是否应清除句柄并以内联模式重试
+        """
+        file_ids = [
+            part["file"]["file_id"]
+            for message in messages if isinstance(message["content"], list)
+            for part in message["content"] if part.get("type") == "file"
+        ]
+        if not file_ids:
+            return False
+        while error is not None and not isinstance(error, httpx.HTTPStatusError):
+            error = error.__cause__ or error.__context__
+        if error is None:
+            return False
+        status = error.response.status_code
+        if not 400 <= status < 500 or status == 429:
+            return False
+        body = error.response.text.lower()
+        return "file" in body or any(file_id.lower() in body for file_id in file_ids)
+
+    async def _call_gemini_api(
+        self,
+        messages: List[dict],
+        max_tokens: int = 2000,
+        timeout: Optional[float] = None,
+        action: str = "other",
+        pdf_path: str = ""
+    ) -> str:
+        """调用Gemini API（异步，共享连接池），按操作和PDF记录token用量与耗时"""
+        estimated = await asyncio.to_thread(token_usage.estimate_messages, messages, pdf_path)
+        started = time.perf_counter()
+        data = {}
         try:
-            response = requests.post(
-                f"{self.base_url}/v1/chat/completions",
-                json={
+            data = await gemini_http.post_json(
+                "/v1/chat/completions",
+                {
                     "model": self.model,
                     "messages": messages,
                     "max_tokens": max_tokens
                 },
-                headers=self.headers,
-                timeout=60
+                timeout=timeout
             )
 
-            response.raise_for_status()
-            data = response.json()
-
             if 'choices' in data and len(data['choices']) > 0:
                 return data['choices'][0]['message']['content']
             else:
                 raise ValueError("Invalid response format from API")
 
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"API request failed: {str(e)}")
+        except httpx.HTTPError as e:
+            raise Exception(f"API request failed: {str(e)}") from e
+        finally:
+            usage = data.get('usage') or {}
+            token_usage.record(
+                action, pdf_path, self.model, estimated,
+                usage.get('prompt_tokens'), usage.get('completion_tokens'),
+                (time.perf_counter() - started) * 1000,
+                failed=not data.get('choices')
+            )
 
-    def read_pdf_with_context(self, pdf_path: str, prompt: str, max_tokens: int = 2000) -> str:
+    async def _stream_gemini_api(
+        self,
+        messages: List[dict],
+        max_tokens: int = 2000,
+        timeout: Optional[float] = None,
+        action: str = "other",
+        pdf_path: str = ""
+    ) -> AsyncIterator[str]:
+        """流式调用Gemini API，逐段产出模型输出的文本（用量取自最后一个事件，未返回时按输出文本估算）"""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+        if settings.STREAM_INCLUDE_USAGE:
+            payload["stream_options"] = {"include_usage": True}
+
+        estimated = await asyncio.to_thread(token_usage.estimate_messages, messages, pdf_path)
+        started = time.perf_counter()
+        usage = {}
+        output = []
+        failed = False
+        try:
+            async for event in gemini_http.stream_events("/v1/chat/completions", payload, timeout=timeout):
+                usage = event.get('usage') or usage
+                choices = event.get('choices') or []
+                if not choices:
+                    continue
+                content = (choices[0].get('delta') or {}).get('content')
+                if content:
+                    output.append(content)
+                    yield content
+
+        except httpx.HTTPError as e:
+            failed = True
+            raise Exception(f"API request failed: {str(e)}") from e
+        except Exception:
+            failed = True
+            raise
+        finally:
+            completion_tokens = usage.get('completion_tokens')
+            if completion_tokens is None and output:
+                completion_tokens = token_usage.estimate_text("".join(output))
+            token_usage.record(
+                action, pdf_path, self.model, estimated,
+                usage.get('prompt_tokens'), completion_tokens,
+                (time.perf_counter() - started) * 1000,
+                failed=failed
+            )
+
+    async def _complete_messages(
+        self,
+        pdf_path: str,
+        build_messages: Callable[[bool], Awaitable[List[dict]]],
+        max_tokens: int,
+        action: str = "other"
+    ) -> str:
+        """调用API；文件句柄被服务商拒绝时清除句柄并以内联模式重试一次，其他错误直接抛出"""
+        max_tokens = token_usage.output_limit(action, max_tokens)
+        messages = await build_messages(True)
+        try:
+            return await self._call_gemini_api(messages, max_tokens, action=action, pdf_path=pdf_path)
+        except Exception as e:
+            if not self._file_rejected(e, messages):
+                raise
+            await provider_files.invalidate(pdf_path)
+            return await self._call_gemini_api(
+                await build_messages(False), max_tokens, action=action, pdf_path=pdf_path
+            )
+
+    async def _stream_messages(
+        self,
+        pdf_path: str,
+        build_messages: Callable[[bool], Awaitable[List[dict]]],
+        max_tokens: int,
+        action: str = "other"
+    ) -> AsyncIterator[str]:
+        """在生成器内部构建消息，保证调用方拿到流之前不会阻塞在PDF编码上"""
+        max_tokens = token_usage.output_limit(action, max_tokens)
+        messages = await build_messages(True)
+        started = False
+        try:
+            async for chunk in self._stream_gemini_api(messages, max_tokens, action=action, pdf_path=pdf_path):
+                started = True
+                yield chunk
+        except Exception as e:
+            # 已经输出过内容时无法透明重试
+            if started or not self._file_rejected(e, messages):
+                raise
+            await provider_files.invalidate(pdf_path)
+            async for chunk in self._stream_gemini_api(
+                await build_messages(False), max_tokens, action=action, pdf_path=pdf_path
+            ):
+                yield chunk
+
+    async def _with_response_cache(
+        self,
+        action: str,
+        pdf_path: str,
+        params: dict,
+        use_cache: bool,
+        stream: bool,
+        produce: Callable[[bool], Awaitable[Union[str, AsyncIterator[str]]]]
+    ) -> Union[str, AsyncIterator[str]]:
         """
-        使用Gemini读取PDF并回答问题
+        用持久化回复缓存包装确定性操作（解释/翻译/总结/公式），并合并并发的相同请求
 
         Args:
+            action: 操作类型
             pdf_path: PDF文件路径
-            prompt: 用户问题或提示
-            max_tokens: 最大token数
+            params: 影响回复的参数，参与缓存键计算
+            use_cache: 是否使用缓存（False时绕过缓存且不写入，也不与其他请求合并）
+            stream: 是否以流的形式返回
+            produce: 实际调用模型的函数，参数为stream
 
         Returns:
-            AI的回复
+            AI回复或逐段产出文本的异步迭代器
         """
-        pdf_base64 = self._pdf_to_base64(pdf_path)
-
-        messages = [{
-            "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": prompt
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:application/pdf;base64,{pdf_base64}"
-                    }
-                }
-            ]
-        }]
+        cache_enabled = response_cache.enabled
+        if not use_cache:
+            if cache_enabled:
+                response_cache.record_bypass()
+            return await produce(stream)
+
+        pdf_hash = await asyncio.to_thread(pdf_cache.content_hash, pdf_path)
+        key = self._response_cache_key(action, pdf_hash, params)
+
+        if cache_enabled:
+            cached = await asyncio.to_thread(response_cache.get, key)
+            if cached is not None:
+                return self._replay(cached) if stream else cached
+
+        # 相同请求在执行中时共享同一次模型调用
+        if stream:
+            async def start() -> AsyncIterator[str]:
+                chunks = await produce(True)
+                return self._record_stream(chunks, key, action, pdf_hash) if cache_enabled else chunks
+
+            return single_flight.stream(key, start)
+
+        async def call() -> str:
+            result = await produce(False)
+            if cache_enabled:
+                await asyncio.to_thread(response_cache.put, key, action, self.model, pdf_hash, result)
+            return result
+
+        return await single_flight.do(key, call)
+
+    def _response_cache_key(self, action: str, pdf_hash: str, params: dict) -> str:
+        return response_cache.make_key(
+            action, self.model, pdf_hash,
+            context_mode=settings.PDF_CONTEXT_MODE,
+            context_window=settings.PDF_CONTEXT_WINDOW,
+            **params
+        )
+
+    @staticmethod
+    async def _replay(text: str) -> AsyncIterator[str]:
+        yield text
+
+    async def _record_stream(
+        self,
+        chunks: AsyncIterator[str],
+        key: str,
+        action: str,
+        pdf_hash: str
+    ) -> AsyncIterator[str]:
+        """透传流式输出，完整结束后写入缓存"""
+        parts = []
+        async for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        await asyncio.to_thread(response_cache.put, key, action, self.model, pdf_hash, "".join(parts))
+
+    async def _ask(
+        self,
+        prompt: str,
+        max_tokens: int = 2000,
+        stream: bool = False,
+        action: str = "other",
+        pdf_path: str = ""
+    ) -> Union[str, AsyncIterator[str]]:
+        """只发送文本提示词（不附带PDF；pdf_path仅用于按PDF统计用量）"""
+        async def build_messages(allow_file: bool) -> List[dict]:
+            return [{"role": "user", "content": prompt}]
+
+        if stream:
+            return self._stream_messages(pdf_path, build_messages, max_tokens, action)
+        return await self._complete_messages(pdf_path, build_messages, max_tokens, action)
+
+    async def read_pdf_with_context(
+        self,
+        pdf_path: str,
+        prompt: str,
+        max_tokens: int = 2000,
+        stream: bool = False,
+        page_num: Optional[int] = None,
+        action: str = "other"
+    ) -> Union[str, AsyncIterator[str]]:
+        """
+        使用Gemini读取PDF并回答问题
 
-        return self._call_gemini_api(messages, max_tokens)
+        Args:
+            pdf_path: PDF文件路径
+            prompt: 用户问题或提示
+            max_tokens: 最大token数（可被 OUTPUT_TOKEN_LIMITS 覆盖）
+            stream: 是否以流的形式返回
+            page_num: 用户所在页码（可选，用于页级上下文）
+            action: 操作类型（用于token用量统计）
 
-    def explain_selected_text(
+        Returns:
+            AI的回复；stream为True时返回逐段产出文本的异步迭代器
+        """
+        async def build_messages(allow_file: bool) -> List[dict]:
+            return [{
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt
+                    },
+                    *await self._document_parts(pdf_path, page_num, allow_file)
+                ]
+            }]
+
+        if stream:
+            return self._stream_messages(pdf_path, build_messages, max_tokens, action)
+        return await self._complete_messages(pdf_path, build_messages, max_tokens, action)
+
+    async def explain_selected_text(
         self,
         pdf_path: str,
         selected_text: str,
         page_num: int,
-        custom_prompt: Optional[str] = None
-    ) -> str:
+        custom_prompt: Optional[str] = None,
+        stream: bool = False,
+        use_cache: bool = True
+    ) -> Union[str, AsyncIterator[str]]:
         """
         解释用户选中的文本
 
@@ -94,6 +437,8 @@ class GeminiService:
             selected_text: 选中的文本
             page_num: 页码
             custom_prompt: 用户自定义提示（可选）
+            stream: 是否以流的形式返回
+            use_cache: 是否使用回复缓存
 
         Returns:
             AI的解释
@@ -113,14 +458,23 @@ class GeminiService:
 
 请用中文回答，简洁明了。"""
 
-        return self.read_pdf_with_context(pdf_path, prompt)
+        return await self._with_response_cache(
+            "explain", pdf_path,
+            {"selected_text": selected_text, "page_num": page_num, "custom_prompt": custom_prompt},
+            use_cache, stream,
+            lambda stream: self.read_pdf_with_context(
+                pdf_path, prompt, stream=stream, page_num=page_num, action="explain"
+            )
+        )
 
-    def translate_text(
+    async def translate_text(
         self,
         pdf_path: str,
         selected_text: str,
-        target_language: str = "中文"
-    ) -> str:
+        target_language: str = "中文",
+        stream: bool = False,
+        use_cache: bool = True
+    ) -> Union[str, AsyncIterator[str]]:
         """
         翻译选中的文本
 
@@ -128,6 +482,8 @@ class GeminiService:
             pdf_path: PDF文件路径
             selected_text: 选中的文本
             target_language: 目标语言
+            stream: 是否以流的形式返回
+            use_cache: 是否使用回复缓存
 
         Returns:
             翻译结果
@@ -138,19 +494,28 @@ class GeminiService:
 
 只返回翻译结果，不要额外解释。"""
 
-        return self.read_pdf_with_context(pdf_path, prompt)
+        return await self._with_response_cache(
+            "translate", pdf_path,
+            {"selected_text": selected_text, "target_language": target_language},
+            use_cache, stream,
+            lambda stream: self.read_pdf_with_context(pdf_path, prompt, stream=stream, action="translate")
+        )
 
-    def summarize_text(
+    async def summarize_text(
         self,
         pdf_path: str,
-        selected_text: str
-    ) -> str:
+        selected_text: str,
+        stream: bool = False,
+        use_cache: bool = True
+    ) -> Union[str, AsyncIterator[str]]:
         """
         总结选中的文本
 
         Args:
             pdf_path: PDF文件路径
             selected_text: 选中的文本
+            stream: 是否以流的形式返回
+            use_cache: 是否使用回复缓存
 
         Returns:
             总结内容
@@ -161,9 +526,218 @@ class GeminiService:
 
 请简洁地列出3-5个要点。"""
 
-        return self.read_pdf_with_context(pdf_path, prompt)
+        return await self._with_response_cache(
+            "summarize", pdf_path,
+            {"selected_text": selected_text},
+            use_cache, stream,
+            lambda stream: self.read_pdf_with_context(pdf_path, prompt, stream=stream, action="summarize")
+        )
+
+    # 批量处理中各操作的要求和预计输出token数（翻译按原文长度估算）
+    _BATCH_ACTIONS = {
+        "explain": ("详细解释这段文字：字面意思、背后的概念或原理、关键要点、需要注意的地方，简洁明了", 600),
+        "translate": ("翻译成{target_language}，只给出译文", None),
+        "summarize": ("用3-5个要点总结核心内容", 300),
+    }
+    _BATCH_LABELS = {"explain": "解释", "translate": "翻译", "summarize": "总结"}
+
+    @staticmethod
+    def _selection_params(item: dict) -> dict:
+        """与单条解释/翻译/总结相同的缓存参数，批量与单条请求共用缓存"""
+        action = item["action"]
+        if action == "explain":
+            return {
+                "selected_text": item["selected_text"],
+                "page_num": item.get("page_number"),
+                "custom_prompt": item.get("custom_prompt")
+            }
+        if action == "translate":
+            return {"selected_text": item["selected_text"], "target_language": item.get("target_language") or "中文"}
+        return {"selected_text": item["selected_text"]}
+
+    def _batch_output_tokens(self, item: dict) -> int:
+        budget = self._BATCH_ACTIONS[item["action"]][1]
+        if budget is None:
+            budget = 2 * token_usage.estimate_text(item["selected_text"]) + 50
+        return budget
+
+    def _pack_batch(self, items: List[dict]) -> List[List[int]]:
+        """按片段数、输入和输出token预算把片段依次装入尽量少的调用"""
+        groups: List[List[int]] = []
+        group: List[int] = []
+        input_tokens = output_tokens = 0
+        for index, item in enumerate(items):
+            item_input = token_usage.estimate_text(item["selected_text"])
+            item_output = self._batch_output_tokens(item)
+            if group and (
+                len(group) >= settings.BATCH_MAX_ITEMS_PER_CALL
+                or input_tokens + item_input > settings.BATCH_MAX_INPUT_TOKENS
+                or output_tokens + item_output > settings.BATCH_MAX_OUTPUT_TOKENS
+            ):
+                groups.append(group)
+                group, input_tokens, output_tokens = [], 0, 0
+            group.append(index)
+            input_tokens += item_input
+            output_tokens += item_output
+        if group:
+            groups.append(group)
+        return groups
+
+    def _batch_prompt(self, items: List[dict]) -> str:
+        parts = [f"以下是用户从这份PDF文档中选中的{len(items)}个片段，请结合文档内容逐一处理：\n"]
+        for number, item in enumerate(items, 1):
+            action = item["action"]
+            if action == "explain" and item.get("custom_prompt"):
+                requirement = item["custom_prompt"].replace("{selected_text}", "该片段")
+            else:
+                requirement = self._BATCH_ACTIONS[action][0].format(
+                    target_language=item.get("target_language") or "中文"
+                )
+            page = f"（第{item['page_number']}页）" if item.get("page_number") else ""
+            parts.append(
+                f"[{number}] 操作：{self._BATCH_LABELS[action]}{page}\n"
+                f"片段：\"{item['selected_text']}\"\n"
+                f"要求：{requirement}\n"
+            )
+        parts.append(
+            f"请只返回一个JSON数组，每个元素形如 {{\"id\": 编号, \"result\": \"处理结果\"}}，"
+            f"按编号顺序包含全部{len(items)}个片段，解释和总结请用中文，不要输出其他内容。"
+        )
+        return "\n".join(parts)
+
+    async def _batch_call(self, pdf_path: str, items: List[dict]) -> Dict[int, str]:
+        """一次模型调用处理一组片段，返回 {编号: 结果}（编号从1开始，缺失的片段不在结果中）"""
+        prompt = self._batch_prompt(items)
+        max_tokens = min(
+            sum(self._batch_output_tokens(item) for item in items) + 50 * len(items),
+            settings.BATCH_MAX_OUTPUT_TOKENS
+        )
+
+        async def build_messages(allow_file: bool) -> List[dict]:
+            return [{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    # 片段可能分布在不同页，发送整份文档（启用文件句柄时只发送引用）
+                    *await self._document_parts(pdf_path, None, allow_file)
+                ]
+            }]
+
+        response = await self._complete_messages(pdf_path, build_messages, max_tokens, action="batch")
+        parsed = self._parse_json(response) or {}
+        entries = parsed.get("items") or parsed.get("results") or []
+        answers = {}
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            try:
+                number = int(entry.get("id"))
+            except (TypeError, ValueError):
+                continue
+            result = entry.get("result")
+            if isinstance(result, str) and result.strip() and 1 <= number <= len(items):
+                answers[number] = result.strip()
+        return answers
+
+    async def _single_selection(self, pdf_path: str, item: dict, use_cache: bool) -> str:
+        action = item["action"]
+        if action == "explain":
+            return await self.explain_selected_text(
+                pdf_path, item["selected_text"], item.get("page_number"),
+                custom_prompt=item.get("custom_prompt"), use_cache=use_cache
+            )
+        if action == "translate":
+            return await self.translate_text(
+                pdf_path, item["selected_text"], item.get("target_language") or "中文", use_cache=use_cache
+            )
+        return await self.summarize_text(pdf_path, item["selected_text"], use_cache=use_cache)
+
+    async def batch_selections(self, pdf_path: str, items: List[dict], use_cache: bool = True) -> dict:
+        """
+        批量解释/翻译/总结多个选中片段：缓存命中的直接返回，其余按token预算打包进尽量少的模型调用
+
+        与单条接口共用回复缓存；模型回复中缺失的片段单独调用补齐。
+
+        Args:
+            pdf_path: PDF文件路径
+            items: 片段列表，每项含 action（explain/translate/summarize）、selected_text，
+                以及可选的 page_number、target_language、custom_prompt
+            use_cache: 是否使用回复缓存
 
-    def generate_full_summary(self, pdf_path: str) -> str:
+        Returns:
+            {"results": [每个片段的 {index, action, result, cached, error}], "api_calls": 模型调用次数}
+        """
+        results = [
+            {"index": index, "action": item["action"], "result": None, "cached": False, "error": None}
+            for index, item in enumerate(items)
+        ]
+        cache_enabled = use_cache and response_cache.enabled
+        if response_cache.enabled and not use_cache:
+            response_cache.record_bypass()
+
+        pdf_hash = await asyncio.to_thread(pdf_cache.content_hash, pdf_path)
+        keys = [self._response_cache_key(item["action"], pdf_hash, self._selection_params(item)) for item in items]
+
+        # 同一批中的重复片段只处理一次
+        duplicates: Dict[str, List[int]] = {}
+        for index, key in enumerate(keys):
+            duplicates.setdefault(key, []).append(index)
+
+        pending = []
+        for key, indexes in duplicates.items():
+            cached = await asyncio.to_thread(response_cache.get, key) if cache_enabled else None
+            if cached is not None:
+                for index in indexes:
+                    results[index].update(result=cached, cached=True)
+            else:
+                pending.append(indexes[0])
+
+        def resolve(index: int, text: Optional[str] = None, error: Optional[str] = None):
+            for same in duplicates[keys[index]]:
+                results[same].update(result=text, error=error)
+
+        limit = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+        api_calls = 0
+        missing: List[int] = []
+
+        async def run_group(group: List[int]):
+            nonlocal api_calls
+            async with limit:
+                try:
+                    api_calls += 1
+                    answers = await self._batch_call(pdf_path, [items[index] for index in group])
+                except Exception as e:
+                    for index in group:
+                        resolve(index, error=str(e))
+                    return
+            for number, index in enumerate(group, 1):
+                if number in answers:
+                    resolve(index, answers[number])
+                    if cache_enabled:
+                        await asyncio.to_thread(
+                            response_cache.put, keys[index], items[index]["action"], self.model, pdf_hash, answers[number]
+                        )
+                else:
+                    missing.append(index)
+
+        await asyncio.gather(*(
+            run_group([pending[position] for position in group])
+            for group in self._pack_batch([items[index] for index in pending])
+        ))
+
+        async def run_single(index: int):
+            nonlocal api_calls
+            async with limit:
+                try:
+                    api_calls += 1
+                    resolve(index, await self._single_selection(pdf_path, items[index], use_cache))
+                except Exception as e:
+                    resolve(index, error=str(e))
+
+        await asyncio.gather(*(run_single(index) for index in missing))
+        return {"results": results, "api_calls": api_calls}
+
+    async def generate_full_summary(self, pdf_path: str) -> str:
         """
         生成整篇PDF的摘要
 
@@ -185,42 +759,182 @@ class GeminiService:
 
 请用中文回答，结构清晰，内容详实。"""
 
-        return self.read_pdf_with_context(pdf_path, prompt, max_tokens=3000)
+        return await self.read_pdf_with_context(pdf_path, prompt, max_tokens=3000, action="full_summary")
 
-    def chat_with_pdf(
+    async def summarize_page_range(
+        self,
+        pdf_path: str,
+        start: int,
+        end: int,
+        text: Optional[str] = None
+    ) -> str:
+        """
+        总结PDF中一个页段（分层摘要的map阶段）
+
+        Args:
+            pdf_path: PDF文件路径
+            start: 起始页
+            end: 结束页（包含）
+            text: 这些页已提取的文本；为空时（如扫描版）发送页段的PDF切片
+
+        Returns:
+            页段摘要
+        """
+        prompt = f"""下面是一份PDF文档第{start}-{end}页的内容。请用中文总结这部分：
+
+1. 涉及的主题和章节
+2. 重要的概念、定义、公式或结论（注明所在页码）
+3. 值得注意的例子或细节
+
+只总结这几页的内容，条理清晰，不超过500字。"""
+
+        if text:
+            return await self._ask(f"{prompt}\n\n{text}", max_tokens=1000, action="range_summary", pdf_path=pdf_path)
+
+        async def build_messages(allow_file: bool) -> List[dict]:
+            pdf_base64 = await asyncio.to_thread(self._range_slice_base64, pdf_path, start, end)
+            return [{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": f"data:application/pdf;base64,{pdf_base64}"}
+                    }
+                ]
+            }]
+
+        return await self._complete_messages(pdf_path, build_messages, max_tokens=1000, action="range_summary")
+
+    def _range_slice_base64(self, pdf_path: str, start: int, end: int) -> str:
+        """页码范围切片的base64编码"""
+        digest = pdf_cache.content_hash(pdf_path)
+        return pdf_cache.get_or_encode(
+            f"{digest}:r{start}-{end}",
+            lambda: self.pdf_service.slice_range(pdf_path, start, end)
+        )
+
+    async def merge_summaries(
+        self,
+        sections: List[Tuple[int, int, str]],
+        final: bool = False,
+        pdf_path: str = ""
+    ) -> str:
+        """
+        把若干页段/章节摘要合并为更高一级的摘要（分层摘要的reduce阶段）
+
+        Args:
+            sections: (起始页, 结束页, 摘要) 列表，按页码排序
+            final: 是否生成全文摘要（与 generate_full_summary 相同的结构）
+            pdf_path: 所属PDF路径（用于按文档记录token用量）
+
+        Returns:
+            合并后的摘要
+        """
+        parts = "\n\n".join(f"### 第{start}-{end}页\n{text}" for start, end, text in sections)
+
+        if final:
+            prompt = f"""以下是一份PDF文档按页码顺序排列的各部分摘要：
+
+{parts}
+
+请基于这些摘要，为整份文档提供：
+
+1. **文档概述**（2-3段）：这份文档的主要内容是什么？讨论了什么主题？
+
+2. **核心内容**（3-5个要点）：文档中最重要的概念、公式、定义或结论是什么？
+
+3. **关键细节**：有哪些重要的细节、例子或说明？
+
+4. **总结建议**：读者应该重点关注什么？
+
+请用中文回答，结构清晰，内容详实。"""
+            return await self._ask(prompt, max_tokens=3000, action="merge_summaries", pdf_path=pdf_path)
+
+        prompt = f"""以下是一份PDF文档第{sections[0][0]}-{sections[-1][1]}页中各部分的摘要：
+
+{parts}
+
+请把它们合并为这一章节的摘要：概括主题，列出最重要的概念、公式和结论（保留页码），去掉重复内容。请用中文回答，不超过800字。"""
+        return await self._ask(prompt, max_tokens=1500, action="merge_summaries", pdf_path=pdf_path)
+
+    async def chat_with_pdf(
         self,
         pdf_path: str,
         user_message: str,
         conversation_history: Optional[List[dict]] = None,
-        selected_text: Optional[str] = None
-    ) -> str:
+        selected_text: Optional[str] = None,
+        stream: bool = False,
+        conversation_summary: Optional[str] = None
+    ) -> Union[str, AsyncIterator[str]]:
         """
         与PDF对话
 
         Args:
             pdf_path: PDF文件路径
             user_message: 用户消息
-            conversation_history: 对话历史（最近几轮）
+            conversation_history: 对话历史（调用方已限定为最近几条，这里再按token预算裁剪）
             selected_text: 选中的文本（可选）
+            stream: 是否以流的形式返回
+            conversation_summary: 更早对话的滚动摘要（可选）
 
         Returns:
             AI回复
         """
+        # 检索模式：只发送与问题相关的片段，提示词大小不随文档增长
+        excerpts = None
+        if settings.CHAT_CONTEXT_MODE == "retrieval":
+            query = "\n".join(part for part in (selected_text, user_message) if part)
+            chunks = await asyncio.to_thread(embedding_index.search, pdf_path, query)
+            if chunks:
+                excerpts = self._fit_excerpts(chunks)
+
+        # 按token预算裁剪对话历史：文档和本轮内容之外的剩余额度（不超过 CHAT_HISTORY_TOKEN_BUDGET）；
+        # 整份文档超出预算时仍保留最近 CHAT_HISTORY_MIN_MESSAGES 条，避免长文档的对话失去上下文
+        if excerpts is not None:
+            document_tokens = token_usage.estimate_text(excerpts)
+        else:
+            document_tokens = await asyncio.to_thread(token_usage.document_tokens, pdf_path)
+        fixed_tokens = document_tokens + sum(
+            token_usage.estimate_text(part) for part in (conversation_summary, selected_text, user_message)
+        )
+        history_budget = min(settings.CHAT_HISTORY_TOKEN_BUDGET, settings.PROMPT_TOKEN_BUDGET - fixed_tokens)
+        history = token_usage.trim_history(
+            conversation_history or [],
+            history_budget,
+            min_messages=settings.CHAT_HISTORY_MIN_MESSAGES
+        )
+        if len(history) < len(conversation_history or []):
+            token_usage.record_trim("chat")
+
         # 构建上下文
         context_parts = []
 
-        if conversation_history:
-            # 只保留最近5条消息作为上下文
-            recent_history = conversation_history[-5:]
+        if conversation_summary:
+            context_parts.append(f"更早对话的摘要:\n{conversation_summary}")
+
+        if history:
             history_text = "\n".join([
                 f"{msg['role']}: {msg['content']}"
-                for msg in recent_history
+                for msg in history
             ])
             context_parts.append(f"之前的对话:\n{history_text}")
 
         if selected_text:
             context_parts.append(f"用户选中的文本:\n\"{selected_text}\"")
 
+        if excerpts is not None:
+            retrieval_prompt = f"""以下是从PDF文档中检索到的与问题相关的片段：
+
+{excerpts}
+
+{chr(10).join(context_parts)}
+
+用户的问题: {user_message}
+
+请基于上述文档片段回答用户的问题，必要时注明页码。"""
+            return await self._ask(retrieval_prompt, stream=stream, action="chat", pdf_path=pdf_path)
+
         if context_parts:
             full_prompt = f"""{chr(10).join(context_parts)}
 
@@ -230,9 +944,44 @@ class GeminiService:
         else:
             full_prompt = user_message
 
-        return self.read_pdf_with_context(pdf_path, full_prompt)
+        return await self.read_pdf_with_context(pdf_path, full_prompt, stream=stream, action="chat")
+
+    @staticmethod
+    def _fit_excerpts(chunks: List[dict]) -> str:
+        """按相关度顺序保留检索片段，直到用完 CONTEXT_TOKEN_BUDGET（至少保留一个）"""
+        parts = []
+        used = 0
+        for chunk in chunks:
+            part = f"[第{chunk['page_number']}页]\n{chunk['text']}"
+            used += token_usage.estimate_text(part)
+            if parts and used > settings.CONTEXT_TOKEN_BUDGET:
+                token_usage.record_trim("chat")
+                break
+            parts.append(part)
+        return "\n\n".join(parts)
+
+    async def fold_conversation(self, summary: Optional[str], messages: List[dict], pdf_path: str = "") -> str:
+        """
+        把较早的对话消息折叠进滚动摘要
+
+        Args:
+            summary: 已有的对话摘要（可选）
+            messages: 待折叠的消息（role/content），按时间顺序
+            pdf_path: 对话所属PDF路径（用于按文档记录token用量）
+
+        Returns:
+            更新后的对话摘要
+        """
+        transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+        prompt = f"""以下是一段关于PDF学习资料的对话记录{"及此前的对话摘要" if summary else ""}。
+
+{"此前的对话摘要：" + chr(10) + summary + chr(10) + chr(10) if summary else ""}新的对话记录：
+{transcript}
+
+请把它们合并为一份简洁的对话摘要（不超过400字），保留用户关心的问题、已经得到的结论、涉及的页码和尚未解决的疑问，供后续对话作为上下文使用。请用中文回答。"""
+        return await self._ask(prompt, max_tokens=800, action="fold_conversation", pdf_path=pdf_path)
 
-    def analyze_pdf_structure(self, pdf_path: str) -> dict:
+    async def analyze_pdf_structure(self, pdf_path: str) -> dict:
         """
         分析PDF结构（使用Gemini识别章节、标题等）
 
@@ -250,17 +999,31 @@ class GeminiService:
 
 请用JSON格式返回结果。"""
 
-        response = self.read_pdf_with_context(pdf_path, prompt)
-        # 这里可以尝试解析JSON，如果失败则返回原始文本
-        return {"raw_analysis": response}
+        response = await self.read_pdf_with_context(pdf_path, prompt, action="structure")
+        # 尝试解析JSON（模型常用```json代码块包裹），失败时只返回原始文本
+        return {"raw_analysis": response, "structure": self._parse_json(response)}
 
-    def explain_formula(
+    @staticmethod
+    def _parse_json(text: str) -> Optional[dict]:
+        body = text.strip()
+        if body.startswith("```"):
+            body = body.split("\n", 1)[1] if "\n" in body else ""
+            body = body.rsplit("```", 1)[0]
+        try:
+            parsed = json.loads(body)
+        except ValueError:
+            return None
+        return parsed if isinstance(parsed, dict) else {"items": parsed}
+
+    async def explain_formula(
         self,
         pdf_path: str,
         selected_text: Optional[str] = None,
         image_base64: Optional[str] = None,
-        page_num: Optional[int] = None
-    ) -> str:
+        page_num: Optional[int] = None,
+        stream: bool = False,
+        use_cache: bool = True
+    ) -> Union[str, AsyncIterator[str]]:
         """
         解释数学公式 - 支持文本或图片输入
 
@@ -269,12 +1032,12 @@ class GeminiService:
             selected_text: 选中的文本（可能包含公式）
             image_base64: 截图的base64数据
             page_num: 页码
+            stream: 是否以流的形式返回
+            use_cache: 是否使用回复缓存
 
         Returns:
             公式解释（包含LaTeX格式）
         """
-        pdf_base64 = self._pdf_to_base64(pdf_path)
-
         # 构建提示词
         formula_prompt = f"""你是一个专业的数学公式解释助手。请分析用户提供的公式，并给出详细解释。
 
@@ -315,36 +1078,43 @@ class GeminiService:
 
 请用中文回答，确保解释清晰、准确。"""
 
-        # 构建消息内容
-        content = [
-            {
-                "type": "text",
-                "text": formula_prompt
-            },
-            {
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:application/pdf;base64,{pdf_base64}"
-                }
-            }
-        ]
-
-        # 如果有截图，也添加进去
-        if image_base64:
-            # 移除可能的 data URL 前缀
-            if image_base64.startswith('data:'):
-                image_base64 = image_base64.split(',')[1]
-
-            content.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/png;base64,{image_base64}"
-                }
-            })
+        async def build_messages(allow_file: bool) -> List[dict]:
+            # 构建消息内容
+            content = [
+                {
+                    "type": "text",
+                    "text": formula_prompt
+                },
+                *await self._document_parts(pdf_path, page_num, allow_file)
+            ]
 
-        messages = [{
-            "role": "user",
-            "content": content
-        }]
+            # 如果有截图，也添加进去
+            if image_base64:
+                # 移除可能的 data URL 前缀
+                image_data = image_base64
+                if image_data.startswith('data:'):
+                    image_data = image_data.split(',')[1]
 
-        return self._call_gemini_api(messages, max_tokens=3000)
+                content.append({
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/png;base64,{image_data}"
+                    }
+                })
+
+            return [{
+                "role": "user",
+                "content": content
+            }]
+
+        async def produce(stream: bool) -> Union[str, AsyncIterator[str]]:
+            if stream:
+                return self._stream_messages(pdf_path, build_messages, max_tokens=3000, action="formula")
+            return await self._complete_messages(pdf_path, build_messages, max_tokens=3000, action="formula")
+
+        image_hash = hashlib.sha256(image_base64.encode("utf-8")).hexdigest() if image_base64 else None
+        return await self._with_response_cache(
+            "formula", pdf_path,
+            {"selected_text": selected_text, "page_num": page_num, "image": image_hash},
+            use_cache, stream, produce
+        )
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import httpx
+from typing import AsyncIterator, Optional
+from app.config import settings
+
+
+class GeminiHTTPClient:
+    """共享的异步HTTP客户端 - 连接池、keep-alive与并发上限"""
+
+    def __init__(self):
+        self.base_url = settings.BASE_URL
+        # Content-Type由httpx按请求体（json/multipart）自动设置
+        self.headers = {
+            "Authorization": f"Bearer {settings.API_KEY}"
+        }
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        """按当前事件循环惰性创建客户端（httpx客户端不能跨事件循环复用）"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url or "",
+                headers=self.headers,
+                limits=httpx.Limits(
+                    max_connections=settings.GEMINI_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.GEMINI_MAX_KEEPALIVE,
+                    keepalive_expiry=settings.GEMINI_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(
+                    settings.GEMINI_TIMEOUT,
+                    connect=settings.GEMINI_CONNECT_TIMEOUT
+                )
+            )
+            self._semaphore = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY)
+            self._loop = loop
+        return self._client
+
+    async def post_json(self, path: str, payload: dict, timeout: Optional[float] = None) -> dict:
+        """
+        发送JSON POST请求
+
+        Args:
+            path: 请求路径
+            payload: 请求体
+            timeout: 本次调用的超时秒数（可选，默认使用全局配置）
+
+        Returns:
+            响应JSON
+        """
+        client = self._ensure_client()
+        async with self._semaphore:
+            response = await client.post(
+                path,
+                json=payload,
+                timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+            )
+        response.raise_for_status()
+        return response.json()
+
+    async def post_multipart(self, path: str, files: dict, data: Optional[dict] = None) -> dict:
+        """
+        发送multipart/form-data POST请求（用于上传文件）
+
+        Args:
+            path: 请求路径
+            files: httpx格式的文件字段
+            data: 其他表单字段
+
+        Returns:
+            响应JSON
+        """
+        client = self._ensure_client()
+        async with self._semaphore:
+            response = await client.post(path, files=files, data=data)
+        response.raise_for_status()
+        return response.json()
+
+    async def stream_events(
+        self,
+        path: str,
+        payload: dict,
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[dict]:
+        """
+        发送流式POST请求，逐条产出服务端事件（data: 行）中的JSON
+
+        Args:
+            path: 请求路径
+            payload: 请求体（应包含 "stream": true）
+            timeout: 本次调用的超时秒数（可选）
+
+        Yields:
+            每个事件解析后的JSON
+        """
+        client = self._ensure_client()
+        async with self._semaphore:
+            async with client.stream(
+                "POST",
+                path,
+                json=payload,
+                timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+            ) as response:
+                if response.is_error:
+                    # 读取错误响应体，调用方可据此判断失败原因
+                    await response.aread()
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    if data:
+                        yield json.loads(data)
+
+    async def close(self):
+        """关闭连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+
+# 所有GeminiService实例共享同一个连接池
+gemini_http = GeminiHTTPClient()
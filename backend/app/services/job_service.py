@@ -0,0 +1,319 @@
+import asyncio
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database.models import BackgroundJob, SessionLocal
+
+# 任务处理函数：参数为PDF ID和进度回调 report(百分比, 说明)，返回写入任务记录的结果
+JobHandler = Callable[[int, Callable[[int, Optional[str]], None]], Awaitable[Optional[dict]]]
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobQueue:
+    """持久化后台任务队列 - 任务记录存数据库，由事件循环上的工作协程执行
+
+    同一PDF的同类任务在排队或执行中时不会重复创建；失败后按指数退避重试，
+    超过最大次数标记为failed。服务重启后未完成的任务会重新排队。
+
+    每类任务一个就绪队列：工作协程只从未达到 JOB_KIND_CONCURRENCY 上限的类型中取最早的任务，
+    取到即占用该类型的名额，之后才把任务标记为running；某类任务占满名额时不会阻塞其他类型。
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, JobHandler] = {}
+        self._ready: Dict[str, Deque[int]] = {}
+        self._running: Dict[str, int] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self._enqueue_lock: Optional[asyncio.Lock] = None
+        # 执行中任务的进度只保存在内存里，避免每次汇报都写库
+        self._progress: Dict[int, Tuple[int, Optional[str]]] = {}
+
+    def register(self, kind: str, handler: JobHandler):
+        """注册某类任务的处理函数"""
+        self._handlers[kind] = handler
+
+    async def start(self):
+        """启动工作协程并恢复未完成的任务（在应用启动时调用）"""
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        self._enqueue_lock = asyncio.Lock()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{index}")
+            for index in range(settings.JOB_WORKERS)
+        ]
+        for job_id, kind, next_run_at in await asyncio.to_thread(self._reset_interrupted):
+            self._dispatch(job_id, kind, next_run_at)
+
+    async def stop(self):
+        """停止工作协程；执行中的任务保持running状态，下次启动时重新排队"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._wakeup = None
+        self._ready.clear()
+        self._running.clear()
+
+    async def enqueue(self, kind: str, pdf_id: int) -> dict:
+        """
+        提交任务；同一PDF的同类任务已在排队或执行时直接返回该任务
+
+        Args:
+            kind: 任务类型
+            pdf_id: PDF记录ID
+
+        Returns:
+            任务信息
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        async with self._enqueue_lock or asyncio.Lock():
+            job, created = await asyncio.to_thread(self._create, kind, pdf_id)
+        if created:
+            self._dispatch(job["id"], kind)
+        return job
+
+    def get_job(self, db: Session, job_id: int) -> Optional[dict]:
+        """读取任务状态（执行中的任务附带内存中的最新进度）"""
+        job = db.query(BackgroundJob).filter(BackgroundJob.id == job_id).first()
+        return self._to_dict(job) if job else None
+
+    def list_jobs(self, db: Session, pdf_id: int, kind: Optional[str] = None) -> List[dict]:
+        """列出PDF的任务，按创建时间倒序"""
+        query = db.query(BackgroundJob).filter(BackgroundJob.pdf_id == pdf_id)
+        if kind:
+            query = query.filter(BackgroundJob.kind == kind)
+        return [self._to_dict(job) for job in query.order_by(BackgroundJob.id.desc()).all()]
+
+    def latest_job(self, db: Session, pdf_id: int, kind: str) -> Optional[dict]:
+        """PDF最近一次的某类任务"""
+        job = db.query(BackgroundJob).filter(
+            BackgroundJob.pdf_id == pdf_id,
+            BackgroundJob.kind == kind
+        ).order_by(BackgroundJob.id.desc()).first()
+        return self._to_dict(job) if job else None
+
+    def stats(self) -> dict:
+        """队列运行指标"""
+        return {
+            "workers": len(self._workers),
+            "queued": sum(len(ready) for ready in self._ready.values()),
+            "running": len(self._progress),
+            "running_by_kind": {kind: count for kind, count in self._running.items() if count}
+        }
+
+    def _to_dict(self, job: BackgroundJob) -> dict:
+        progress, message = job.progress or 0, job.message
+        if job.status == "running" and job.id in self._progress:
+            progress, message = self._progress[job.id]
+        return {
+            "id": job.id,
+            "kind": job.kind,
+            "pdf_id": job.pdf_id,
+            "status": job.status,
+            "progress": progress,
+            "message": message,
+            "attempts": job.attempts or 0,
+            "max_attempts": job.max_attempts,
+            "result": job.result,
+            "error": job.error,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+            "next_run_at": job.next_run_at
+        }
+
+    def _dispatch(self, job_id: int, kind: str, run_at: Optional[datetime] = None):
+        """把任务放入所属类型的就绪队列；指定时间在未来时延后放入"""
+        if self._wakeup is None:
+            # 尚未启动时任务留在数据库中，启动时统一恢复
+            return
+        delay = (run_at - datetime.utcnow()).total_seconds() if run_at else 0
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._dispatch, job_id, kind)
+        else:
+            self._ready.setdefault(kind, deque()).append(job_id)
+            self._wakeup.set()
+
+    async def _next_job(self) -> Tuple[int, str]:
+        """等待并取出下一个可执行的任务，同时占用其类型的并发名额"""
+        while True:
+            eligible = [
+                (ready[0], kind) for kind, ready in self._ready.items()
+                if ready and self._running.get(kind, 0) < settings.JOB_KIND_CONCURRENCY
+            ]
+            if eligible:
+                # 各类型之间按任务创建顺序（ID）先来先服务
+                job_id, kind = min(eligible)
+                self._ready[kind].popleft()
+                self._running[kind] = self._running.get(kind, 0) + 1
+                return job_id, kind
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    async def _worker(self):
+        while True:
+            job_id, kind = await self._next_job()
+            try:
+                await self._run(job_id, kind)
+            except Exception as e:
+                print(f"后台任务执行异常 (job {job_id}): {str(e)}")
+            finally:
+                self._running[kind] -= 1
+                if self._wakeup is not None:
+                    self._wakeup.set()
+
+    async def _run(self, job_id: int, kind: str):
+        """执行任务（调用方已占用该类型的并发名额）"""
+        claimed = await asyncio.to_thread(self._claim, job_id)
+        if not claimed:
+            return
+        kind, pdf_id = claimed
+
+        if not await asyncio.to_thread(self._mark_running, job_id):
+            # 重复投递的任务已被其他工作协程执行
+            return
+        self._progress[job_id] = (0, None)
+
+        def report(progress: int, message: Optional[str] = None):
+            self._progress[job_id] = (max(0, min(100, int(progress))), message)
+
+        try:
+            result = await asyncio.wait_for(
+                self._handlers[kind](pdf_id, report),
+                timeout=settings.JOB_TIMEOUT
+            )
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            retry_at = await asyncio.to_thread(self._fail, job_id, error)
+            if retry_at:
+                self._dispatch(job_id, kind, retry_at)
+            else:
+                print(f"后台任务失败 (job {job_id}, {kind}, PDF {pdf_id}): {error}")
+        else:
+            await asyncio.to_thread(self._complete, job_id, result)
+        finally:
+            self._progress.pop(job_id, None)
+
+    def _create(self, kind: str, pdf_id: int) -> Tuple[dict, bool]:
+        db = SessionLocal()
+        try:
+            active = db.query(BackgroundJob).filter(
+                BackgroundJob.pdf_id == pdf_id,
+                BackgroundJob.kind == kind,
+                BackgroundJob.status.in_(ACTIVE_STATUSES)
+            ).first()
+            if active:
+                return self._to_dict(active), False
+
+            job = BackgroundJob(
+                kind=kind,
+                pdf_id=pdf_id,
+                status="queued",
+                max_attempts=settings.JOB_MAX_ATTEMPTS
+            )
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+            return self._to_dict(job), True
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _claim(self, job_id: int) -> Optional[Tuple[str, int]]:
+        """确认任务仍需执行（PDF删除时任务随之删除）"""
+        db = SessionLocal()
+        try:
+            job = db.query(BackgroundJob).filter(BackgroundJob.id == job_id).first()
+            if not job or job.status != "queued":
+                return None
+            return job.kind, job.pdf_id
+        finally:
+            db.close()
+
+    def _mark_running(self, job_id: int) -> bool:
+        db = SessionLocal()
+        try:
+            updated = db.query(BackgroundJob).filter(
+                BackgroundJob.id == job_id,
+                BackgroundJob.status == "queued"
+            ).update({
+                BackgroundJob.status: "running",
+                BackgroundJob.attempts: BackgroundJob.attempts + 1,
+                BackgroundJob.progress: 0,
+                BackgroundJob.started_at: datetime.utcnow(),
+                BackgroundJob.next_run_at: None
+            }, synchronize_session=False)
+            db.commit()
+            return updated == 1
+        finally:
+            db.close()
+
+    def _complete(self, job_id: int, result: Optional[dict]):
+        db = SessionLocal()
+        try:
+            job = db.query(BackgroundJob).filter(BackgroundJob.id == job_id).first()
+            if not job:
+                return
+            job.status = "completed"
+            job.progress = 100
+            job.message = None
+            job.result = result
+            job.error = None
+            job.finished_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+
+    def _fail(self, job_id: int, error: str) -> Optional[datetime]:
+        """
+        记录失败；未达到最大次数时重新排队
+
+        Returns:
+            下次执行时间；不再重试时返回None
+        """
+        db = SessionLocal()
+        try:
+            job = db.query(BackgroundJob).filter(BackgroundJob.id == job_id).first()
+            if not job:
+                return None
+            job.error = error
+            if (job.attempts or 0) < job.max_attempts:
+                delay = min(
+                    settings.JOB_RETRY_BASE_DELAY * 2 ** max((job.attempts or 1) - 1, 0),
+                    settings.JOB_RETRY_MAX_DELAY
+                )
+                job.status = "queued"
+                job.next_run_at = datetime.utcnow() + timedelta(seconds=delay)
+            else:
+                job.status = "failed"
+                job.finished_at = datetime.utcnow()
+            db.commit()
+            return job.next_run_at if job.status == "queued" else None
+        finally:
+            db.close()
+
+    def _reset_interrupted(self) -> List[Tuple[int, str, Optional[datetime]]]:
+        """把上次退出时仍在执行的任务改回排队，返回所有待执行任务"""
+        db = SessionLocal()
+        try:
+            jobs = db.query(BackgroundJob).filter(
+                BackgroundJob.status.in_(ACTIVE_STATUSES)
+            ).order_by(BackgroundJob.id).all()
+            for job in jobs:
+                job.status = "queued"
+            db.commit()
+            return [(job.id, job.kind, job.next_run_at) for job in jobs]
+        finally:
+            db.close()
+
+
+job_queue = JobQueue()
@@ -0,0 +1,210 @@
+import asyncio
+import importlib.util
+import os
+import shutil
+from typing import List, Optional
+from app.config import settings
+from app.database.models import PDF, PDFPageText, PDFTextExtraction, SessionLocal
+from app.services import pdf_workers
+from app.services.blob_service import blob_store
+from app.services.cpu_pool import cpu_pool
+from app.services.job_service import job_queue
+from app.services.render_service import page_renderer
+from app.services.search_service import search_service
+from app.services.text_index_service import text_index
+
+
+class OCRPipeline:
+    """扫描版PDF的本地OCR - 在共享进程池中逐页识别，结果写入页文本（source='ocr'）
+
+    以后台任务（kind='ocr'）执行，进度通过任务接口查询；每识别完一页立即存库，
+    任务重试或服务重启后只处理尚未识别的页。识别完成后重建全文索引并通知向量索引，
+    页级提示词、搜索和检索随即可以使用识别出的文本。
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def available(self) -> bool:
+        """pytesseract、tesseract和渲染依赖是否可用"""
+        if not settings.OCR_ENABLED or not page_renderer.available:
+            return False
+        if importlib.util.find_spec("pytesseract") is None:
+            return False
+        if settings.TESSERACT_CMD:
+            return os.path.exists(settings.TESSERACT_CMD)
+        return shutil.which("tesseract") is not None
+
+    async def start(self):
+        """记录事件循环并为尚未识别完成的扫描版PDF排队（在应用启动时调用）"""
+        self._loop = asyncio.get_running_loop()
+        if not self.available:
+            return
+        for pdf_id in await asyncio.to_thread(self._scanned_pdf_ids):
+            if await asyncio.to_thread(self.pending_pages, pdf_id):
+                await job_queue.enqueue("ocr", pdf_id)
+
+    def on_pages_updated(self, pdf_id: int):
+        """页文本提取完成后的回调（后台线程中调用）：扫描版且有待识别的页时提交OCR任务"""
+        if self._loop is None or not self.available:
+            return
+        if self.pending_pages(pdf_id):
+            asyncio.run_coroutine_threadsafe(job_queue.enqueue("ocr", pdf_id), self._loop)
+
+    def pending_pages(self, pdf_id: int) -> List[int]:
+        """
+        待识别的页码：扫描版PDF中文本层过少且尚未OCR的页
+
+        Args:
+            pdf_id: PDF记录ID
+
+        Returns:
+            页码列表；PDF不是扫描版或文本提取尚未完成时为空
+        """
+        db = SessionLocal()
+        try:
+            # 页文本保存在owner记录上
+            pdf_id = blob_store.owner_id(pdf_id, db)
+            row = db.query(PDF.is_scanned, PDFTextExtraction.status).join(
+                PDFTextExtraction, PDFTextExtraction.pdf_id == PDF.id
+            ).filter(PDF.id == pdf_id).first()
+            if not row or not row.is_scanned or row.status != "completed":
+                return []
+            return [
+                page_number for (page_number,) in db.query(PDFPageText.page_number).filter(
+                    PDFPageText.pdf_id == pdf_id,
+                    PDFPageText.source != "ocr",
+                    PDFPageText.char_count < settings.OCR_MIN_PAGE_CHARS
+                ).order_by(PDFPageText.page_number)
+            ]
+        finally:
+            db.close()
+
+    def status(self, pdf_id: int) -> Optional[dict]:
+        """PDF的OCR进度（页数统计和最近一次任务）"""
+        db = SessionLocal()
+        try:
+            pdf = db.query(PDF.id, PDF.is_scanned, PDF.page_count).filter(PDF.id == pdf_id).first()
+            if not pdf:
+                return None
+            pages_ocr = db.query(PDFPageText.id).filter(
+                PDFPageText.pdf_id == blob_store.owner_id(pdf_id, db),
+                PDFPageText.source == "ocr"
+            ).count()
+            job = job_queue.latest_job(db, pdf_id, "ocr")
+        finally:
+            db.close()
+
+        return {
+            "pdf_id": pdf.id,
+            "is_scanned": pdf.is_scanned,
+            "available": self.available,
+            "page_count": pdf.page_count,
+            "pages_ocr": pages_ocr,
+            "pages_pending": len(self.pending_pages(pdf_id)),
+            "job": job
+        }
+
+    async def run(self, pdf_id: int, report) -> dict:
+        """
+        后台任务：并行识别待处理的页
+
+        Args:
+            pdf_id: PDF记录ID
+            report: 进度回调
+
+        Returns:
+            识别结果统计
+
+        Raises:
+            RuntimeError: 部分页识别失败（已完成的页已存库，任务重试时继续）
+        """
+        # 识别结果写入页文本所在的owner记录
+        pdf_id = await asyncio.to_thread(blob_store.owner_id, pdf_id) or pdf_id
+        pdf_path = await asyncio.to_thread(self._pdf_path, pdf_id)
+        pages = await asyncio.to_thread(self.pending_pages, pdf_id)
+        if not pages:
+            return {"pages": 0}
+
+        limit = asyncio.Semaphore(settings.OCR_CONCURRENCY)
+        done = 0
+        failed = []
+        report(0, f"待识别 {len(pages)} 页")
+
+        async def recognize(page_number: int):
+            nonlocal done
+            try:
+                async with limit:
+                    text = await cpu_pool.run(
+                        pdf_workers.ocr_page,
+                        pdf_path, page_number, settings.OCR_DPI, settings.OCR_LANGUAGES,
+                        settings.POPPLER_PATH, settings.TESSERACT_CMD,
+                        kind="ocr",
+                        timeout=settings.OCR_PAGE_TIMEOUT
+                    )
+                await asyncio.to_thread(self._store_page, pdf_id, page_number, text)
+            except Exception as e:
+                failed.append(page_number)
+                print(f"OCR失败 (PDF {pdf_id}, 第{page_number}页): {str(e)}")
+                return
+            done += 1
+            report(95 * done // len(pages), f"已识别 {done}/{len(pages)} 页")
+
+        await asyncio.gather(*(recognize(page) for page in pages))
+
+        # 即使部分页失败也更新索引，已识别的页立即可用
+        report(95, "正在更新索引")
+        await asyncio.to_thread(self._reindex, pdf_id)
+        if failed:
+            raise RuntimeError(f"OCR failed on {len(failed)} page(s): {failed[:10]}")
+        return {"pages": done}
+
+    def _scanned_pdf_ids(self) -> List[int]:
+        db = SessionLocal()
+        try:
+            return [
+                pdf_id for (pdf_id,) in db.query(PDF.id).filter(
+                    PDF.is_scanned.is_(True),
+                    PDF.id.in_(blob_store.owner_ids())
+                )
+            ]
+        finally:
+            db.close()
+
+    def _pdf_path(self, pdf_id: int) -> str:
+        db = SessionLocal()
+        try:
+            pdf = db.query(PDF.file_path).filter(PDF.id == pdf_id).first()
+            if not pdf:
+                raise ValueError("PDF not found")
+            return pdf.file_path
+        finally:
+            db.close()
+
+    def _store_page(self, pdf_id: int, page_number: int, text: str):
+        db = SessionLocal()
+        try:
+            page = db.query(PDFPageText).filter(
+                PDFPageText.pdf_id == pdf_id,
+                PDFPageText.page_number == page_number
+            ).first() or PDFPageText(pdf_id=pdf_id, page_number=page_number)
+            page.text = text
+            page.char_count = len(text.strip())
+            page.source = "ocr"
+            db.add(page)
+            db.commit()
+        finally:
+            db.close()
+
+    def _reindex(self, pdf_id: int):
+        db = SessionLocal()
+        try:
+            search_service.index_pages(db, pdf_id)
+            db.commit()
+        finally:
+            db.close()
+        text_index.notify_completed(pdf_id)
+
+
+ocr_pipeline = OCRPipeline()
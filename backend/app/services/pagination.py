@@ -0,0 +1,69 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Sequence
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    把排序键编码为不透明的游标字符串
+
+    Args:
+        *values: 最后一条记录的排序键（日期时间按ISO格式保存）
+
+    Returns:
+        URL安全的base64字符串
+    """
+    payload = [
+        {"dt": value.isoformat()} if isinstance(value, datetime) else value
+        for value in values
+    ]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """
+    解码游标
+
+    Args:
+        cursor: encode_cursor 生成的字符串
+        size: 期望的排序键个数
+
+    Returns:
+        排序键列表
+
+    Raises:
+        ValueError: 游标格式不正确
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(payload, list) or len(payload) != size:
+        raise ValueError("Invalid cursor")
+    return [
+        datetime.fromisoformat(value["dt"]) if isinstance(value, dict) and "dt" in value else value
+        for value in payload
+    ]
+
+
+def keyset_filter(columns: Sequence, values: Sequence, descending: bool = True):
+    """
+    生成"排在游标之后"的过滤条件：(c1, c2, ...) < (v1, v2, ...)（升序时为 >）
+
+    Args:
+        columns: 排序列（与ORDER BY顺序一致，最后一列应唯一）
+        values: 游标中的排序键
+        descending: 是否为降序排列
+
+    Returns:
+        SQLAlchemy过滤表达式
+    """
+    clauses = []
+    for index, (column, value) in enumerate(zip(columns, values)):
+        beyond = column < value if descending else column > value
+        equal_prefix = [columns[i] == values[i] for i in range(index)]
+        clauses.append(and_(*equal_prefix, beyond))
+    return or_(*clauses)
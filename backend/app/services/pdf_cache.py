@@ -0,0 +1,146 @@
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+from app.config import settings
+
+
+class PDFBase64Cache:
+    """PDF base64编码缓存 - 按内容哈希寻址，按总字节数LRU淘汰"""
+
+    def __init__(self, max_bytes: int = settings.PDF_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._total_bytes = 0
+        # (路径, mtime, size) -> 内容哈希，避免每次命中都重新读取文件计算哈希
+        self._digests: dict = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _file_signature(self, pdf_path: str) -> Tuple[str, int, int]:
+        stat = os.stat(pdf_path)
+        return (os.path.abspath(pdf_path), stat.st_mtime_ns, stat.st_size)
+
+    def content_hash(self, pdf_path: str) -> str:
+        """
+        获取PDF文件的SHA-256内容哈希（按mtime/size记忆）
+
+        Args:
+            pdf_path: PDF文件路径
+
+        Returns:
+            十六进制哈希字符串
+        """
+        signature = self._file_signature(pdf_path)
+        with self._lock:
+            digest = self._digests.get(signature)
+        if digest:
+            return digest
+
+        sha256 = hashlib.sha256()
+        with open(pdf_path, "rb") as pdf_file:
+            for chunk in iter(lambda: pdf_file.read(1024 * 1024), b""):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+
+        with self._lock:
+            # 同一路径的旧签名已失效，一并清理
+            for stale in [key for key in self._digests if key[0] == signature[0]]:
+                del self._digests[stale]
+            self._digests[signature] = digest
+        return digest
+
+    def remember_hash(self, pdf_path: str, digest: str):
+        """登记已知的内容哈希（如上传时边写边算出的哈希），省去首次读取时的重新计算"""
+        signature = self._file_signature(pdf_path)
+        with self._lock:
+            self._digests[signature] = digest
+
+    def get_or_encode(self, key: str, loader: Callable[[], bytes]) -> str:
+        """
+        按缓存键获取base64字符串，未命中时调用loader读取原始字节并编码
+
+        Args:
+            key: 缓存键（内容哈希，或内容哈希加切片范围）
+            loader: 返回原始字节的函数
+
+        Returns:
+            base64编码字符串
+        """
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        encoded = base64.b64encode(loader()).decode('utf-8')
+        self._put(key, encoded)
+        return encoded
+
+    def get_pdf_base64(self, pdf_path: str) -> str:
+        """获取整份PDF的base64编码"""
+        digest = self.content_hash(pdf_path)
+
+        def load() -> bytes:
+            with open(pdf_path, "rb") as pdf_file:
+                return pdf_file.read()
+
+        return self.get_or_encode(digest, load)
+
+    def _put(self, key: str, encoded: str):
+        size = len(encoded)
+        if size > self.max_bytes:
+            # 单个条目超过上限时不缓存
+            return
+
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = encoded
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, pdf_path: Optional[str] = None):
+        """清除缓存；指定路径时只清除该文件相关的条目"""
+        with self._lock:
+            if pdf_path is None:
+                self._entries.clear()
+                self._digests.clear()
+                self._total_bytes = 0
+                return
+
+            path = os.path.abspath(pdf_path)
+            digests = {d for key, d in self._digests.items() if key[0] == path}
+            for key in [k for k in self._digests if k[0] == path]:
+                del self._digests[key]
+            # 其他路径仍引用同一内容时保留缓存条目
+            digests -= set(self._digests.values())
+            for key in [k for k in self._entries if k.split(":")[0] in digests]:
+                self._total_bytes -= len(self._entries.pop(key))
+
+    def stats(self) -> dict:
+        """缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+# 进程内共享实例
+pdf_cache = PDFBase64Cache()
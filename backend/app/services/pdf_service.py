@@ -1,8 +1,13 @@
+import asyncio
+import hashlib
 import os
-import PyPDF2
-from typing import Optional
+from typing import Callable, Optional, Tuple
 from fastapi import UploadFile, HTTPException
 from app.config import settings
+from app.services import pdf_workers
+from app.services.cpu_pool import cpu_pool, PoolBusyError, TaskTimeoutError
+from app.services.pdf_cache import pdf_cache
+from app.services.upload_limit import too_large_detail
 import uuid
 
 class PDFService:
@@ -12,49 +17,83 @@ class PDFService:
         self.upload_dir = settings.UPLOAD_DIR
         os.makedirs(self.upload_dir, exist_ok=True)
 
-    async def save_pdf(self, file: UploadFile) -> dict:
+    async def save_pdf(self, file: UploadFile, find_blob: Optional[Callable[[str], Optional[dict]]] = None) -> dict:
         """
         保存上传的PDF文件
 
         Args:
             file: 上传的文件
+            find_blob: 按内容哈希查找已存储文件的函数（可选），命中时返回其文件信息，
+                本次上传的临时文件被丢弃，复用已有文件
 
         Returns:
-            文件信息字典
+            文件信息字典（复用已有文件时 deduplicated 为 True）
         """
         # 验证文件类型
         if not file.filename.endswith('.pdf'):
             raise HTTPException(status_code=400, detail="只支持PDF文件")
 
-        # 验证文件大小
-        content = await file.read()
-        if len(content) > settings.MAX_FILE_SIZE:
-            raise HTTPException(status_code=400, detail="文件过大（最大50MB）")
-
         # 生成唯一文件名
         file_id = str(uuid.uuid4())
         filename = f"{file_id}.pdf"
         file_path = os.path.join(self.upload_dir, filename)
+        temp_path = os.path.join(self.upload_dir, f".{file_id}.part")
+
+        # 分块写入临时文件，边写边计算哈希并检查大小，内存占用与文件大小无关
+        sha256 = hashlib.sha256()
+        file_size = 0
+        try:
+            with open(temp_path, "wb") as f:
+                while True:
+                    chunk = await file.read(settings.UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    file_size += len(chunk)
+                    if file_size > settings.MAX_FILE_SIZE:
+                        raise HTTPException(status_code=413, detail=too_large_detail())
+                    sha256.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+
+            content_hash = sha256.hexdigest()
+            existing = find_blob(content_hash) if find_blob else None
+            if existing:
+                # 内容相同的文件已存在，复用已有文件及其元数据
+                os.remove(temp_path)
+                return {
+                    "id": file_id,
+                    "original_filename": file.filename,
+                    "file_size": file_size,
+                    "content_hash": content_hash,
+                    "deduplicated": True,
+                    **existing
+                }
 
-        # 保存文件
-        with open(file_path, "wb") as f:
-            f.write(content)
+            # 提取PDF元数据（CPU密集，在进程池中执行）
+            metadata = await self._extract_pdf_metadata(temp_path)
 
-        # 提取PDF元数据
-        metadata = self._extract_pdf_metadata(file_path)
+            # 原子重命名到最终路径
+            os.replace(temp_path, file_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        pdf_cache.remember_hash(file_path, content_hash)
 
         return {
             "id": file_id,
             "filename": filename,
             "original_filename": file.filename,
             "file_path": file_path,
-            "file_size": len(content),
+            "file_size": file_size,
+            "content_hash": content_hash,
+            "deduplicated": False,
             **metadata
         }
 
-    def _extract_pdf_metadata(self, file_path: str) -> dict:
+    async def _extract_pdf_metadata(self, file_path: str) -> dict:
         """
-        提取PDF元数据
+        提取PDF元数据（在共享进程池中解析，超时的子进程会被终止）
 
         Args:
             file_path: PDF文件路径
@@ -63,25 +102,86 @@ class PDFService:
             元数据字典
         """
         try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                page_count = len(pdf_reader.pages)
+            return await cpu_pool.run(
+                pdf_workers.extract_metadata, file_path,
+                kind="metadata",
+                timeout=settings.PDF_PARSE_TIMEOUT
+            )
+        except PoolBusyError:
+            raise HTTPException(status_code=503, detail="服务繁忙，请稍后重试")
+        except TaskTimeoutError:
+            raise HTTPException(status_code=400, detail="PDF解析超时，文件可能已损坏")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"PDF解析失败: {str(e)}")
+
+    @staticmethod
+    def page_window(page_count: int, page_num: int, window: int) -> Tuple[int, int]:
+        """
+        计算以指定页为中心的页码窗口
 
-                # 尝试提取文本以判断是否为扫描版PDF
-                total_text = ""
-                for page in pdf_reader.pages[:3]:  # 只检查前3页
-                    text = page.extract_text()
-                    total_text += text
+        Args:
+            page_count: 总页数
+            page_num: 中心页码（从1开始）
+            window: 前后各包含的页数
 
-                # 如果前3页的文本总长度很少，可能是扫描版PDF
-                is_scanned = len(total_text.strip()) < 100
+        Returns:
+            (起始页, 结束页)，均从1开始且包含两端
+        """
+        return pdf_workers.page_window(page_count, page_num, window)
 
-                return {
-                    "page_count": page_count,
-                    "is_scanned": is_scanned
-                }
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"PDF解析失败: {str(e)}")
+    def slice_pages(self, file_path: str, page_num: int, window: int) -> Tuple[bytes, int, int]:
+        """
+        截取指定页及其前后若干页为新的PDF（在进程池中执行，供线程中调用）
+
+        Args:
+            file_path: PDF文件路径
+            page_num: 中心页码（从1开始）
+            window: 前后各包含的页数
+
+        Returns:
+            (新PDF的字节内容, 起始页, 结束页)
+        """
+        return cpu_pool.run_sync(
+            pdf_workers.slice_pages, file_path, page_num, window,
+            kind="slice",
+            timeout=settings.PDF_PARSE_TIMEOUT
+        )
+
+    def slice_range(self, file_path: str, start: int, end: int) -> bytes:
+        """
+        截取指定页码范围为新的PDF（在进程池中执行，供线程中调用）
+
+        Args:
+            file_path: PDF文件路径
+            start: 起始页（从1开始）
+            end: 结束页（包含，超出总页数时截断）
+
+        Returns:
+            新PDF的字节内容
+        """
+        return cpu_pool.run_sync(
+            pdf_workers.slice_range, file_path, start, end,
+            kind="slice",
+            timeout=settings.PDF_PARSE_TIMEOUT
+        )
+
+    def extract_text_window(self, file_path: str, page_num: int, window: int) -> Tuple[str, int, int]:
+        """
+        提取指定页及其前后若干页的文本（在进程池中执行，供线程中调用）
+
+        Args:
+            file_path: PDF文件路径
+            page_num: 中心页码（从1开始）
+            window: 前后各包含的页数
+
+        Returns:
+            (带页码标记的文本, 起始页, 结束页)
+        """
+        return cpu_pool.run_sync(
+            pdf_workers.extract_text_window, file_path, page_num, window,
+            kind="text_window",
+            timeout=settings.PDF_PARSE_TIMEOUT
+        )
 
     def delete_pdf(self, file_path: str) -> bool:
         """
@@ -94,6 +194,7 @@ class PDFService:
             是否删除成功
         """
         try:
+            pdf_cache.invalidate(file_path)
             if os.path.exists(file_path):
                 os.remove(file_path)
                 return True
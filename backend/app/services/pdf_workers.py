@@ -0,0 +1,207 @@
+"""
+在子进程中执行的PDF CPU密集任务
+
+本模块不导入应用配置和数据库，子进程（spawn）启动时只加载这里用到的库；
+函数参数和返回值都需可pickle。
+"""
+import io
+import os
+from typing import List, Optional, Tuple
+import PyPDF2
+
+
+def worker_main(conn):
+    """进程池子进程的主循环：接收 (函数, 参数)，返回 (是否成功, 结果或异常)，收到None时退出"""
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        fn, args = task
+        try:
+            conn.send((True, fn(*args)))
+        except BaseException as e:
+            try:
+                conn.send((False, e))
+            except Exception:
+                # 异常对象无法pickle时只返回描述
+                conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+def page_window(page_count: int, page_num: int, window: int) -> Tuple[int, int]:
+    """
+    计算以指定页为中心的页码窗口
+
+    Args:
+        page_count: 总页数
+        page_num: 中心页码（从1开始）
+        window: 前后各包含的页数
+
+    Returns:
+        (起始页, 结束页)，均从1开始且包含两端
+    """
+    page_num = min(max(page_num, 1), page_count)
+    return max(1, page_num - window), min(page_count, page_num + window)
+
+
+def extract_metadata(file_path: str) -> dict:
+    """提取页数，并根据前3页的文本量判断是否为扫描版"""
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        page_count = len(pdf_reader.pages)
+
+        total_text = ""
+        for page in pdf_reader.pages[:3]:
+            total_text += page.extract_text()
+
+        # 如果前3页的文本总长度很少，可能是扫描版PDF
+        return {
+            "page_count": page_count,
+            "is_scanned": len(total_text.strip()) < 100
+        }
+
+
+def extract_page_texts(file_path: str, start: int = 1, end: Optional[int] = None) -> List[str]:
+    """逐页提取文本层（页码从1开始、包含两端，结束页超出总页数时截断；单页解析失败时该页为空字符串）"""
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        pages = pdf_reader.pages
+        end = len(pages) if end is None else min(end, len(pages))
+        texts = []
+        for index in range(start - 1, end):
+            try:
+                texts.append(pages[index].extract_text() or "")
+            except Exception:
+                texts.append("")
+        return texts
+
+
+def extract_text_window(file_path: str, page_num: int, window: int) -> Tuple[str, int, int]:
+    """提取指定页及其前后若干页的文本，返回 (带页码标记的文本, 起始页, 结束页)"""
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        start, end = page_window(len(pdf_reader.pages), page_num, window)
+
+        parts = []
+        for index in range(start - 1, end):
+            text = pdf_reader.pages[index].extract_text() or ""
+            parts.append(f"[第{index + 1}页]\n{text.strip()}")
+        return "\n\n".join(parts), start, end
+
+
+def slice_pages(file_path: str, page_num: int, window: int) -> Tuple[bytes, int, int]:
+    """截取指定页及其前后若干页为新的PDF，返回 (字节内容, 起始页, 结束页)"""
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        start, end = page_window(len(pdf_reader.pages), page_num, window)
+        return _write_pages(pdf_reader, start, end), start, end
+
+
+def slice_range(file_path: str, start: int, end: int) -> bytes:
+    """截取指定页码范围为新的PDF（结束页超出总页数时截断）"""
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return _write_pages(pdf_reader, max(start, 1), min(end, len(pdf_reader.pages)))
+
+
+def _write_pages(pdf_reader: PyPDF2.PdfReader, start: int, end: int) -> bytes:
+    pdf_writer = PyPDF2.PdfWriter()
+    for index in range(start - 1, end):
+        pdf_writer.add_page(pdf_reader.pages[index])
+
+    output = io.BytesIO()
+    pdf_writer.write(output)
+    return output.getvalue()
+
+
+def render_page(
+    pdf_path: str,
+    page_number: int,
+    dpi: int,
+    fmt: str,
+    output_path: str,
+    quality: int = 80,
+    poppler_path: Optional[str] = None
+) -> int:
+    """
+    把PDF的一页渲染为图片文件（pdf2image / poppler）
+
+    Args:
+        pdf_path: PDF文件路径
+        page_number: 页码（从1开始）
+        dpi: 渲染分辨率
+        fmt: 图片格式（png / jpeg）
+        output_path: 输出文件路径（先写临时文件再原子替换）
+        quality: JPEG质量
+        poppler_path: poppler可执行文件目录（可选）
+
+    Returns:
+        输出文件字节数
+    """
+    from pdf2image import convert_from_path
+
+    images = convert_from_path(
+        pdf_path,
+        dpi=dpi,
+        first_page=page_number,
+        last_page=page_number,
+        poppler_path=poppler_path
+    )
+    if not images:
+        raise ValueError(f"Page {page_number} could not be rendered")
+    image = images[0]
+
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        if fmt == "jpeg":
+            image.convert("RGB").save(temp_path, format="JPEG", quality=quality, optimize=True)
+        else:
+            image.save(temp_path, format="PNG", optimize=True)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return os.path.getsize(output_path)
+
+
+def ocr_page(
+    pdf_path: str,
+    page_number: int,
+    dpi: int,
+    languages: str,
+    poppler_path: Optional[str] = None,
+    tesseract_cmd: Optional[str] = None
+) -> str:
+    """
+    渲染PDF的一页并用Tesseract识别文字
+
+    Args:
+        pdf_path: PDF文件路径
+        page_number: 页码（从1开始）
+        dpi: 识别用的渲染分辨率
+        languages: Tesseract语言（如 chi_sim+eng）
+        poppler_path: poppler可执行文件目录（可选）
+        tesseract_cmd: tesseract可执行文件路径（可选）
+
+    Returns:
+        识别出的文本
+    """
+    import pytesseract
+    from pdf2image import convert_from_path
+
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+    images = convert_from_path(
+        pdf_path,
+        dpi=dpi,
+        first_page=page_number,
+        last_page=page_number,
+        grayscale=True,
+        poppler_path=poppler_path
+    )
+    if not images:
+        raise ValueError(f"Page {page_number} could not be rendered")
+    return pytesseract.image_to_string(images[0], lang=languages)
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from app.config import settings
+from app.database.models import PDF, SessionLocal
+from app.services.http_client import gemini_http
+from app.services.single_flight import single_flight
+
+
+class ProviderFileService:
+    """向模型服务商上传PDF并复用文件句柄，避免每次请求都内联整份base64
+
+    上传失败的文件在 PROVIDER_FILE_FAILURE_TTL 秒内直接回退内联模式，服务商故障期间不会每次请求都重新上传。
+    """
+
+    def __init__(self):
+        self._failures: Dict[str, float] = {}  # pdf_path -> 失败记录到期时间（monotonic）
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.upload_failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.PDF_TRANSPORT == "file"
+
+    def _recently_failed(self, pdf_path: str) -> bool:
+        with self._lock:
+            until = self._failures.get(pdf_path)
+            if until is None:
+                return False
+            if until > time.monotonic():
+                return True
+            del self._failures[pdf_path]
+            return False
+
+    def _record_failure(self, pdf_path: str):
+        now = time.monotonic()
+        with self._lock:
+            self.upload_failures += 1
+            # 顺带清理已过期的记录，失败表只包含最近失败的文件
+            for path in [path for path, until in self._failures.items() if until <= now]:
+                del self._failures[path]
+            self._failures[pdf_path] = now + settings.PROVIDER_FILE_FAILURE_TTL
+
+    def _load_handle(self, pdf_path: str) -> Optional[str]:
+        """读取数据库中仍在有效期内的文件句柄"""
+        db = SessionLocal()
+        try:
+            pdf = db.query(PDF).filter(PDF.file_path == pdf_path).order_by(PDF.id).first()
+            if not pdf or not pdf.provider_file_id:
+                return None
+            margin = timedelta(seconds=settings.PROVIDER_FILE_REFRESH_MARGIN)
+            if pdf.provider_file_expires_at and pdf.provider_file_expires_at - margin <= datetime.utcnow():
+                return None
+            return pdf.provider_file_id
+        finally:
+            db.close()
+
+    def _store_handle(self, pdf_path: str, file_id: Optional[str], expires_at: Optional[datetime]):
+        """把文件句柄写回所有引用该文件的PDF记录"""
+        db = SessionLocal()
+        try:
+            db.query(PDF).filter(PDF.file_path == pdf_path).update({
+                PDF.provider_file_id: file_id,
+                PDF.provider_file_uploaded_at: datetime.utcnow() if file_id else None,
+                PDF.provider_file_expires_at: expires_at
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _upload(self, pdf_path: str) -> Optional[str]:
+        """上传文件到服务商，返回文件ID"""
+        with open(pdf_path, "rb") as pdf_file:
+            content = await asyncio.to_thread(pdf_file.read)
+
+        data = await gemini_http.post_multipart(
+            "/v1/files",
+            files={"file": (os.path.basename(pdf_path), content, "application/pdf")},
+            data={"purpose": settings.PROVIDER_FILE_PURPOSE}
+        )
+        file_id = data.get("id")
+        if not file_id:
+            raise ValueError("Provider file upload returned no file id")
+
+        if data.get("expires_at"):
+            expires_at = datetime.utcfromtimestamp(data["expires_at"])
+        else:
+            expires_at = datetime.utcnow() + timedelta(seconds=settings.PROVIDER_FILE_TTL)
+
+        await asyncio.to_thread(self._store_handle, pdf_path, file_id, expires_at)
+        return file_id
+
+    async def get_file_id(self, pdf_path: str) -> Optional[str]:
+        """
+        获取PDF对应的服务商文件ID，不存在或已过期时重新上传
+
+        Args:
+            pdf_path: PDF文件路径
+
+        Returns:
+            文件ID；未启用文件模式、上传失败或最近上传失败时返回None（调用方回退到内联模式）
+        """
+        if not self.enabled:
+            return None
+
+        file_id = await asyncio.to_thread(self._load_handle, pdf_path)
+        if file_id:
+            return file_id
+        if self._recently_failed(pdf_path):
+            return None
+
+        # 同一文件并发请求只上传一次
+        return await single_flight.do(f"provider-file:{pdf_path}", lambda: self._load_or_upload(pdf_path))
+
+    async def _load_or_upload(self, pdf_path: str) -> Optional[str]:
+        file_id = await asyncio.to_thread(self._load_handle, pdf_path)
+        if file_id:
+            return file_id
+        try:
+            file_id = await self._upload(pdf_path)
+        except Exception as e:
+            self._record_failure(pdf_path)
+            print(f"上传文件到服务商失败，{settings.PROVIDER_FILE_FAILURE_TTL}秒内回退内联模式: {str(e)}")
+            return None
+        with self._lock:
+            self.uploads += 1
+        return file_id
+
+    async def invalidate(self, pdf_path: str):
+        """句柄被服务商拒绝（过期/删除）时清除，下次请求会重新上传"""
+        await asyncio.to_thread(self._store_handle, pdf_path, None, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "uploads": self.uploads,
+                "upload_failures": self.upload_failures,
+                "failing_files": len(self._failures)
+            }
+
+
+provider_files = ProviderFileService()
@@ -0,0 +1,212 @@
+import asyncio
+import importlib.util
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+from app.config import settings
+from app.database.models import PDF, SessionLocal
+from app.services import pdf_workers
+from app.services.cpu_pool import cpu_pool
+from app.services.pdf_cache import pdf_cache
+from app.services.single_flight import single_flight
+
+MEDIA_TYPES = {"png": "image/png", "jpeg": "image/jpeg"}
+
+
+class DiskLRUCache:
+    """按总字节数限制的磁盘LRU缓存 - 最近访问顺序保存在内存中，并同步到文件mtime，重启后按mtime恢复
+
+    get/add 会访问磁盘（首次调用时遍历缓存目录），异步代码中应通过 asyncio.to_thread 调用。
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def get(self, key: str) -> Optional[str]:
+        """命中时返回文件路径并标记为最近使用"""
+        self._load()
+        path = self.path(key)
+        with self._lock:
+            if key not in self._entries or not os.path.exists(path):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def add(self, key: str, size: int):
+        """登记已写入缓存目录的文件，超出上限时淘汰最久未用的文件"""
+        self._load()
+        evicted = []
+        with self._lock:
+            self._total_bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._total_bytes -= old_size
+                self.evictions += 1
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self.path(old_key))
+            except OSError:
+                pass
+
+    def _load(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            found = []
+            for directory, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    path = os.path.join(directory, filename)
+                    if filename.endswith(".tmp"):
+                        # 上次进程中断留下的临时文件
+                        os.remove(path)
+                        continue
+                    stat = os.stat(path)
+                    found.append((stat.st_mtime, os.path.relpath(path, self.root), stat.st_size))
+            for _, key, size in sorted(found):
+                self._entries[key] = size
+                self._total_bytes += size
+            self._loaded = True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+class PageRenderer:
+    """服务端页面渲染 - 在共享进程池中把PDF页渲染为图片，结果按（内容哈希、页码、DPI、格式）缓存在磁盘上
+
+    内容相同的PDF共用渲染结果；同一页的并发请求合并为一次渲染。
+    """
+
+    def __init__(self):
+        os.makedirs(settings.RENDER_CACHE_DIR, exist_ok=True)
+        self.cache = DiskLRUCache(settings.RENDER_CACHE_DIR, settings.RENDER_CACHE_MAX_BYTES)
+        self.renders = 0
+
+    @property
+    def available(self) -> bool:
+        """pdf2image和poppler是否可用"""
+        if importlib.util.find_spec("pdf2image") is None:
+            return False
+        if settings.POPPLER_PATH:
+            return os.path.isdir(settings.POPPLER_PATH)
+        return shutil.which("pdftoppm") is not None
+
+    @staticmethod
+    def normalize_dpi(dpi: int) -> int:
+        """限制DPI范围并按步长取整，提高缓存命中率"""
+        step = max(settings.RENDER_DPI_STEP, 1)
+        dpi = max(settings.RENDER_MIN_DPI, min(dpi, settings.RENDER_MAX_DPI))
+        return max(step, round(dpi / step) * step)
+
+    async def render(self, pdf_id: int, page_number: int, dpi: int, fmt: str) -> Tuple[str, str]:
+        """
+        获取渲染后的页面图片，未缓存时在进程池中渲染
+
+        Args:
+            pdf_id: PDF记录ID
+            page_number: 页码（从1开始）
+            dpi: 分辨率（会被规范化）
+            fmt: 图片格式（png / jpeg）
+
+        Returns:
+            (图片路径, 缓存键, PDF内容哈希)
+
+        Raises:
+            ValueError: PDF不存在或页码超出范围
+        """
+        pdf_path, page_count, content_hash = await asyncio.to_thread(self._pdf_info, pdf_id)
+        if not 1 <= page_number <= page_count:
+            raise ValueError("Page out of range")
+
+        dpi = self.normalize_dpi(dpi)
+        key = os.path.join(content_hash[:2], content_hash, f"{page_number}-{dpi}.{fmt}")
+        path = await asyncio.to_thread(self.cache.get, key)
+        if path:
+            return path, key, content_hash
+
+        await single_flight.do(
+            f"render:{key}",
+            lambda: self._render(pdf_path, page_number, dpi, fmt, key)
+        )
+        return self.cache.path(key), key, content_hash
+
+    async def prerender_thumbnails(self, pdf_id: int, report) -> dict:
+        """后台任务：渲染所有页的缩略图"""
+        _, page_count, _ = await asyncio.to_thread(self._pdf_info, pdf_id)
+        limit = asyncio.Semaphore(settings.RENDER_WORKERS)
+        done = 0
+
+        async def thumbnail(page_number: int):
+            nonlocal done
+            async with limit:
+                await self.render(pdf_id, page_number, settings.RENDER_THUMBNAIL_DPI, "jpeg")
+            done += 1
+            report(100 * done // page_count, f"已渲染 {done}/{page_count} 页缩略图")
+
+        await asyncio.gather(*(thumbnail(page) for page in range(1, page_count + 1)))
+        return {"pages": page_count, "dpi": self.normalize_dpi(settings.RENDER_THUMBNAIL_DPI)}
+
+    def stats(self) -> dict:
+        return {
+            "available": self.available,
+            "renders": self.renders,
+            "cache": self.cache.stats()
+        }
+
+    async def _render(self, pdf_path: str, page_number: int, dpi: int, fmt: str, key: str):
+        output_path = self.cache.path(key)
+        await asyncio.to_thread(os.makedirs, os.path.dirname(output_path), exist_ok=True)
+        size = await cpu_pool.run(
+            pdf_workers.render_page,
+            pdf_path, page_number, dpi, fmt, output_path,
+            settings.RENDER_JPEG_QUALITY, settings.POPPLER_PATH,
+            kind="render",
+            timeout=settings.RENDER_TIMEOUT
+        )
+        await asyncio.to_thread(self.cache.add, key, size)
+        self.renders += 1
+
+    def _pdf_info(self, pdf_id: int) -> Tuple[str, int, str]:
+        db = SessionLocal()
+        try:
+            pdf = db.query(PDF.file_path, PDF.page_count, PDF.content_hash).filter(PDF.id == pdf_id).first()
+            if not pdf:
+                raise ValueError("PDF not found")
+            content_hash = pdf.content_hash or pdf_cache.content_hash(pdf.file_path)
+            return pdf.file_path, pdf.page_count, content_hash
+        finally:
+            db.close()
+
+
+page_renderer = PageRenderer()
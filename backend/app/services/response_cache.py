@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import json
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from sqlalchemy import bindparam, func, select, update
+from app.config import settings
+from app.database.models import AIResponseCache, SessionLocal
+
+
+def normalize_text(value: Optional[str]) -> str:
+    """规范化选中文本：合并空白，避免换行/空格差异导致缓存未命中"""
+    return " ".join((value or "").split())
+
+
+class ResponseCache:
+    """确定性AI操作的持久化回复缓存 - 支持TTL、按总字节数和条目数淘汰、命中统计
+
+    命中只读数据库；命中次数和访问时间先记录在内存，每 RESPONSE_CACHE_FLUSH_INTERVAL 秒
+    合并为一次批量UPDATE（与 access_tracker 相同），淘汰前会先写入，按最近访问排序不受滞后影响。
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.flushes = 0
+        self._writes = 0
+        self._pending_hits: Dict[str, Tuple[int, datetime]] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.RESPONSE_CACHE_ENABLED
+
+    def make_key(self, action: str, model: str, pdf_hash: str, **params) -> str:
+        """
+        生成缓存键
+
+        Args:
+            action: 操作类型
+            model: 模型名
+            pdf_hash: PDF内容哈希
+            **params: 影响回复的其他参数（选中文本、页码、目标语言等）
+
+        Returns:
+            SHA-256十六进制字符串
+        """
+        payload = {
+            "action": action,
+            "model": model,
+            "pdf": pdf_hash,
+            "prompt_version": settings.PROMPT_VERSION,
+            **{key: normalize_text(value) if isinstance(value, str) else value for key, value in params.items()}
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def get(self, key: str) -> Optional[str]:
+        """读取未过期的缓存回复，命中次数和访问时间记录在内存中批量写入"""
+        db = SessionLocal()
+        try:
+            entry = db.query(AIResponseCache.response, AIResponseCache.created_at).filter(
+                AIResponseCache.cache_key == key
+            ).first()
+            now = datetime.utcnow()
+            if entry and entry.created_at + timedelta(seconds=settings.RESPONSE_CACHE_TTL) > now:
+                with self._lock:
+                    self.hits += 1
+                    count, _ = self._pending_hits.get(key, (0, now))
+                    self._pending_hits[key] = (count + 1, now)
+                return entry.response
+
+            if entry:
+                # 已过期
+                db.query(AIResponseCache).filter(
+                    AIResponseCache.cache_key == key
+                ).delete(synchronize_session=False)
+                db.commit()
+            with self._lock:
+                self.misses += 1
+            return None
+        finally:
+            db.close()
+
+    def flush(self) -> int:
+        """把累积的命中次数和访问时间一次性写入数据库，返回写入的条目数"""
+        with self._lock:
+            batch, self._pending_hits = self._pending_hits, {}
+        if not batch:
+            return 0
+
+        table = AIResponseCache.__table__
+        db = SessionLocal()
+        try:
+            db.connection().execute(
+                update(table)
+                .where(table.c.cache_key == bindparam("key"))
+                .values(
+                    hit_count=func.coalesce(table.c.hit_count, 0) + bindparam("hits"),
+                    last_accessed_at=bindparam("accessed_at")
+                ),
+                [
+                    {"key": key, "hits": hits, "accessed_at": accessed_at}
+                    for key, (hits, accessed_at) in batch.items()
+                ]
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            # 写入失败时合并回内存，下个周期重试
+            with self._lock:
+                for key, (hits, accessed_at) in batch.items():
+                    count, latest = self._pending_hits.get(key, (0, accessed_at))
+                    self._pending_hits[key] = (count + hits, max(latest, accessed_at))
+            raise
+        finally:
+            db.close()
+
+        with self._lock:
+            self.flushes += 1
+        return len(batch)
+
+    async def start(self):
+        """启动定期写入命中统计（在应用启动时调用）"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="response-cache-flush")
+
+    async def stop(self):
+        """停止定期写入并写入剩余的命中统计"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.RESPONSE_CACHE_FLUSH_INTERVAL)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                print(f"写入缓存命中统计失败: {str(e)}")
+
+    def put(self, key: str, action: str, model: str, pdf_hash: str, response: str):
+        """写入缓存，必要时淘汰过期和最久未访问的条目"""
+        if not response:
+            return
+        db = SessionLocal()
+        try:
+            entry = db.query(AIResponseCache).filter(AIResponseCache.cache_key == key).first()
+            if entry is None:
+                entry = AIResponseCache(cache_key=key, action=action, model=model, pdf_hash=pdf_hash)
+                db.add(entry)
+            entry.response = response
+            entry.size_bytes = len(response.encode("utf-8"))
+            entry.created_at = datetime.utcnow()
+            entry.last_accessed_at = entry.created_at
+            db.commit()
+
+            with self._lock:
+                self._writes += 1
+                # 每写入若干次做一次淘汰，避免每次写入都统计全表
+                should_evict = self._writes % 100 == 1
+            if should_evict:
+                self._evict(db)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _evict(self, db):
+        # 先写入内存中的访问时间，最近命中的条目不会被当作最久未访问而淘汰
+        self.flush()
+        expired_before = datetime.utcnow() - timedelta(seconds=settings.RESPONSE_CACHE_TTL)
+        removed = db.query(AIResponseCache).filter(
+            AIResponseCache.created_at < expired_before
+        ).delete(synchronize_session=False)
+
+        overflow = db.query(AIResponseCache).count() - settings.RESPONSE_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            oldest = select(AIResponseCache.id).order_by(
+                AIResponseCache.last_accessed_at.asc()
+            ).limit(overflow)
+            removed += db.query(AIResponseCache).filter(
+                AIResponseCache.id.in_(oldest)
+            ).delete(synchronize_session=False)
+
+        excess_bytes = self._total_bytes(db) - settings.RESPONSE_CACHE_MAX_BYTES
+        if excess_bytes > 0:
+            # 从最久未访问的条目开始累加，直到腾出超出的字节数
+            doomed = []
+            rows = db.query(AIResponseCache.id, AIResponseCache.size_bytes).order_by(
+                AIResponseCache.last_accessed_at.asc()
+            ).all()
+            for entry_id, size_bytes in rows:
+                doomed.append(entry_id)
+                excess_bytes -= size_bytes or 0
+                if excess_bytes <= 0:
+                    break
+            for start in range(0, len(doomed), 500):
+                removed += db.query(AIResponseCache).filter(
+                    AIResponseCache.id.in_(doomed[start:start + 500])
+                ).delete(synchronize_session=False)
+
+        db.commit()
+        with self._lock:
+            self.evictions += removed
+
+    @staticmethod
+    def _total_bytes(db) -> int:
+        return db.query(func.coalesce(func.sum(AIResponseCache.size_bytes), 0)).scalar()
+
+    def stats(self) -> dict:
+        """缓存命中统计"""
+        db = SessionLocal()
+        try:
+            entries = db.query(AIResponseCache).count()
+            total_bytes = self._total_bytes(db)
+        finally:
+            db.close()
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": entries,
+                "max_entries": settings.RESPONSE_CACHE_MAX_ENTRIES,
+                "bytes": total_bytes,
+                "max_bytes": settings.RESPONSE_CACHE_MAX_BYTES,
+                "pending_hits": len(self._pending_hits),
+                "flushes": self.flushes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,321 @@
+import re
+from typing import Iterable, List, Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.database.models import PDF, PDFPageText, Annotation, Conversation, Message, SessionLocal, engine
+
+# rowid分区：页文本、注释、消息各占一段，增量更新时按rowid定位而不必扫描全表
+_PAGE_BASE = 1_000_000_000_000
+_ANNOTATION_BASE = 2_000_000_000_000
+_MESSAGE_BASE = 3_000_000_000_000
+_PAGES_PER_PDF = 100_000
+
+# trigram分词要求查询词至少3个字符，更短的词走二元组索引
+_MIN_MATCH_LENGTH = 3
+
+# 按二元组切分的文字（汉字、日文假名、韩文），其余文本交给unicode61按词切分
+_CJK_RUN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+_TOKEN = re.compile(r"\w+")
+
+
+def _bigram_text(content: str) -> str:
+    """
+    把文本中连续的中日韩文字切成相互重叠的二元组，每段末字单独保留
+
+    例如"线性代数" -> "线性 性代 代数 数"：两字查询词对应一个二元组，单字查询词用前缀匹配，
+    每个字都是某个词元的开头。
+    """
+    def expand(match) -> str:
+        run = match.group(0)
+        grams = [run[index:index + 2] for index in range(len(run) - 1)]
+        grams.append(run[-1])
+        return " " + " ".join(grams) + " "
+
+    return _CJK_RUN.sub(expand, content)
+
+
+def _bigram_expression(term: str) -> Optional[str]:
+    """
+    把短查询词转换为二元组索引上的FTS5短语（末个词元按前缀匹配）
+
+    查询词中间的文字段保留末字以对齐索引中的词元顺序，结尾的文字段只取二元组；
+    没有可检索词元（如纯标点）时返回None。
+    """
+    tokens = []
+    position = 0
+    for match in _CJK_RUN.finditer(term):
+        tokens.extend(_TOKEN.findall(term[position:match.start()]))
+        run = match.group(0)
+        tokens.extend(run[index:index + 2] for index in range(len(run) - 1))
+        if len(run) == 1 or match.end() < len(term):
+            tokens.append(run[-1])
+        position = match.end()
+    tokens.extend(_TOKEN.findall(term[position:]))
+    if not tokens:
+        return None
+    return '"' + " ".join(tokens).replace('"', '""') + '" *'
+
+
+class SearchService:
+    """基于SQLite FTS5的全文检索 - 覆盖页文本、注释和聊天消息"""
+
+    @property
+    def enabled(self) -> bool:
+        return engine.dialect.name == "sqlite"
+
+    @staticmethod
+    def _page_rowid(pdf_id: int, page_number: int) -> int:
+        return _PAGE_BASE + pdf_id * _PAGES_PER_PDF + page_number
+
+    def _insert(self, db: Session, rowid: int, content: str, kind: str, ref_id: int,
+                pdf_id: int, page_number: Optional[int]):
+        self._delete_rowids(db, [rowid])
+        db.execute(text(
+            "INSERT INTO search_index (rowid, content, kind, ref_id, pdf_id, page_number) "
+            "VALUES (:rowid, :content, :kind, :ref_id, :pdf_id, :page_number)"
+        ), {
+            "rowid": rowid, "content": content, "kind": kind, "ref_id": ref_id,
+            "pdf_id": pdf_id, "page_number": page_number
+        })
+        db.execute(text(
+            "INSERT INTO search_bigram (rowid, content) VALUES (:rowid, :content)"
+        ), {"rowid": rowid, "content": _bigram_text(content)})
+        db.execute(text(
+            "INSERT INTO search_entries (id, kind, pdf_id) VALUES (:rowid, :kind, :pdf_id)"
+        ), {"rowid": rowid, "kind": kind, "pdf_id": pdf_id})
+
+    def _delete_rows(self, db: Session, rows: Iterable):
+        """删除 (rowid, content) 对应的三张表中的记录；无内容的二元组索引必须用原内容删除"""
+        for rowid, content in rows:
+            db.execute(text(
+                "INSERT INTO search_bigram (search_bigram, rowid, content) VALUES ('delete', :rowid, :content)"
+            ), {"rowid": rowid, "content": _bigram_text(content)})
+            db.execute(text("DELETE FROM search_index WHERE rowid = :rowid"), {"rowid": rowid})
+            db.execute(text("DELETE FROM search_entries WHERE id = :rowid"), {"rowid": rowid})
+
+    def _delete_rowids(self, db: Session, rowids: Iterable[int]):
+        rows = []
+        for rowid in rowids:
+            row = db.execute(text(
+                "SELECT rowid, content FROM search_index WHERE rowid = :rowid"
+            ), {"rowid": rowid}).first()
+            if row:
+                rows.append(row)
+        self._delete_rows(db, rows)
+
+    def index_pages(self, db: Session, pdf_id: int):
+        """重建一个PDF的页文本索引（调用方负责提交）"""
+        if not self.enabled:
+            return
+        start = self._page_rowid(pdf_id, 0)
+        self._delete_rows(db, db.execute(text(
+            "SELECT rowid, content FROM search_index WHERE rowid >= :start AND rowid < :end"
+        ), {"start": start, "end": start + _PAGES_PER_PDF}).fetchall())
+
+        pages = db.query(PDFPageText.page_number, PDFPageText.text).filter(
+            PDFPageText.pdf_id == pdf_id
+        ).all()
+        for page_number, page_text in pages:
+            if page_text and page_text.strip():
+                self._insert(db, self._page_rowid(pdf_id, page_number), page_text,
+                             "page", page_number, pdf_id, page_number)
+
+    def index_annotation(self, db: Session, annotation: Annotation):
+        """新增或更新一条注释的索引（调用方负责提交）"""
+        if not self.enabled:
+            return
+        content = "\n".join(part for part in (annotation.text_content, annotation.note_text) if part)
+        rowid = _ANNOTATION_BASE + annotation.id
+        if content.strip():
+            self._insert(db, rowid, content, "annotation", annotation.id,
+                         annotation.pdf_id, annotation.page_number)
+        else:
+            self._delete_rowids(db, [rowid])
+
+    def remove_annotation(self, db: Session, annotation_id: int):
+        if self.enabled:
+            self._delete_rowids(db, [_ANNOTATION_BASE + annotation_id])
+
+    def index_message(self, db: Session, message: Message, pdf_id: int):
+        """新增一条聊天消息的索引（调用方负责提交）"""
+        if not self.enabled or not message.content:
+            return
+        self._insert(db, _MESSAGE_BASE + message.id, message.content, "message",
+                     message.id, pdf_id, message.page_number)
+
+    def remove_pdf(self, db: Session, pdf_id: int):
+        """删除一个PDF的全部索引（调用方负责提交）"""
+        if not self.enabled:
+            return
+        rowids = [
+            rowid for (rowid,) in db.execute(text(
+                "SELECT id FROM search_entries WHERE pdf_id = :pdf_id"
+            ), {"pdf_id": pdf_id}).fetchall()
+        ]
+        self._delete_rowids(db, rowids)
+
+    def remove_conversation(self, db: Session, conversation_id: int):
+        """删除一个对话中全部消息的索引（调用方负责提交）"""
+        if not self.enabled:
+            return
+        message_ids = [
+            message_id for (message_id,) in
+            db.query(Message.id).filter(Message.conversation_id == conversation_id).all()
+        ]
+        self._delete_rowids(db, [_MESSAGE_BASE + message_id for message_id in message_ids])
+
+    def rebuild_if_empty(self):
+        """
+        索引为空时从已有数据重建（首次启用检索时回填历史数据）
+
+        辅助表为空而主索引有数据时（升级前建立的索引）清空后整体重建。
+        """
+        if not self.enabled:
+            return
+        db = SessionLocal()
+        try:
+            if db.execute(text("SELECT 1 FROM search_entries LIMIT 1")).first():
+                return
+            db.execute(text("DELETE FROM search_index"))
+            db.execute(text("INSERT INTO search_bigram (search_bigram) VALUES ('delete-all')"))
+
+            for (pdf_id,) in db.query(PDFPageText.pdf_id).distinct().all():
+                self.index_pages(db, pdf_id)
+            for annotation in db.query(Annotation).all():
+                self.index_annotation(db, annotation)
+            rows = db.query(Message, Conversation.pdf_id).join(
+                Conversation, Message.conversation_id == Conversation.id
+            ).all()
+            for message, pdf_id in rows:
+                self.index_message(db, message, pdf_id)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _match_expression(terms: List[str]) -> str:
+        # 每个词作为短语加引号，避免用户输入被解析成FTS5语法
+        return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+    def search(
+        self,
+        db: Session,
+        query: str,
+        pdf_id: Optional[int] = None,
+        kind: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0,
+        page_pdf_id: Optional[int] = None
+    ) -> dict:
+        """
+        全文检索
+
+        Args:
+            db: 数据库会话
+            query: 查询字符串（空格分隔的多个词需同时匹配）
+            pdf_id: 只检索指定PDF（可选）
+            kind: 只检索指定类型 page/annotation/message（可选）
+            limit: 每页条数
+            offset: 偏移量
+            page_pdf_id: 指定PDF的页文本所在的记录ID（内容相同的PDF共用一份页索引，默认同 pdf_id）
+
+        Returns:
+            {"results": [...], "has_more": bool}
+        """
+        terms = [term for term in query.split() if term]
+        if not self.enabled or not terms:
+            return {"results": [], "has_more": False}
+
+        match_terms = [term for term in terms if len(term) >= _MIN_MATCH_LENGTH]
+        bigram_terms, scan_terms = [], []
+        for term in terms:
+            if len(term) < _MIN_MATCH_LENGTH:
+                expression = _bigram_expression(term)
+                if expression:
+                    bigram_terms.append((term, expression))
+                else:
+                    scan_terms.append(term)
+
+        joins = []
+        conditions = []
+        params = {"limit": limit + 1, "offset": offset}
+        if match_terms:
+            conditions.append("search_index MATCH :match")
+            params["match"] = self._match_expression(match_terms)
+        if bigram_terms:
+            joins.append("JOIN search_bigram ON search_bigram.rowid = search_index.rowid")
+            conditions.append("search_bigram MATCH :bigram")
+            params["bigram"] = " AND ".join(expression for _, expression in bigram_terms)
+        for index, term in enumerate(scan_terms):
+            # 没有可检索词元的词（如标点）只能在其他条件筛出的记录中做子串匹配
+            conditions.append(f"instr(search_index.content, :term{index}) > 0")
+            params[f"term{index}"] = term
+        if pdf_id is not None or kind:
+            # 过滤条件走 search_entries 上的普通索引，FTS表中的这两列未建索引
+            joins.append("JOIN search_entries ON search_entries.id = search_index.rowid")
+        if pdf_id is not None and page_pdf_id not in (None, pdf_id):
+            # 注释和消息属于记录本身，页文本来自owner记录
+            conditions.append(
+                "(search_entries.pdf_id = :pdf_id OR "
+                "(search_entries.pdf_id = :page_pdf_id AND search_entries.kind = 'page'))"
+            )
+            params["pdf_id"] = pdf_id
+            params["page_pdf_id"] = page_pdf_id
+        elif pdf_id is not None:
+            conditions.append("search_entries.pdf_id = :pdf_id")
+            params["pdf_id"] = pdf_id
+        if kind:
+            conditions.append("search_entries.kind = :kind")
+            params["kind"] = kind
+
+        if match_terms:
+            select = ("snippet(search_index, 0, '<mark>', '</mark>', '…', 24) AS snippet, "
+                      "bm25(search_index) AS score")
+            order = "ORDER BY score"
+        elif bigram_terms:
+            # 二元组索引不保存原文，摘要片段取第一个查询词附近的原文
+            select = ("replace(substr(search_index.content, max(instr(search_index.content, :first) - 40, 1), 120), "
+                      ":first, '<mark>' || :first || '</mark>') AS snippet, bm25(search_bigram) AS score")
+            order = "ORDER BY score"
+            params["first"] = bigram_terms[0][0]
+        else:
+            select = "substr(search_index.content, 1, 120) AS snippet, 0.0 AS score"
+            order = "ORDER BY search_index.rowid DESC"
+
+        rows = db.execute(text(
+            f"SELECT search_index.kind, search_index.ref_id, search_index.pdf_id, search_index.page_number, {select} "
+            f"FROM search_index {' '.join(joins)} WHERE {' AND '.join(conditions)} {order} "
+            f"LIMIT :limit OFFSET :offset"
+        ), params).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        # 按PDF检索时页命中（可能来自owner记录）也归属于所查询的记录
+        hit_pdf_ids = [pdf_id if pdf_id is not None else row.pdf_id for row in rows]
+        pdf_ids = set(hit_pdf_ids)
+        names = dict(
+            db.query(PDF.id, PDF.original_filename).filter(PDF.id.in_(pdf_ids)).all()
+        ) if pdf_ids else {}
+
+        return {
+            "results": [
+                {
+                    "kind": row.kind,
+                    "ref_id": row.ref_id,
+                    "pdf_id": hit_pdf_id,
+                    "pdf_name": names.get(hit_pdf_id),
+                    "page_number": row.page_number,
+                    "snippet": row.snippet,
+                    "score": -row.score if row.score else 0.0  # bm25越小越相关，取反后越大越相关
+                }
+                for row, hit_pdf_id in zip(rows, hit_pdf_ids)
+            ],
+            "has_more": has_more
+        }
+
+
+search_service = SearchService()
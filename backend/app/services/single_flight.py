@@ -0,0 +1,114 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _SharedStream:
+    """一次流式调用的输出缓冲，多个订阅者各自从头重放并继续接收新片段"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def pump(self, start: Callable[[], Awaitable[AsyncIterator[str]]]):
+        try:
+            async for chunk in await start():
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """合并并发的相同AI调用 - 同一键的调用在执行中时，后来者共享它的结果而不是再调用一次模型
+
+    实际调用在独立任务中执行，发起者断开连接不会取消其他等待者的调用。
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._streams: Dict[str, _SharedStream] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行调用；同一键已在执行中时等待其结果
+
+        Args:
+            key: 调用键（相同键视为相同调用）
+            fn: 实际执行调用的函数
+
+        Returns:
+            调用结果（所有等待者共享）
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda finished: self._finish(key, finished))
+        return await asyncio.shield(task)
+
+    def stream(self, key: str, start: Callable[[], Awaitable[AsyncIterator[str]]]) -> AsyncIterator[str]:
+        """
+        流式调用；同一键的流在进行中时，后来者先收到已产出的片段，再与发起者同步接收后续片段
+
+        Args:
+            key: 调用键
+            start: 返回模型输出流的函数
+
+        Returns:
+            逐段产出文本的异步迭代器
+        """
+        shared = self._streams.get(key)
+        if shared is not None:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            shared = self._streams[key] = _SharedStream()
+            task = asyncio.ensure_future(shared.pump(start))
+            task.add_done_callback(lambda _: self._streams.pop(key, None))
+        return shared.subscribe()
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # 所有等待者都已断开时避免"异常未被读取"警告
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        """合并统计"""
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced
+        }
+
+
+# 进程内共享实例
+single_flight = SingleFlight()
@@ -0,0 +1,70 @@
+import inspect
+import json
+from typing import AsyncIterator, Awaitable, Callable, Optional, Union
+from fastapi.responses import StreamingResponse
+
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """
+    格式化一条服务端事件（SSE）
+
+    Args:
+        data: 事件数据（JSON序列化）
+        event: 事件名（可选，默认为message）
+
+    Returns:
+        SSE文本帧
+    """
+    frame = ""
+    if event:
+        frame += f"event: {event}\n"
+    frame += f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return frame
+
+
+def sse_response(
+    chunks: AsyncIterator[str],
+    on_complete: Optional[Callable[[str], Union[dict, Awaitable[dict]]]] = None
+) -> StreamingResponse:
+    """
+    把模型输出的文本流包装成SSE响应
+
+    事件顺序：每段文本一个 {"delta": ...} 事件；结束时发送 done 事件，
+    附带完整文本和 on_complete 返回的字段；出错时发送 error 事件。
+
+    Args:
+        chunks: 逐段产出文本的异步迭代器
+        on_complete: 流结束后以完整文本调用的回调（如保存消息），返回值合并进 done 事件
+
+    Returns:
+        StreamingResponse
+    """
+    async def event_stream():
+        # 先发送注释帧，让客户端立即收到首字节
+        yield ": connected\n\n"
+
+        parts = []
+        try:
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield sse_event({"delta": chunk})
+
+            full_text = "".join(parts)
+            extra = {}
+            if on_complete is not None:
+                extra = on_complete(full_text)
+                if inspect.isawaitable(extra):
+                    extra = await extra
+            yield sse_event({"text": full_text, **(extra or {})}, event="done")
+
+        except Exception as e:
+            yield sse_event({"detail": str(e)}, event="error")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # 禁止反向代理缓冲
+        }
+    )
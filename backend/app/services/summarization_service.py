@@ -0,0 +1,267 @@
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from app.config import settings
+from app.database.models import PDF, PDFPageText, PDFRangeSummary, PDFTextExtraction, SessionLocal
+from app.services.blob_service import blob_store
+from app.services.gemini_service import GeminiService
+from app.services.pdf_cache import pdf_cache
+from app.services.single_flight import single_flight
+
+Report = Callable[[int, Optional[str]], None]
+Section = Tuple[int, int, str]  # (起始页, 结束页, 摘要)
+
+
+class HierarchicalSummarizer:
+    """大文档分层摘要 - 按页段并行摘要（map），再逐级合并为章节和全文摘要（reduce）
+
+    页段按 SUMMARY_RANGE_PAGES 从第1页对齐切分，中间摘要按（内容哈希、层级、页码范围、
+    提示词版本）存库，重新生成或只总结某一章节时直接复用已完成的部分。
+    """
+
+    def __init__(self):
+        self.gemini_service = GeminiService()
+
+    @staticmethod
+    def should_split(page_count: int) -> bool:
+        return page_count > settings.SUMMARY_SINGLE_PASS_PAGES
+
+    async def summarize_document(self, pdf_id: int, report: Report) -> str:
+        """
+        生成整份文档的摘要
+
+        Args:
+            pdf_id: PDF记录ID
+            report: 进度回调（页段摘要占10-80%，合并占80-95%）
+
+        Returns:
+            全文摘要
+        """
+        pdf_path, page_count, content_hash = await asyncio.to_thread(self._pdf_info, pdf_id)
+        ranges = self._aligned_ranges(1, page_count)
+
+        def map_progress(done: int):
+            report(10 + 70 * done // len(ranges), f"已完成 {done}/{len(ranges)} 个页段")
+
+        sections = await self._map(pdf_id, pdf_path, content_hash, ranges, map_progress)
+        report(80, "正在合并章节摘要")
+        sections = await self._reduce(pdf_path, content_hash, sections)
+        report(90, "正在生成全文摘要")
+        return await self.gemini_service.merge_summaries(sections, final=True, pdf_path=pdf_path)
+
+    async def summarize_range(self, pdf_id: int, start: int, end: int) -> dict:
+        """
+        总结指定页码范围（如一个章节），复用已存储的页段摘要
+
+        Args:
+            pdf_id: PDF记录ID
+            start: 起始页
+            end: 结束页（包含）
+
+        Returns:
+            摘要记录信息
+        """
+        pdf_path, page_count, content_hash = await asyncio.to_thread(self._pdf_info, pdf_id)
+        start, end = max(1, start), min(end, page_count)
+        if start > end:
+            raise ValueError("Invalid page range")
+
+        stored = await asyncio.to_thread(self._load_exact, content_hash, start, end)
+        if stored:
+            return stored
+
+        sections = await self._map(pdf_id, pdf_path, content_hash, self._aligned_ranges(start, end))
+        if len(sections) > 1:
+            sections = await self._reduce(pdf_path, content_hash, sections)
+        if len(sections) > 1:
+            summary_text = await self.gemini_service.merge_summaries(sections, pdf_path=pdf_path)
+            level = await asyncio.to_thread(self._max_level, content_hash, start, end) + 1
+            await asyncio.to_thread(self._store, content_hash, level, start, end, summary_text)
+        return await asyncio.to_thread(self._load_exact, content_hash, start, end)
+
+    def list_sections(self, pdf_id: int) -> List[dict]:
+        """列出已存储的页段和章节摘要"""
+        db = SessionLocal()
+        try:
+            pdf = db.query(PDF).filter(PDF.id == pdf_id).first()
+            if not pdf or not pdf.content_hash:
+                return []
+            rows = db.query(PDFRangeSummary).filter(
+                PDFRangeSummary.content_hash == pdf.content_hash,
+                PDFRangeSummary.prompt_version == settings.PROMPT_VERSION
+            ).order_by(PDFRangeSummary.level, PDFRangeSummary.start_page).all()
+            return [self._to_dict(row) for row in rows]
+        finally:
+            db.close()
+
+    @staticmethod
+    def _aligned_ranges(start: int, end: int) -> List[Tuple[int, int]]:
+        """把页码范围切成与第1页对齐的页段；两端不完整的部分单独成段"""
+        size = settings.SUMMARY_RANGE_PAGES
+        ranges = []
+        page = start
+        while page <= end:
+            block_end = min(((page - 1) // size + 1) * size, end)
+            ranges.append((page, block_end))
+            page = block_end + 1
+        return ranges
+
+    async def _map(
+        self,
+        pdf_id: int,
+        pdf_path: str,
+        content_hash: str,
+        ranges: List[Tuple[int, int]],
+        progress: Optional[Callable[[int], None]] = None
+    ) -> List[Section]:
+        """并行摘要各页段，已存储的直接复用，每完成一段立即存库（任务重试时从断点继续）"""
+        stored = await asyncio.to_thread(self._load_level, content_hash, 0)
+        results: Dict[Tuple[int, int], str] = {r: stored[r] for r in ranges if r in stored}
+        limit = asyncio.Semaphore(settings.SUMMARY_MAP_CONCURRENCY)
+
+        async def summarize(page_range: Tuple[int, int]):
+            start, end = page_range
+            async with limit:
+                text = await asyncio.to_thread(self._page_text, pdf_id, start, end)
+                summary_text = await single_flight.do(
+                    f"range:{content_hash}:{start}-{end}",
+                    lambda: self.gemini_service.summarize_page_range(pdf_path, start, end, text)
+                )
+            await asyncio.to_thread(self._store, content_hash, 0, start, end, summary_text)
+            results[page_range] = summary_text
+            if progress:
+                progress(len(results))
+
+        if progress:
+            progress(len(results))
+        await asyncio.gather(*(summarize(r) for r in ranges if r not in results))
+        return [(start, end, results[(start, end)]) for start, end in ranges]
+
+    async def _reduce(self, pdf_path: str, content_hash: str, sections: List[Section]) -> List[Section]:
+        """逐级按 SUMMARY_REDUCE_FANOUT 个一组合并，直到数量不超过扇出数"""
+        fanout = max(settings.SUMMARY_REDUCE_FANOUT, 2)
+        level = 1
+        while len(sections) > fanout:
+            stored = await asyncio.to_thread(self._load_level, content_hash, level)
+            groups = [sections[i:i + fanout] for i in range(0, len(sections), fanout)]
+
+            async def merge(group: List[Section], level: int = level) -> Section:
+                start, end = group[0][0], group[-1][1]
+                if (start, end) in stored:
+                    return start, end, stored[(start, end)]
+                if len(group) == 1:
+                    return group[0]
+                summary_text = await self.gemini_service.merge_summaries(group, pdf_path=pdf_path)
+                await asyncio.to_thread(self._store, content_hash, level, start, end, summary_text)
+                return start, end, summary_text
+
+            sections = list(await asyncio.gather(*(merge(group) for group in groups)))
+            level += 1
+        return sections
+
+    def _pdf_info(self, pdf_id: int) -> Tuple[str, int, str]:
+        db = SessionLocal()
+        try:
+            pdf = db.query(PDF).filter(PDF.id == pdf_id).first()
+            if not pdf:
+                raise ValueError("PDF not found")
+            content_hash = pdf.content_hash or pdf_cache.content_hash(pdf.file_path)
+            return pdf.file_path, pdf.page_count, content_hash
+        finally:
+            db.close()
+
+    def _page_text(self, pdf_id: int, start: int, end: int) -> Optional[str]:
+        """读取页段的已提取文本（内容相同的记录共用owner上的页文本）；未完成提取或文本过少（扫描版）时返回None"""
+        db = SessionLocal()
+        try:
+            pdf_id = blob_store.owner_id(pdf_id, db)
+            completed = db.query(PDFTextExtraction.id).filter(
+                PDFTextExtraction.pdf_id == pdf_id,
+                PDFTextExtraction.status == "completed"
+            ).first()
+            if not completed:
+                return None
+            pages = db.query(PDFPageText.page_number, PDFPageText.text).filter(
+                PDFPageText.pdf_id == pdf_id,
+                PDFPageText.page_number.between(start, end)
+            ).order_by(PDFPageText.page_number).all()
+        finally:
+            db.close()
+
+        text = "\n\n".join(f"[第{number}页]\n{(page_text or '').strip()}" for number, page_text in pages)
+        if len(text.strip()) <= 20 * (end - start + 1):
+            return None
+        return text
+
+    def _load_level(self, content_hash: str, level: int) -> Dict[Tuple[int, int], str]:
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                PDFRangeSummary.start_page, PDFRangeSummary.end_page, PDFRangeSummary.summary_text
+            ).filter(
+                PDFRangeSummary.content_hash == content_hash,
+                PDFRangeSummary.level == level,
+                PDFRangeSummary.prompt_version == settings.PROMPT_VERSION
+            ).all()
+            return {(start, end): text for start, end, text in rows}
+        finally:
+            db.close()
+
+    def _load_exact(self, content_hash: str, start: int, end: int) -> Optional[dict]:
+        """读取恰好覆盖该范围的最高一级摘要"""
+        db = SessionLocal()
+        try:
+            row = db.query(PDFRangeSummary).filter(
+                PDFRangeSummary.content_hash == content_hash,
+                PDFRangeSummary.start_page == start,
+                PDFRangeSummary.end_page == end,
+                PDFRangeSummary.prompt_version == settings.PROMPT_VERSION
+            ).order_by(PDFRangeSummary.level.desc()).first()
+            return self._to_dict(row) if row else None
+        finally:
+            db.close()
+
+    def _max_level(self, content_hash: str, start: int, end: int) -> int:
+        db = SessionLocal()
+        try:
+            levels = db.query(PDFRangeSummary.level).filter(
+                PDFRangeSummary.content_hash == content_hash,
+                PDFRangeSummary.start_page >= start,
+                PDFRangeSummary.end_page <= end,
+                PDFRangeSummary.prompt_version == settings.PROMPT_VERSION
+            ).all()
+            return max((level for (level,) in levels), default=0)
+        finally:
+            db.close()
+
+    def _store(self, content_hash: str, level: int, start: int, end: int, summary_text: str):
+        db = SessionLocal()
+        try:
+            db.add(PDFRangeSummary(
+                content_hash=content_hash,
+                level=level,
+                start_page=start,
+                end_page=end,
+                summary_text=summary_text,
+                model=self.gemini_service.model,
+                prompt_version=settings.PROMPT_VERSION
+            ))
+            db.commit()
+        except IntegrityError:
+            # 并发任务已写入同一页段
+            db.rollback()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _to_dict(row: PDFRangeSummary) -> dict:
+        return {
+            "level": row.level,
+            "start_page": row.start_page,
+            "end_page": row.end_page,
+            "summary": row.summary_text,
+            "generated_at": row.generated_at
+        }
+
+
+summarizer = HierarchicalSummarizer()
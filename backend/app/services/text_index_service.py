@@ -0,0 +1,201 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+from app.config import settings
+from app.database.models import PDF, PDFPageText, PDFTextExtraction, SessionLocal
+from app.services import pdf_workers
+from app.services.blob_service import blob_store
+from app.services.cpu_pool import cpu_pool
+from app.services.pdf_service import PDFService
+from app.services.search_service import search_service
+
+
+class TextIndexService:
+    """逐页文本提取与存储 - 上传后在后台线程中调度（解析在共享进程池中执行），供页级提示词、搜索和摘要复用"""
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.TEXT_EXTRACTION_WORKERS,
+            thread_name_prefix="text-extract"
+        )
+        self._scheduled = set()
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[int], None]] = []
+
+    def add_listener(self, listener: Callable[[int], None]):
+        """注册提取完成回调（参数为PDF ID，在后台线程中调用）"""
+        self._listeners.append(listener)
+
+    def schedule(self, pdf_id: int):
+        """提交一个PDF的文本提取任务（同一PDF不会重复排队）"""
+        with self._lock:
+            if pdf_id in self._scheduled:
+                return
+            self._scheduled.add(pdf_id)
+        self._executor.submit(self._run, pdf_id)
+
+    def resume_pending(self):
+        """启动时为从未提取或提取被中断的PDF补排任务（内容相同的记录只提取owner）"""
+        db = SessionLocal()
+        try:
+            pdf_ids = [
+                pdf_id for (pdf_id,) in db.query(PDF.id)
+                .outerjoin(PDFTextExtraction, PDFTextExtraction.pdf_id == PDF.id)
+                .filter((PDFTextExtraction.id.is_(None)) | (PDFTextExtraction.status.in_(["pending", "running"])))
+                .filter(PDF.id.in_(blob_store.owner_ids()))
+                .all()
+            ]
+        finally:
+            db.close()
+
+        for pdf_id in pdf_ids:
+            self.schedule(pdf_id)
+
+    def _run(self, pdf_id: int):
+        try:
+            if self.extract_and_store(pdf_id) == "completed":
+                self.notify_completed(pdf_id)
+        except Exception as e:
+            print(f"文本提取失败 (PDF {pdf_id}): {str(e)}")
+        finally:
+            with self._lock:
+                self._scheduled.discard(pdf_id)
+
+    def notify_completed(self, pdf_id: int):
+        """通知监听者页文本已更新"""
+        for listener in self._listeners:
+            try:
+                listener(pdf_id)
+            except Exception as e:
+                print(f"页文本回调失败 (PDF {pdf_id}): {str(e)}")
+
+    def extract_and_store(self, pdf_id: int) -> Optional[str]:
+        """
+        按批提取PDF每一页的文本并写入数据库
+
+        每批 TEXT_EXTRACTION_BATCH_PAGES 页在共享进程池中解析并立即提交，pages_done 随之推进；
+        上次提取被中断（状态为 pending / running）时从已提交的页之后继续。
+
+        Args:
+            pdf_id: PDF记录ID
+
+        Returns:
+            提取结束时的状态；PDF不存在时返回None
+        """
+        db = SessionLocal()
+        try:
+            pdf = db.query(PDF).filter(PDF.id == pdf_id).first()
+            if not pdf:
+                return None
+
+            extraction = pdf.text_extraction or PDFTextExtraction(pdf_id=pdf_id)
+            resume_from = 0
+            if extraction.status in ("pending", "running") and extraction.pages_done:
+                resume_from = extraction.pages_done
+            extraction.status = "running"
+            extraction.pages_done = resume_from
+            extraction.page_count = pdf.page_count
+            extraction.error = None
+            extraction.started_at = extraction.started_at if resume_from else datetime.utcnow()
+            extraction.finished_at = None
+            db.add(extraction)
+            # 丢弃未完成批次留下的页（正常情况下批次整体提交，不会出现）
+            db.query(PDFPageText).filter(
+                PDFPageText.pdf_id == pdf_id,
+                PDFPageText.page_number > resume_from
+            ).delete(synchronize_session=False)
+            db.commit()
+
+            started = time.perf_counter()
+            batch_pages = max(settings.TEXT_EXTRACTION_BATCH_PAGES, 1)
+            try:
+                for start in range(resume_from + 1, pdf.page_count + 1, batch_pages):
+                    end = min(start + batch_pages - 1, pdf.page_count)
+                    # PyPDF2解析在共享进程池中执行（单页解析失败时该页为空），超时的子进程会被终止
+                    texts = cpu_pool.run_sync(
+                        pdf_workers.extract_page_texts, pdf.file_path, start, end,
+                        kind="text_extraction",
+                        timeout=settings.PDF_TEXT_TIMEOUT
+                    )
+                    db.bulk_save_objects([
+                        PDFPageText(
+                            pdf_id=pdf_id,
+                            page_number=start + offset,
+                            text=text,
+                            char_count=len(text.strip())
+                        )
+                        for offset, text in enumerate(texts)
+                    ])
+                    extraction.pages_done = end
+                    db.commit()
+
+                search_service.index_pages(db, pdf_id)
+                extraction.status = "completed"
+            except Exception as e:
+                db.rollback()
+                extraction.status = "failed"
+                extraction.error = str(e)
+
+            extraction.finished_at = datetime.utcnow()
+            extraction.duration_ms = int((time.perf_counter() - started) * 1000)
+            db.commit()
+            return extraction.status
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def get_pages(self, pdf_id: int, start: int = 1, end: Optional[int] = None) -> List[PDFPageText]:
+        """读取已存储的页文本"""
+        db = SessionLocal()
+        try:
+            query = db.query(PDFPageText).filter(
+                PDFPageText.pdf_id == pdf_id,
+                PDFPageText.page_number >= start
+            )
+            if end is not None:
+                query = query.filter(PDFPageText.page_number <= end)
+            return query.order_by(PDFPageText.page_number).all()
+        finally:
+            db.close()
+
+    def get_text_window(self, pdf_path: str, page_num: int, window: int) -> Optional[Tuple[str, int, int]]:
+        """
+        从已存储的页文本中读取以指定页为中心的文本窗口
+
+        Args:
+            pdf_path: PDF文件路径
+            page_num: 中心页码（从1开始）
+            window: 前后各包含的页数
+
+        Returns:
+            (带页码标记的文本, 起始页, 结束页)；尚未完成提取时返回None
+        """
+        db = SessionLocal()
+        try:
+            row = db.query(PDF.id, PDF.page_count).join(
+                PDFTextExtraction, PDFTextExtraction.pdf_id == PDF.id
+            ).filter(
+                PDF.file_path == pdf_path,
+                PDFTextExtraction.status == "completed"
+            ).order_by(PDF.id).first()
+            if not row:
+                return None
+
+            pdf_id, page_count = row
+            start, end = PDFService.page_window(page_count, page_num, window)
+            pages = db.query(PDFPageText.page_number, PDFPageText.text).filter(
+                PDFPageText.pdf_id == pdf_id,
+                PDFPageText.page_number.between(start, end)
+            ).order_by(PDFPageText.page_number).all()
+        finally:
+            db.close()
+
+        text = "\n\n".join(f"[第{number}页]\n{(page_text or '').strip()}" for number, page_text in pages)
+        return text, start, end
+
+
+text_index = TextIndexService()
@@ -0,0 +1,347 @@
+import asyncio
+import math
+import os
+import re
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func
+from app.config import settings
+from app.database.models import PDF, AITokenUsage, SessionLocal
+from app.services.pdf_cache import pdf_cache
+
+# 中日韩文字和全角符号约每字1个token，其余字符约每4个字符1个token
+_WIDE_CHARS = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+_MESSAGE_OVERHEAD = 4  # 每条消息的格式开销
+
+
+class TokenUsage:
+    """Token预算与用量统计 - 发送前估算输入大小并按预算裁剪上下文，调用后记录API返回的实际用量
+
+    用量按操作类型在内存中累计（/metrics），同时按（UTC日期、PDF内容哈希、操作、模型）汇总，
+    每 TOKEN_USAGE_FLUSH_INTERVAL 秒批量写入数据库；数据库中的统计最多滞后一个周期。
+    API未返回用量时（如流式调用的服务商不支持）使用估算值，并不参与估算误差的统计。
+    """
+
+    def __init__(self):
+        self._totals: Dict[str, dict] = {}
+        self._pending: Dict[Tuple[date, str, str, str], dict] = {}
+        self._page_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    @staticmethod
+    def estimate_text(text: Optional[str]) -> int:
+        """估算一段文本的token数"""
+        if not text:
+            return 0
+        wide = len(_WIDE_CHARS.findall(text))
+        return wide + math.ceil((len(text) - wide) / 4)
+
+    def truncate_text(self, text: str, budget: int) -> Tuple[str, bool]:
+        """
+        把文本截断到token预算以内（保留开头）
+
+        Returns:
+            (截断后的文本, 是否发生截断)
+        """
+        if self.estimate_text(text) <= budget:
+            return text, False
+        # 按比例估计截断位置，再逐步收缩到预算以内
+        end = int(len(text) * budget / max(self.estimate_text(text), 1))
+        while end > 0 and self.estimate_text(text[:end]) > budget:
+            end = int(end * 0.9)
+        return text[:end] + "\n……（内容过长，已截断）", True
+
+    def trim_history(self, messages: List[dict], budget: int, min_messages: int = 0) -> List[dict]:
+        """从最新的消息开始保留，直到用完token预算（保持时间顺序）；最近 min_messages 条不受预算限制"""
+        kept = []
+        used = 0
+        for message in reversed(messages):
+            used += self.estimate_text(f"{message['role']}: {message['content']}") + _MESSAGE_OVERHEAD
+            if used > budget and len(kept) >= min_messages:
+                break
+            kept.append(message)
+        return kept[::-1]
+
+    def document_tokens(self, pdf_path: str) -> int:
+        """整份PDF以文件形式发送时的估算token数（页数 × PDF_TOKENS_PER_PAGE）"""
+        return self.page_count(pdf_path) * settings.PDF_TOKENS_PER_PAGE
+
+    def estimate_messages(self, messages: List[dict], pdf_path: str = "") -> int:
+        """
+        估算一次调用的输入token数（在线程中调用，首次遇到的PDF需要查询页数）
+
+        Args:
+            messages: 发送给API的消息
+            pdf_path: 消息中附带的PDF文件路径（可选）
+
+        Returns:
+            估算的输入token数
+        """
+        total = 0
+        for message in messages:
+            total += _MESSAGE_OVERHEAD
+            content = message["content"]
+            if isinstance(content, str):
+                total += self.estimate_text(content)
+                continue
+            for part in content:
+                kind = part.get("type")
+                if kind == "text":
+                    total += self.estimate_text(part["text"])
+                elif kind == "file":
+                    total += self.document_tokens(pdf_path)
+                elif kind == "image_url":
+                    url = part["image_url"]["url"]
+                    if url.startswith("data:application/pdf") and pdf_path:
+                        total += self._pdf_part_tokens(pdf_path, len(url))
+                    else:
+                        total += settings.PDF_TOKENS_PER_PAGE
+        return total
+
+    @staticmethod
+    def output_limit(action: str, default: int) -> int:
+        """操作的输出token上限（OUTPUT_TOKEN_LIMITS 中的配置优先）"""
+        return settings.OUTPUT_TOKEN_LIMITS.get(action, default)
+
+    def record(
+        self,
+        action: str,
+        pdf_path: str,
+        model: str,
+        estimated_prompt_tokens: int,
+        prompt_tokens: Optional[int],
+        completion_tokens: Optional[int],
+        latency_ms: float,
+        failed: bool = False
+    ):
+        """
+        记录一次API调用
+
+        Args:
+            action: 操作类型
+            pdf_path: 附带的PDF文件路径（不附带时为空字符串）
+            model: 模型名称
+            estimated_prompt_tokens: 发送前估算的输入token数
+            prompt_tokens: API返回的输入token数（未返回时为None，按估算值累计）
+            completion_tokens: API返回的输出token数（未返回时为None）
+            latency_ms: 调用耗时
+            failed: 调用是否失败
+        """
+        reported = prompt_tokens is not None
+        prompt = prompt_tokens if reported else (0 if failed else estimated_prompt_tokens)
+        completion = completion_tokens or 0
+        with self._lock:
+            entry = self._entry(action)
+            entry["calls"] += 1
+            entry["errors"] += failed
+            entry["prompt_tokens"] += prompt
+            entry["completion_tokens"] += completion
+            entry["latency_ms"] += latency_ms
+            entry["max_latency_ms"] = max(entry["max_latency_ms"], latency_ms)
+            if reported:
+                entry["reported_calls"] += 1
+                entry["reported_prompt_tokens"] += prompt_tokens
+                entry["reported_estimated_tokens"] += estimated_prompt_tokens
+
+            pending = self._pending.setdefault((datetime.utcnow().date(), pdf_path, action, model), {
+                "calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "estimated_prompt_tokens": 0, "latency_ms": 0.0
+            })
+            pending["calls"] += 1
+            pending["errors"] += failed
+            pending["prompt_tokens"] += prompt
+            pending["completion_tokens"] += completion
+            pending["estimated_prompt_tokens"] += estimated_prompt_tokens
+            pending["latency_ms"] += latency_ms
+
+    def record_trim(self, action: str):
+        """记录一次因超出预算而裁剪上下文"""
+        with self._lock:
+            self._entry(action)["trimmed"] += 1
+
+    def flush(self) -> int:
+        """把累积的用量合并写入数据库，返回写入的记录数"""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+
+        # PDF按内容哈希归并（去重上传的PDF共用同一文件）
+        merged: Dict[Tuple[date, str, str, str], dict] = {}
+        hashes: Dict[str, str] = {}
+        for (day, pdf_path, action, model), counters in batch.items():
+            if pdf_path not in hashes:
+                try:
+                    hashes[pdf_path] = pdf_cache.content_hash(pdf_path) if pdf_path else ""
+                except OSError:
+                    hashes[pdf_path] = ""
+            target = merged.setdefault((day, hashes[pdf_path], action, model), dict.fromkeys(counters, 0))
+            for name, value in counters.items():
+                target[name] += value
+
+        db = SessionLocal()
+        try:
+            for (day, pdf_hash, action, model), counters in merged.items():
+                row = db.query(AITokenUsage).filter(
+                    AITokenUsage.day == day,
+                    AITokenUsage.pdf_hash == pdf_hash,
+                    AITokenUsage.action == action,
+                    AITokenUsage.model == model
+                ).first()
+                if row is None:
+                    row = AITokenUsage(
+                        day=day, pdf_hash=pdf_hash, action=action, model=model,
+                        calls=0, errors=0, prompt_tokens=0, completion_tokens=0,
+                        estimated_prompt_tokens=0, latency_ms=0
+                    )
+                    db.add(row)
+                row.calls += counters["calls"]
+                row.errors += counters["errors"]
+                row.prompt_tokens += counters["prompt_tokens"]
+                row.completion_tokens += counters["completion_tokens"]
+                row.estimated_prompt_tokens += counters["estimated_prompt_tokens"]
+                row.latency_ms += int(counters["latency_ms"])
+            db.commit()
+        except Exception:
+            db.rollback()
+            # 写入失败时放回，下个周期重试
+            with self._lock:
+                for key, counters in batch.items():
+                    pending = self._pending.setdefault(key, dict.fromkeys(counters, 0))
+                    for name, value in counters.items():
+                        pending[name] += value
+            raise
+        finally:
+            db.close()
+
+        with self._lock:
+            self.flushes += 1
+            self.rows_written += len(merged)
+        return len(merged)
+
+    def pdf_usage(self, pdf_hash: str, days: int) -> List[dict]:
+        """
+        某份PDF最近若干天按操作汇总的用量（来自数据库）
+
+        Args:
+            pdf_hash: PDF内容哈希
+            days: 统计最近的天数
+
+        Returns:
+            每个操作的调用次数、token数和平均耗时，按输入token数降序
+        """
+        since = datetime.utcnow().date() - timedelta(days=days - 1)
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                AITokenUsage.action,
+                func.sum(AITokenUsage.calls),
+                func.sum(AITokenUsage.errors),
+                func.sum(AITokenUsage.prompt_tokens),
+                func.sum(AITokenUsage.completion_tokens),
+                func.sum(AITokenUsage.latency_ms)
+            ).filter(
+                AITokenUsage.pdf_hash == pdf_hash,
+                AITokenUsage.day >= since
+            ).group_by(AITokenUsage.action).all()
+        finally:
+            db.close()
+
+        usage = [
+            {
+                "action": action,
+                "calls": calls,
+                "errors": errors,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "avg_latency_ms": round(latency_ms / calls, 1) if calls else 0.0
+            }
+            for action, calls, errors, prompt_tokens, completion_tokens, latency_ms in rows
+        ]
+        return sorted(usage, key=lambda entry: entry["prompt_tokens"], reverse=True)
+
+    async def start(self):
+        """启动定期写入（在应用启动时调用）"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="token-usage-flush")
+
+    async def stop(self):
+        """停止定期写入并写入剩余记录"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.TOKEN_USAGE_FLUSH_INTERVAL)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                print(f"写入token用量失败: {str(e)}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            actions = {}
+            for action, entry in self._totals.items():
+                calls = entry["calls"]
+                actions[action] = {
+                    **{key: entry[key] for key in ("calls", "errors", "prompt_tokens", "completion_tokens", "trimmed")},
+                    "avg_prompt_tokens": round(entry["prompt_tokens"] / calls) if calls else 0,
+                    "avg_latency_ms": round(entry["latency_ms"] / calls, 1) if calls else 0.0,
+                    "max_latency_ms": round(entry["max_latency_ms"], 1),
+                    # 实际输入token / 估算值，用于校准估算
+                    "estimate_ratio": round(
+                        entry["reported_prompt_tokens"] / entry["reported_estimated_tokens"], 2
+                    ) if entry["reported_estimated_tokens"] else None
+                }
+            return {
+                "prompt_tokens": sum(entry["prompt_tokens"] for entry in self._totals.values()),
+                "completion_tokens": sum(entry["completion_tokens"] for entry in self._totals.values()),
+                "actions": actions,
+                "pending": len(self._pending),
+                "flushes": self.flushes,
+                "rows_written": self.rows_written
+            }
+
+    def _entry(self, action: str) -> dict:
+        return self._totals.setdefault(action, {
+            "calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            "reported_calls": 0, "reported_prompt_tokens": 0, "reported_estimated_tokens": 0,
+            "latency_ms": 0.0, "max_latency_ms": 0.0, "trimmed": 0
+        })
+
+    def page_count(self, pdf_path: str) -> int:
+        """PDF页数（按路径查询数据库并记忆，未登记的文件视为1页）"""
+        with self._lock:
+            count = self._page_counts.get(pdf_path)
+        if count is not None:
+            return count
+
+        db = SessionLocal()
+        try:
+            row = db.query(PDF.page_count).filter(PDF.file_path == pdf_path).first()
+        finally:
+            db.close()
+        count = max(row.page_count or 1, 1) if row else 1
+        with self._lock:
+            self._page_counts[pdf_path] = count
+        return count
+
+    def _pdf_part_tokens(self, pdf_path: str, data_url_length: int) -> int:
+        """内联PDF（整份或页面切片）的估算token数：按base64长度占整个文件的比例折算页数"""
+        page_count = self.page_count(pdf_path)
+        try:
+            file_length = os.path.getsize(pdf_path) * 4 / 3
+        except OSError:
+            return page_count * settings.PDF_TOKENS_PER_PAGE
+        pages = min(page_count, max(1, math.ceil(page_count * data_url_length / max(file_length, 1))))
+        return pages * settings.PDF_TOKENS_PER_PAGE
+
+
+token_usage = TokenUsage()
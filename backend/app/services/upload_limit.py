@@ -0,0 +1,85 @@
+import json
+from typing import Iterable
+from fastapi import HTTPException
+from app.config import settings
+
+
+def too_large_detail() -> str:
+    return f"文件过大（最大{settings.MAX_FILE_SIZE // (1024 * 1024)}MB）"
+
+
+class _BodyTooLarge(HTTPException):
+    """在读取请求体时抛出；FastAPI解析表单时原样传递HTTPException，由异常处理器返回413"""
+
+    def __init__(self):
+        super().__init__(status_code=413, detail=too_large_detail())
+
+
+class UploadSizeLimitMiddleware:
+    """
+    在请求体被解析（Starlette会把multipart文件先写入临时文件）之前限制上传大小
+
+    - 带 Content-Length 且超过 MAX_FILE_SIZE 加表单开销余量时，不读取请求体直接返回413
+    - 没有 Content-Length（分块传输）时边接收边计数，超过上限立即中止并返回413
+
+    Args:
+        app: 下一层ASGI应用
+        paths: 需要限制的请求路径（POST）
+    """
+
+    def __init__(self, app, paths: Iterable[str]):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        limit = settings.MAX_FILE_SIZE + settings.UPLOAD_FORM_OVERHEAD
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None:
+            if not content_length.isdigit() or int(content_length) > limit:
+                await self._reject(send)
+                return
+            await self.app(scope, receive, send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if response_started:
+                raise
+            await self._reject(send)
+
+    @staticmethod
+    async def _reject(send):
+        body = json.dumps({"detail": too_large_detail()}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,9 +1,31 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import RedirectResponse
+from sqlalchemy import func
+from sqlalchemy.orm import Session
 from app.config import settings
-from app.database.models import init_db
-from app.routes import pdf_routes, chat_routes, annotation_routes, formula_routes
+from app.database.models import PDF, engine, get_db, init_db
+from app.database.engine import database_info
+from app.services.pdf_cache import pdf_cache
+from app.services.http_client import gemini_http
+from app.services.provider_file_service import provider_files
+from app.services.text_index_service import text_index
+from app.services.embedding_service import embedding_index
+from app.services.response_cache import response_cache
+from app.services.search_service import search_service
+from app.services.blob_service import blob_store
+from app.services.job_service import job_queue
+from app.services.single_flight import single_flight
+from app.services.access_tracker import access_tracker
+from app.services.token_usage import token_usage
+from app.services.analysis_service import document_analysis
+from app.services.file_serving import EXPOSED_HEADERS
+from app.services.render_service import page_renderer
+from app.services.cpu_pool import cpu_pool
+from app.services.ocr_service import ocr_pipeline
+from app.services.upload_limit import UploadSizeLimitMiddleware
+from app.routes import pdf_routes, chat_routes, annotation_routes, formula_routes, search_routes, job_routes
 
 # 初始化数据库
 init_db()
@@ -15,6 +37,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# 上传大小限制：在请求体被解析之前拒绝过大的上传（先添加，位于CORS中间件内层，413响应也带CORS头）
+app.add_middleware(UploadSizeLimitMiddleware, paths=["/api/pdfs/upload"])
+
 # CORS中间件配置
 app.add_middleware(
     CORSMiddleware,
@@ -22,6 +47,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=EXPOSED_HEADERS,
 )
 
 # 挂载路由
@@ -29,9 +55,58 @@ app.include_router(pdf_routes.router, prefix="/api/pdfs", tags=["PDFs"])
 app.include_router(chat_routes.router, prefix="/api/chat", tags=["Chat"])
 app.include_router(formula_routes.router, prefix="/api/formula", tags=["Formula"])
 app.include_router(annotation_routes.router, prefix="/api/annotations", tags=["Annotations"])
+app.include_router(search_routes.router, prefix="/api/search", tags=["Search"])
+app.include_router(job_routes.router, prefix="/api/jobs", tags=["Jobs"])
+
+# 旧的静态文件路径：重定向到文件接口（ETag、Range、长期缓存、可交给前置代理发送），不再直接暴露上传目录
+@app.get("/uploads/{filename}", include_in_schema=False)
+async def legacy_upload_file(filename: str, db: Session = Depends(get_db)):
+    pdf_id = db.query(func.min(PDF.id)).filter(PDF.filename == filename).scalar()
+    if pdf_id is None:
+        raise HTTPException(status_code=404, detail="PDF not found")
+    return RedirectResponse(f"/api/pdfs/{pdf_id}/file", status_code=301)
+
+@app.on_event("startup")
+async def startup():
+    # 为升级前上传的PDF补算内容哈希，使其参与去重
+    blob_store.backfill_hashes()
+    # 首次启用检索时回填已有数据
+    search_service.rebuild_if_empty()
+    # 合并升级前为重复上传复制的页文本、摘要和结构分析（及其全文索引）
+    blob_store.collapse_duplicates()
+    # 页文本更新后建立向量索引（检索模式）
+    text_index.add_listener(embedding_index.on_pages_updated)
+    # 扫描版文本提取完成后排队OCR
+    text_index.add_listener(ocr_pipeline.on_pages_updated)
+    # 为尚未提取文本的PDF补排后台任务
+    text_index.resume_pending()
+    # 启动后台任务队列（整篇摘要、结构分析、缩略图、OCR），恢复上次未完成的任务
+    job_queue.register("summary", document_analysis.summarize)
+    job_queue.register("structure", document_analysis.analyze_structure)
+    job_queue.register("thumbnails", page_renderer.prerender_thumbnails)
+    job_queue.register("ocr", ocr_pipeline.run)
+    await job_queue.start()
+    # 为尚未识别完成的扫描版PDF补排OCR任务
+    await ocr_pipeline.start()
+    # 定期批量写入PDF访问时间
+    await access_tracker.start()
+    # 定期批量写入token用量
+    await token_usage.start()
+    # 定期批量写入回复缓存的命中统计
+    await response_cache.start()
 
-# 静态文件服务（用于上传的PDF）
-app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
+@app.on_event("shutdown")
+async def shutdown():
+    # 停止后台任务，未完成的任务下次启动时继续
+    await job_queue.stop()
+    # 写入尚未落库的访问时间、token用量和缓存命中统计
+    await access_tracker.stop()
+    await token_usage.stop()
+    await response_cache.stop()
+    # 停止PDF处理子进程
+    cpu_pool.shutdown()
+    # 关闭Gemini连接池
+    await gemini_http.close()
 
 @app.get("/")
 async def root():
@@ -45,6 +120,22 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics")
+async def metrics():
+    """运行时指标"""
+    return {
+        "pdf_cache": pdf_cache.stats(),
+        "provider_files": provider_files.stats(),
+        "response_cache": response_cache.stats(),
+        "jobs": job_queue.stats(),
+        "single_flight": single_flight.stats(),
+        "access_tracker": access_tracker.stats(),
+        "token_usage": token_usage.stats(),
+        "cpu_pool": cpu_pool.stats(),
+        "renderer": page_renderer.stats(),
+        "database": await asyncio.to_thread(database_info, engine)
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
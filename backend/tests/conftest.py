@@ -0,0 +1,66 @@
+"""
+测试环境：独立的临时数据库、上传目录和缓存目录，模型API调用全部替换为本地假实现
+
+必须在导入应用模块之前设置环境变量和目录配置。
+"""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_TEST_DIR = tempfile.mkdtemp(prefix="exam-reviewer-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TEST_DIR, 'test.db')}"
+os.environ["RENDER_CACHE_DIR"] = os.path.join(_TEST_DIR, "render_cache")
+os.environ["PRECOMPUTE_ON_UPLOAD"] = "false"
+os.environ["RENDER_PRERENDER_THUMBNAILS"] = "false"
+os.environ["OCR_ENABLED"] = "false"
+os.environ["CPU_POOL_WORKERS"] = "2"
+os.environ["ACCESS_FLUSH_INTERVAL"] = "3600"
+os.environ["TOKEN_USAGE_FLUSH_INTERVAL"] = "3600"
+os.environ["RESPONSE_CACHE_FLUSH_INTERVAL"] = "3600"
+
+from app.config import settings  # noqa: E402
+
+settings.UPLOAD_DIR = os.path.join(_TEST_DIR, "uploads")
+settings.EMBEDDING_DIR = os.path.join(_TEST_DIR, "embeddings")
+os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from helpers import FakeModel  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    """启动完整应用（含后台任务队列）的测试客户端"""
+    from main import app
+    from app.services.cpu_pool import cpu_pool
+
+    with TestClient(app) as test_client:
+        yield test_client
+    cpu_pool.shutdown()
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """替换Gemini HTTP调用，记录每次请求的载荷"""
+    from app.services.http_client import gemini_http
+
+    model = FakeModel()
+    monkeypatch.setattr(gemini_http, "post_json", model.post_json)
+    monkeypatch.setattr(gemini_http, "stream_events", model.stream_events)
+    monkeypatch.setattr(gemini_http, "post_multipart", model.post_multipart)
+    return model
+
+
+@pytest.fixture
+def db():
+    from app.database.models import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,107 @@
+"""测试辅助：生成带文本层的PDF、上传PDF、假的模型API"""
+import asyncio
+import time
+import uuid
+from typing import Callable, List, Optional
+
+
+def make_pdf(pages: List[str]) -> bytes:
+    """生成每页包含一行ASCII文本的最小PDF（PyPDF2可提取文本）"""
+    count = len(pages)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        ("<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            " ".join(f"{4 + 2 * index} 0 R" for index in range(count)), count
+        )).encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for index, text in enumerate(pages):
+        escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        stream = f"BT /F1 12 Tf 72 720 Td ({escaped}) Tj ET".encode("latin-1")
+        objects.append((
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * index} 0 R >>"
+        ).encode())
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(output)
+
+
+def unique_pages(count: int, prefix: str = "page") -> List[str]:
+    """每次调用内容都不同的页文本（避免与其他测试的上传去重）"""
+    token = uuid.uuid4().hex[:8]
+    return [f"{prefix} {number} {token} lorem ipsum dolor sit amet" for number in range(1, count + 1)]
+
+
+def upload(client, pages: List[str], filename: str = "test.pdf") -> dict:
+    response = client.post(
+        "/api/pdfs/upload",
+        files={"file": (filename, make_pdf(pages), "application/pdf")}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def wait_for(condition: Callable[[], bool], timeout: float = 20, interval: float = 0.05) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    return condition()
+
+
+class FakeModel:
+    """替代 gemini_http 的假实现：记录请求，按 reply 函数生成回复"""
+
+    def __init__(self):
+        self.requests: List[dict] = []
+        self.uploads = 0
+        self.fail_uploads = False
+        self.reply: Callable[[dict], str] = lambda payload: "答案"
+        self.usage: Optional[dict] = {"prompt_tokens": 100, "completion_tokens": 10}
+        self.delay = 0.0
+
+    async def post_json(self, path: str, payload: dict, timeout=None) -> dict:
+        self.requests.append(payload)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        data = {"choices": [{"message": {"content": self.reply(payload)}}]}
+        if self.usage:
+            data["usage"] = self.usage
+        return data
+
+    async def stream_events(self, path: str, payload: dict, timeout=None):
+        self.requests.append(payload)
+        for chunk in self.reply(payload):
+            yield {"choices": [{"delta": {"content": chunk}}]}
+        if self.usage:
+            yield {"choices": [], "usage": self.usage}
+
+    async def post_multipart(self, path: str, files: dict, data: Optional[dict] = None) -> dict:
+        self.uploads += 1
+        if self.fail_uploads:
+            raise RuntimeError("provider unavailable")
+        return {"id": f"file-{self.uploads}"}
+
+    @staticmethod
+    def prompt_text(payload: dict) -> str:
+        """请求中所有文本片段拼接后的内容"""
+        parts = []
+        for message in payload["messages"]:
+            content = message["content"]
+            if isinstance(content, str):
+                parts.append(content)
+            else:
+                parts.extend(part["text"] for part in content if part.get("type") == "text")
+        return "\n".join(parts)
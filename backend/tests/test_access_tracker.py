@@ -0,0 +1,27 @@
+"""访问时间批量写入：读请求只记录到内存，flush时一次写入"""
+from app.database.models import PDF
+from app.services.access_tracker import access_tracker
+from helpers import unique_pages, upload
+
+
+def _last_accessed(db, pdf_id):
+    db.expire_all()
+    return db.query(PDF.last_accessed).filter(PDF.id == pdf_id).scalar()
+
+
+def test_reads_are_written_in_one_batch(client, db):
+    access_tracker.flush()
+    pdfs = [upload(client, unique_pages(1)) for _ in range(2)]
+    stored = {pdf["id"]: _last_accessed(db, pdf["id"]) for pdf in pdfs}
+
+    details = [client.get(f"/api/pdfs/{pdf['id']}").json() for pdf in pdfs for _ in range(3)]
+    # 单个PDF的接口返回本次访问时间，数据库尚未写入
+    assert all(detail["last_accessed"] for detail in details)
+    assert {pdf_id: _last_accessed(db, pdf_id) for pdf_id in stored} == stored
+    assert access_tracker.stats()["pending"] == 2
+
+    flushes = access_tracker.stats()["flushes"]
+    assert access_tracker.flush() == 2
+    assert access_tracker.stats()["flushes"] == flushes + 1
+    for pdf_id, before in stored.items():
+        assert _last_accessed(db, pdf_id) > before
@@ -0,0 +1,91 @@
+"""批量接口：多个片段打包进尽量少的模型调用，PDF每次调用只发送一次，缺失的片段单独补齐"""
+import json
+import re
+from app.config import settings
+from helpers import unique_pages, upload
+
+
+def _batch_reply(skip=()):
+    """按提示词中的片段编号返回JSON数组，skip中的编号故意缺失"""
+    def reply(payload):
+        text = payload["messages"][0]["content"]
+        prompt = text if isinstance(text, str) else text[0]["text"]
+        numbers = [int(n) for n in re.findall(r"^\[(\d+)\] 操作", prompt, re.MULTILINE)]
+        if not numbers:
+            return "单独处理的结果"
+        quoted = re.findall(r'片段："(.*)"', prompt)
+        return json.dumps([
+            {"id": number, "result": f"结果:{quoted[number - 1]}"}
+            for number in numbers if number not in skip
+        ], ensure_ascii=False)
+    return reply
+
+
+def _pdf_parts(payload):
+    content = payload["messages"][0]["content"]
+    return [part for part in content if isinstance(part, dict) and part.get("type") != "text"]
+
+
+def _post(client, pdf_id, items, **extra):
+    response = client.post("/api/chat/batch", json={"pdf_id": pdf_id, "items": items, **extra})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_many_selections_are_packed_into_few_calls(client, fake_model, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_MAX_ITEMS_PER_CALL", 12)
+    monkeypatch.setattr(settings, "PDF_TRANSPORT", "inline")
+    fake_model.reply = _batch_reply()
+    pdf = upload(client, unique_pages(2))
+    actions = ["explain", "translate", "summarize"]
+    items = [{"action": actions[n % 3], "selected_text": f"片段{n}", "page_number": 1} for n in range(20)]
+
+    body = _post(client, pdf["id"], items)
+    assert body["api_calls"] == 2
+    assert len(fake_model.requests) == 2
+    assert all(len(_pdf_parts(payload)) == 1 for payload in fake_model.requests)
+    assert [result["index"] for result in body["results"]] == list(range(20))
+    assert all(result["result"] == f"结果:片段{n}" for n, result in enumerate(body["results"]))
+    assert [result["action"] for result in body["results"]] == [item["action"] for item in items]
+
+    # 再次请求全部命中回复缓存
+    again = _post(client, pdf["id"], items)
+    assert again["api_calls"] == 0
+    assert all(result["cached"] for result in again["results"])
+    assert len(fake_model.requests) == 2
+
+
+def test_duplicates_and_missing_answers(client, fake_model):
+    fake_model.reply = _batch_reply(skip={2})
+    pdf = upload(client, unique_pages(1))
+    items = [
+        {"action": "explain", "selected_text": "矩阵"},
+        {"action": "translate", "selected_text": "matrix", "target_language": "中文"},
+        {"action": "explain", "selected_text": "矩阵"},
+    ]
+
+    body = _post(client, pdf["id"], items, no_cache=True)
+    # 重复片段只发送一次；模型漏掉的第2个片段单独补齐
+    assert body["api_calls"] == 2
+    assert "片段：\"矩阵\"" in fake_model.prompt_text(fake_model.requests[0])
+    assert fake_model.prompt_text(fake_model.requests[0]).count("[3] 操作") == 0
+    results = body["results"]
+    assert results[0]["result"] == results[2]["result"] == "结果:矩阵"
+    assert results[1]["result"] == "单独处理的结果"
+    assert all(result["error"] is None for result in results)
+
+
+def test_failed_call_reports_per_item_errors(client, fake_model):
+    pdf = upload(client, unique_pages(1))
+
+    def reply(payload):
+        raise RuntimeError("model overloaded")
+
+    fake_model.reply = reply
+    body = _post(client, pdf["id"], [{"action": "summarize", "selected_text": "第一段"}], no_cache=True)
+    assert body["results"][0]["result"] is None
+    assert "model overloaded" in body["results"][0]["error"]
+
+    too_many = [{"action": "explain", "selected_text": str(n)} for n in range(settings.BATCH_MAX_ITEMS + 1)]
+    response = client.post("/api/chat/batch", json={"pdf_id": pdf["id"], "items": too_many})
+    assert response.status_code == 422
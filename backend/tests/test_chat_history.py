@@ -0,0 +1,85 @@
+"""对话历史：按索引倒序取最近N条，启用滚动摘要后更早的消息折叠进对话摘要"""
+import asyncio
+from sqlalchemy import text
+from app.config import settings
+from app.database.models import Conversation
+from app.services.conversation_memory import ConversationMemory
+from app.services.token_usage import token_usage
+from helpers import unique_pages, upload, wait_for
+
+
+def _send(client, pdf_id, message):
+    response = client.post("/api/chat/send", json={"pdf_id": pdf_id, "message": message})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_only_recent_messages_are_sent(client, fake_model, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_MESSAGES", 4)
+    pdf = upload(client, unique_pages(1))
+    for number in range(1, 6):
+        _send(client, pdf["id"], f"第{number}个问题")
+
+    prompt = fake_model.prompt_text(fake_model.requests[-1])
+    assert "第3个问题" in prompt and "第4个问题" in prompt
+    assert "第1个问题" not in prompt and "第2个问题" not in prompt
+
+
+def test_history_query_uses_composite_index(db):
+    plan = " ".join(str(row[-1]) for row in db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT role, content FROM messages WHERE conversation_id = 1 "
+        "ORDER BY created_at DESC, id DESC LIMIT 5"
+    )).fetchall())
+    assert "ix_messages_conversation_created" in plan
+
+
+def test_rolling_summary_replaces_older_messages(client, fake_model, db, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_ROLLING_SUMMARY", True)
+    monkeypatch.setattr(settings, "CHAT_HISTORY_MESSAGES", 2)
+    monkeypatch.setattr(settings, "CHAT_SUMMARY_BATCH", 2)
+    fake_model.reply = lambda payload: (
+        "此前讨论了矩阵" if "对话摘要" in fake_model.prompt_text(payload) else "答案"
+    )
+    pdf = upload(client, unique_pages(1))
+
+    _send(client, pdf["id"], "第1个问题")
+    conversation_id = _send(client, pdf["id"], "第2个问题")["conversation_id"]
+
+    def summarized():
+        db.expire_all()
+        return db.query(Conversation).filter(Conversation.id == conversation_id).one().summarized_until_id
+    assert wait_for(summarized)
+
+    _send(client, pdf["id"], "第3个问题")
+    prompt = fake_model.prompt_text(fake_model.requests[-1])
+    assert "此前讨论了矩阵" in prompt
+    assert "第2个问题" in prompt
+    assert "第1个问题" not in prompt
+
+    # 折叠调用的用量记在对话所属文档名下
+    token_usage.flush()
+    actions = {entry["action"] for entry in client.get(f"/api/pdfs/{pdf['id']}/usage").json()["actions"]}
+    assert "fold_conversation" in actions
+
+
+def test_messages_saved_during_fold_are_rechecked(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_ROLLING_SUMMARY", True)
+    memory = ConversationMemory()
+    checks = []
+
+    def pending_messages(conversation_id):
+        checks.append(conversation_id)
+        return None
+
+    monkeypatch.setattr(memory, "_pending_messages", pending_messages)
+
+    async def scenario():
+        memory.schedule(7)
+        # 第一次检查尚未结束时又保存了消息
+        memory.schedule(7)
+        memory.schedule(7)
+        while memory._tasks:
+            await asyncio.gather(*list(memory._tasks))
+
+    asyncio.run(scenario())
+    assert checks == [7, 7]
@@ -0,0 +1,105 @@
+"""对话列表：查询次数不随对话数和消息数增长，对话和消息都按游标分页"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app.database.models import Conversation, Message, PDFTextExtraction, engine
+from helpers import unique_pages, upload, wait_for
+
+
+def _seed(db, pdf_id, conversations, messages):
+    """直接写入对话和消息，时间递增便于断言顺序"""
+    start = datetime(2026, 1, 1)
+    ids = []
+    for number in range(conversations):
+        conversation = Conversation(
+            pdf_id=pdf_id, title=f"对话{number}", updated_at=start + timedelta(hours=number)
+        )
+        db.add(conversation)
+        db.flush()
+        for index in range(messages):
+            db.add(Message(
+                conversation_id=conversation.id,
+                role="user" if index % 2 == 0 else "assistant",
+                content=f"{number}-{index}",
+                created_at=start + timedelta(hours=number, seconds=index)
+            ))
+        ids.append(conversation.id)
+    db.commit()
+    return ids
+
+
+@contextmanager
+def _count_queries():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def test_query_count_is_independent_of_history_size(client, db):
+    small = upload(client, unique_pages(1))
+    large = upload(client, unique_pages(1))
+    _seed(db, small["id"], 1, 2)
+    _seed(db, large["id"], 8, 30)
+
+    def extracted():
+        # 上传后的后台文本提取也会查询数据库，等它结束再计数
+        db.expire_all()
+        return db.query(PDFTextExtraction).filter(
+            PDFTextExtraction.pdf_id.in_([small["id"], large["id"]]),
+            PDFTextExtraction.status == "completed"
+        ).count() == 2
+    assert wait_for(extracted)
+
+    counts = []
+    for pdf in (small, large):
+        with _count_queries() as statements:
+            response = client.get(f"/api/chat/{pdf['id']}/conversations", params={"messages": 3})
+        assert response.status_code == 200
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
+
+    body = response.json()
+    assert len(body["conversations"]) == 8
+    newest = body["conversations"][0]
+    assert newest["title"] == "对话7"
+    assert newest["message_count"] == 30
+    assert [msg["content"] for msg in newest["messages"]] == ["7-27", "7-28", "7-29"]
+    assert newest["messages_cursor"]
+
+
+def test_conversation_and_message_cursors(client, db):
+    pdf = upload(client, unique_pages(1))
+    ids = _seed(db, pdf["id"], 5, 7)
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2, "messages": 0, **({"cursor": cursor} if cursor else {})}
+        page = client.get(f"/api/chat/{pdf['id']}/conversations", params=params).json()
+        assert all(conv["messages"] == [] for conv in page["conversations"])
+        seen += [conv["conversation_id"] for conv in page["conversations"]]
+        cursor = page["next_cursor"]
+        if not page["has_more"]:
+            break
+    assert seen == ids[::-1]
+
+    contents = []
+    cursor = None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = client.get(f"/api/chat/conversations/{ids[0]}/messages", params=params).json()
+        contents = [msg["content"] for msg in page["messages"]] + contents
+        cursor = page["next_cursor"]
+        if not page["has_more"]:
+            break
+    assert contents == [f"0-{index}" for index in range(7)]
+
+    assert client.get(f"/api/chat/{pdf['id']}/conversations", params={"cursor": "bad"}).status_code == 400
@@ -0,0 +1,91 @@
+"""共享进程池：超时终止子进程并重建、排队已满时拒绝、按类型统计等待和执行时间"""
+import asyncio
+import threading
+import time
+import pytest
+from app.config import settings
+from app.services import pdf_workers
+from app.services.cpu_pool import CPUPool, PoolBusyError, TaskTimeoutError
+from helpers import make_pdf, unique_pages, upload
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(settings, "CPU_POOL_WORKERS", 1)
+    monkeypatch.setattr(settings, "CPU_POOL_MAX_QUEUE", 1)
+    cpu = CPUPool()
+    yield cpu
+    cpu.shutdown()
+
+
+def test_timeout_kills_worker_and_pool_recovers(pool, tmp_path):
+    started = time.monotonic()
+    with pytest.raises(TaskTimeoutError):
+        pool.run_sync(time.sleep, 30, kind="parse", timeout=0.5)
+    assert time.monotonic() - started < 10
+    assert pool.stats()["restarts"] == 1
+
+    path = tmp_path / "ok.pdf"
+    path.write_bytes(make_pdf(unique_pages(2)))
+    assert pool.run_sync(pdf_workers.extract_metadata, str(path), kind="parse")["page_count"] == 2
+    kinds = pool.stats()["kinds"]["parse"]
+    assert (kinds["timeouts"], kinds["completed"]) == (1, 1)
+
+
+def test_errors_are_raised_in_caller(pool):
+    with pytest.raises(ValueError):
+        pool.run_sync(int, "not a number", kind="parse")
+    assert pool.stats()["kinds"]["parse"]["errors"] == 1
+
+
+def test_full_queue_rejects_and_wait_time_is_measured(pool):
+    pool.run_sync(time.sleep, 0, kind="warmup")
+    threads = [threading.Thread(target=pool.run_sync, args=(time.sleep, 0.5), kwargs={"kind": "slow"}) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.1)
+
+    with pytest.raises(PoolBusyError):
+        pool.run_sync(time.sleep, 0, kind="slow")
+    for thread in threads:
+        thread.join()
+
+    slow = pool.stats()["kinds"]["slow"]
+    assert (slow["completed"], slow["rejected"]) == (2, 1)
+    # 第二个任务排在第一个之后
+    assert slow["max_wait_ms"] >= 200
+    assert slow["max_exec_ms"] >= 400
+
+
+def test_async_callers_share_the_queue_bound(pool):
+    async def scenario():
+        await pool.run(time.sleep, 0, kind="warmup")
+        return await asyncio.gather(
+            *(pool.run(time.sleep, 0.3, kind="slow") for _ in range(6)),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+    assert sum(isinstance(result, PoolBusyError) for result in results) == 4
+    slow = pool.stats()["kinds"]["slow"]
+    assert (slow["completed"], slow["rejected"]) == (2, 4)
+    # 第二个任务在等待线程中排队的时间也计入等待时间
+    assert slow["max_wait_ms"] >= 200
+    assert pool.stats()["pending"] == 0
+
+
+def test_upload_parses_in_pool(client):
+    from app.services.cpu_pool import cpu_pool
+
+    before = cpu_pool.stats()["kinds"].get("metadata", {}).get("completed", 0)
+    upload(client, unique_pages(3))
+    assert cpu_pool.stats()["kinds"]["metadata"]["completed"] == before + 1
+
+    response = client.post(
+        "/api/pdfs/upload",
+        files={"file": ("broken.pdf", b"%PDF-1.4\nnot really a pdf", "application/pdf")}
+    )
+    assert response.status_code == 500
+    assert "PDF解析失败" in response.json()["detail"]
+    assert cpu_pool.stats()["kinds"]["metadata"]["errors"] >= 1
+    assert client.get("/health").status_code == 200
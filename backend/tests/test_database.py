@@ -0,0 +1,55 @@
+"""数据库配置：SQLite连接开启WAL和性能PRAGMA，并发写入等待写锁而不是失败"""
+import threading
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from app.config import settings
+from app.database.engine import create_db_engine, database_info
+from app.database.models import engine
+
+
+def test_sqlite_connections_get_pragmas(tmp_path):
+    test_engine = create_db_engine(f"sqlite:///{tmp_path / 'pragmas.db'}")
+    try:
+        with test_engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+            assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+            assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == settings.SQLITE_BUSY_TIMEOUT
+            assert conn.exec_driver_sql("PRAGMA cache_size").scalar() == settings.SQLITE_CACHE_SIZE
+            assert conn.exec_driver_sql("PRAGMA temp_store").scalar() == 2  # MEMORY
+        assert test_engine.pool.size() == settings.DB_POOL_SIZE
+    finally:
+        test_engine.dispose()
+
+
+def test_concurrent_writers_wait_for_lock(tmp_path):
+    test_engine = create_db_engine(f"sqlite:///{tmp_path / 'writers.db'}")
+    with test_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE counters (id INTEGER PRIMARY KEY, writer INTEGER)"))
+    errors = []
+
+    def write(writer: int):
+        try:
+            for _ in range(25):
+                with test_engine.begin() as conn:
+                    conn.execute(text("INSERT INTO counters (writer) VALUES (:writer)"), {"writer": writer})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(writer,)) for writer in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        assert errors == []
+        with test_engine.connect() as conn:
+            assert conn.execute(text("SELECT count(*) FROM counters")).scalar() == 200
+    finally:
+        test_engine.dispose()
+
+
+def test_application_engine_uses_configured_url():
+    assert make_url(str(engine.url)).database == make_url(settings.DATABASE_URL).database
+    info = database_info(engine)
+    assert info["dialect"] == "sqlite"
+    assert info["journal_mode"] == "wal"
@@ -0,0 +1,147 @@
+"""内容去重：重复上传共用一份页文本、摘要、结构分析和页索引；删除owner时转给下一条记录"""
+import os
+import threading
+from app.database.models import PDF, PDFPageText, PDFSummary, PDFTextExtraction, SessionLocal
+from app.services.blob_service import blob_store
+from helpers import make_pdf, unique_pages, wait_for
+
+
+def _upload_bytes(client, data, filename="dup.pdf"):
+    response = client.post("/api/pdfs/upload", files={"file": (filename, data, "application/pdf")})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _completed(db, pdf_id):
+    db.expire_all()
+    return db.query(PDFTextExtraction).filter_by(pdf_id=pdf_id, status="completed").first() is not None
+
+
+def _page_rows(db, pdf_id):
+    db.expire_all()
+    return db.query(PDFPageText).filter(PDFPageText.pdf_id == pdf_id).count()
+
+
+def _uploaded_pair(client, db, pages):
+    data = make_pdf(pages)
+    first = _upload_bytes(client, data)
+    assert wait_for(lambda: _completed(db, first["id"]))
+    second = _upload_bytes(client, data, "copy.pdf")
+    assert second["deduplicated"]
+    return first, second
+
+
+def test_duplicate_upload_shares_artifacts_without_copying(client, db):
+    pages = unique_pages(3)
+    token = pages[0].split()[2]
+    first, second = _uploaded_pair(client, db, pages)
+
+    assert _page_rows(db, first["id"]) == 3
+    assert _page_rows(db, second["id"]) == 0
+    assert db.query(PDFTextExtraction).filter_by(pdf_id=second["id"]).count() == 0
+
+    text = client.get(f"/api/pdfs/{second['id']}/text").json()
+    assert text["status"] == "completed" and len(text["pages"]) == 3
+
+    db.add(PDFSummary(pdf_id=first["id"], summary_text="共用的摘要"))
+    db.commit()
+    summary = client.get(f"/api/pdfs/{second['id']}/summary").json()
+    assert summary["pdf_id"] == second["id"] and summary["summary"] == "共用的摘要"
+
+    # 全局检索中每页只命中一次；按副本检索时页命中归属于副本
+    hits = client.get("/api/search", params={"q": token, "kind": "page"}).json()["results"]
+    assert sorted(hit["page_number"] for hit in hits) == [1, 2, 3]
+    hits = client.get("/api/search", params={"q": token, "pdf_id": second["id"]}).json()["results"]
+    assert {hit["pdf_id"] for hit in hits} == {second["id"]} and len(hits) == 3
+
+
+def test_deleting_owner_hands_artifacts_to_duplicate(client, db):
+    pages = unique_pages(2)
+    token = pages[0].split()[2]
+    first, second = _uploaded_pair(client, db, pages)
+    db.add(PDFSummary(pdf_id=first["id"], summary_text="原摘要"))
+    db.commit()
+    file_path = db.query(PDF.file_path).filter(PDF.id == second["id"]).scalar()
+
+    assert client.delete(f"/api/pdfs/{first['id']}").status_code == 200
+
+    assert os.path.exists(file_path)
+    assert _page_rows(db, second["id"]) == 2
+    assert client.get(f"/api/pdfs/{second['id']}/summary").json()["summary"] == "原摘要"
+    text = client.get(f"/api/pdfs/{second['id']}/text").json()
+    assert text["status"] == "completed" and len(text["pages"]) == 2
+    hits = client.get("/api/search", params={"q": token, "kind": "page"}).json()["results"]
+    assert {hit["pdf_id"] for hit in hits} == {second["id"]} and len(hits) == 2
+
+
+def test_collapse_duplicates_removes_copied_rows(client, db):
+    first, second = _uploaded_pair(client, db, unique_pages(2))
+    # 模拟升级前按记录复制的数据
+    for page in db.query(PDFPageText).filter(PDFPageText.pdf_id == first["id"]).all():
+        db.add(PDFPageText(pdf_id=second["id"], page_number=page.page_number, text=page.text,
+                           char_count=page.char_count))
+    db.add(PDFTextExtraction(pdf_id=second["id"], status="completed", page_count=2, pages_done=2))
+    db.add(PDFSummary(pdf_id=second["id"], summary_text="复制的摘要"))
+    db.commit()
+
+    assert blob_store.collapse_duplicates() >= 1
+
+    assert _page_rows(db, second["id"]) == 0
+    assert _page_rows(db, first["id"]) == 2
+    assert db.query(PDFSummary.pdf_id).filter(PDFSummary.summary_text == "复制的摘要").scalar() == first["id"]
+
+
+
+def test_concurrent_deletes_of_shared_file_remove_it_once(client, db):
+    first, second = _uploaded_pair(client, db, unique_pages(2))
+    file_path, content_hash = db.query(PDF.file_path, PDF.content_hash).filter(PDF.id == first["id"]).one()
+    sessions = [SessionLocal(), SessionLocal()]
+    try:
+        # 两个删除都在对方提交前释放引用，各自都看到对方仍在
+        pdfs = [session.get(PDF, pdf["id"]) for session, pdf in zip(sessions, (second, first))]
+        assert [blob_store.release(session, pdf) for session, pdf in zip(sessions, pdfs)] == [False, False]
+        assert os.path.exists(file_path)
+
+        sessions[1].delete(pdfs[1])
+        sessions[1].commit()
+        assert not blob_store.discard(sessions[1], file_path, content_hash)
+        sessions[0].delete(pdfs[0])
+        sessions[0].commit()
+        # 最后提交的一方复查引用数后删除文件
+        assert blob_store.discard(sessions[0], file_path, content_hash)
+    finally:
+        for session in sessions:
+            session.close()
+    assert not os.path.exists(file_path)
+
+
+def test_delete_does_not_remove_file_claimed_by_upload(client, db):
+    first = _upload_bytes(client, make_pdf(unique_pages(1)))
+    columns = ("filename", "file_path", "file_size", "content_hash", "page_count", "is_scanned")
+    record = dict(zip(columns, db.query(*(getattr(PDF, name) for name in columns))
+                      .filter(PDF.id == first["id"]).one()))
+    file_path = record["file_path"]
+    result = {}
+
+    # 上传已找到可复用的文件（持有内容哈希锁）但尚未提交新记录
+    lock = blob_store.lock(record["content_hash"])
+    lock.acquire()
+    try:
+        deleting = threading.Thread(
+            target=lambda: result.update(response=client.delete(f"/api/pdfs/{first['id']}"))
+        )
+        deleting.start()
+        assert wait_for(lambda: _gone(db, first["id"]))
+        db.add(PDF(original_filename="copy.pdf", **record))
+        db.commit()
+    finally:
+        lock.release()
+    deleting.join(timeout=20)
+
+    assert result["response"].status_code == 200
+    assert os.path.exists(file_path)
+
+
+def _gone(db, pdf_id):
+    db.expire_all()
+    return db.query(PDF.id).filter(PDF.id == pdf_id).first() is None
@@ -0,0 +1,50 @@
+"""检索索引：检索模式开启前上传的PDF在首次查询时补建，查询按块计算相似度"""
+import os
+import numpy as np
+from app.config import settings
+from app.database.models import PDFTextExtraction
+from app.services import embedding_service as module
+from app.services.embedding_service import embedding_index
+from helpers import unique_pages, upload, wait_for
+
+
+def _uploaded_with_text(client, db, pages):
+    pdf = upload(client, pages)
+    assert wait_for(lambda: db.query(PDFTextExtraction).filter_by(
+        pdf_id=pdf["id"], status="completed"
+    ).populate_existing().first() is not None)
+    return pdf, db.query(module.PDF.file_path).filter(module.PDF.id == pdf["id"]).scalar()
+
+
+def test_index_is_built_on_first_search(client, db, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_CONTEXT_MODE", "full")
+    pages = unique_pages(3)
+    pages[1] = pages[1] + " eigenvalue decomposition"
+    pdf, pdf_path = _uploaded_with_text(client, db, pages)
+    assert embedding_index._load(pdf_path) is None
+
+    monkeypatch.setattr(settings, "CHAT_CONTEXT_MODE", "retrieval")
+    chunks = embedding_index.search(pdf_path, "eigenvalue")
+    assert chunks and chunks[0]["page_number"] == 2
+    assert os.path.exists(os.path.join(embedding_index._index_dir(pdf_path), "vectors.npy"))
+
+
+def test_pages_update_outside_retrieval_mode_drops_stale_index(client, db, monkeypatch):
+    pdf, pdf_path = _uploaded_with_text(client, db, unique_pages(2))
+    embedding_index.build(pdf["id"])
+    assert embedding_index._load(pdf_path) is not None
+
+    monkeypatch.setattr(settings, "CHAT_CONTEXT_MODE", "full")
+    embedding_index.on_pages_updated(pdf["id"])
+    assert not os.path.exists(embedding_index._index_dir(pdf_path))
+
+
+def test_blocked_scoring_matches_full_product(monkeypatch):
+    monkeypatch.setattr(module, "_SCORE_BLOCK_ROWS", 3)
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((10, 16)).astype(np.float16)
+    query = rng.standard_normal(16).astype(np.float32)
+
+    scores = embedding_index._score(vectors, query)
+    assert scores.dtype == np.float32
+    np.testing.assert_allclose(scores, vectors.astype(np.float32) @ query, rtol=1e-5)
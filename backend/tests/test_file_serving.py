@@ -0,0 +1,56 @@
+"""PDF文件下载：ETag/304、Range，旧的 /uploads 路径重定向到文件接口"""
+from app.database.models import PDF
+from helpers import make_pdf, unique_pages
+
+
+def test_file_endpoint_supports_etag_and_range(client):
+    data = make_pdf(unique_pages(2))
+    pdf = client.post("/api/pdfs/upload", files={"file": ("a.pdf", data, "application/pdf")}).json()
+
+    full = client.get(f"/api/pdfs/{pdf['id']}/file")
+    assert full.status_code == 200 and full.content == data
+    cached = client.get(f"/api/pdfs/{pdf['id']}/file", headers={"If-None-Match": full.headers["etag"]})
+    assert cached.status_code == 304
+
+    partial = client.get(f"/api/pdfs/{pdf['id']}/file", headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206 and partial.content == data[:10]
+
+
+def test_legacy_uploads_path_redirects(client, db):
+    data = make_pdf(unique_pages(1))
+    pdf = client.post("/api/pdfs/upload", files={"file": ("b.pdf", data, "application/pdf")}).json()
+    filename = db.query(PDF.filename).filter(PDF.id == pdf["id"]).scalar()
+
+    response = client.get(f"/uploads/{filename}", follow_redirects=False)
+    assert response.status_code == 301
+    assert response.headers["location"] == f"/api/pdfs/{pdf['id']}/file"
+    assert client.get(f"/uploads/{filename}").content == data
+    assert client.get("/uploads/missing.pdf", follow_redirects=False).status_code == 404
+
+
+def test_only_versioned_urls_are_immutable(client):
+    data = make_pdf(unique_pages(1))
+    pdf = client.post("/api/pdfs/upload", files={"file": ("c.pdf", data, "application/pdf")}).json()
+    content_hash = client.get(f"/api/pdfs/{pdf['id']}").json()["content_hash"]
+    assert content_hash
+
+    bare = client.get(f"/api/pdfs/{pdf['id']}/file")
+    assert bare.headers["cache-control"] == "no-cache"
+    assert bare.headers["etag"] == f'"{content_hash}"'
+    versioned = client.get(f"/api/pdfs/{pdf['id']}/file", params={"v": content_hash})
+    assert "immutable" in versioned.headers["cache-control"]
+    stale = client.get(f"/api/pdfs/{pdf['id']}/file", params={"v": "0" * 64})
+    assert stale.headers["cache-control"] == "no-cache"
+
+
+def test_reused_id_gets_new_validator(client):
+    first = client.post("/api/pdfs/upload", files={"file": ("d.pdf", make_pdf(unique_pages(1)), "application/pdf")}).json()
+    etag = client.get(f"/api/pdfs/{first['id']}/file").headers["etag"]
+    assert client.delete(f"/api/pdfs/{first['id']}").status_code == 200
+
+    data = make_pdf(unique_pages(1))
+    second = client.post("/api/pdfs/upload", files={"file": ("e.pdf", data, "application/pdf")}).json()
+    # 删除最新的记录后ID会被复用
+    assert second["id"] == first["id"]
+    revalidated = client.get(f"/api/pdfs/{second['id']}/file", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 200 and revalidated.content == data
@@ -0,0 +1,55 @@
+"""异步模型调用：慢调用不阻塞事件循环，共享客户端按并发上限排队"""
+import asyncio
+import threading
+import time
+import httpx
+from app.config import settings
+from app.services.http_client import GeminiHTTPClient
+from helpers import unique_pages, upload, wait_for
+
+
+def test_slow_model_call_does_not_block_other_requests(client, fake_model):
+    pdf = upload(client, unique_pages(1))
+    fake_model.delay = 1.0
+    results = []
+    request = {"pdf_id": pdf["id"], "selected_text": "lorem", "page_number": 1, "no_cache": True}
+    thread = threading.Thread(
+        target=lambda: results.append(client.post("/api/chat/explain", json=request).status_code)
+    )
+    thread.start()
+    assert wait_for(lambda: fake_model.requests, interval=0.01)
+
+    started = time.monotonic()
+    assert client.get("/health").status_code == 200
+    assert time.monotonic() - started < 0.5
+    thread.join()
+    assert results == [200]
+
+
+def test_concurrency_limit_and_connection_reuse(monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_MAX_CONCURRENCY", 2)
+    active = 0
+    peak = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.05)
+        active -= 1
+        return httpx.Response(200, json={"ok": True})
+
+    http = GeminiHTTPClient()
+
+    async def scenario():
+        client = http._ensure_client()
+        assert http._ensure_client() is client
+        # 保留原客户端的限流配置，只替换网络传输
+        http._client = httpx.AsyncClient(base_url="http://model.test", transport=httpx.MockTransport(handler))
+        results = await asyncio.gather(*(http.post_json("/chat", {"n": n}) for n in range(6)))
+        await http.close()
+        await client.aclose()
+        return results
+
+    assert asyncio.run(scenario()) == [{"ok": True}] * 6
+    assert peak == 2
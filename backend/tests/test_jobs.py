@@ -0,0 +1,62 @@
+"""后台任务队列：按类型限制并发、占用名额后才标记running、某类任务占满时不阻塞其他类型"""
+import asyncio
+import threading
+from app.config import settings
+from app.database.models import BackgroundJob
+from app.services.job_service import job_queue
+from helpers import unique_pages, upload, wait_for
+
+
+def _status(db, job_id):
+    db.expire_all()
+    return db.query(BackgroundJob.status).filter(BackgroundJob.id == job_id).scalar()
+
+
+def _blocking_handler(release: threading.Event, started: list):
+    async def handler(pdf_id, report):
+        started.append(pdf_id)
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+        return {"pdf_id": pdf_id}
+    return handler
+
+
+def test_kind_limit_is_applied_before_marking_running(client, db, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_KIND_CONCURRENCY", 1)
+    release = threading.Event()
+    started = []
+    job_queue.register("test_slow", _blocking_handler(release, started))
+
+    async def quick(pdf_id, report):
+        return {"done": pdf_id}
+    job_queue.register("test_fast", quick)
+
+    pdfs = [upload(client, unique_pages(1)) for _ in range(3)]
+    try:
+        first = client.portal.call(job_queue.enqueue, "test_slow", pdfs[0]["id"])
+        second = client.portal.call(job_queue.enqueue, "test_slow", pdfs[1]["id"])
+        fast = client.portal.call(job_queue.enqueue, "test_fast", pdfs[2]["id"])
+
+        assert wait_for(lambda: _status(db, first["id"]) == "running")
+        # 第二个同类任务只是在等待名额，不应显示为running；其他类型的任务不受阻塞
+        assert wait_for(lambda: _status(db, fast["id"]) == "completed")
+        assert _status(db, second["id"]) == "queued"
+        assert started == [pdfs[0]["id"]]
+        assert job_queue.stats()["running_by_kind"] == {"test_slow": 1}
+    finally:
+        release.set()
+
+    assert wait_for(lambda: _status(db, second["id"]) == "completed")
+    assert started == [pdfs[0]["id"], pdfs[1]["id"]]
+
+
+def test_duplicate_enqueue_returns_active_job(client):
+    release = threading.Event()
+    job_queue.register("test_dedupe", _blocking_handler(release, []))
+    pdf = upload(client, unique_pages(1))
+    try:
+        first = client.portal.call(job_queue.enqueue, "test_dedupe", pdf["id"])
+        again = client.portal.call(job_queue.enqueue, "test_dedupe", pdf["id"])
+        assert again["id"] == first["id"]
+    finally:
+        release.set()
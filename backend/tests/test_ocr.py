@@ -0,0 +1,45 @@
+"""扫描版PDF的OCR：文本提取完成后自动排队，逐页识别写入页文本，失败的页在重试时继续"""
+import uuid
+from app.config import settings
+from app.services import ocr_service as module
+from app.services.ocr_service import OCRPipeline
+from helpers import upload, wait_for
+
+
+def test_scanned_pdf_is_recognized_and_searchable(client, monkeypatch):
+    monkeypatch.setattr(OCRPipeline, "available", property(lambda self: True))
+    monkeypatch.setattr(settings, "JOB_RETRY_BASE_DELAY", 0.05)
+    token = uuid.uuid4().hex[:8]
+    calls = []
+    original = module.cpu_pool.run
+
+    async def fake_run(fn, *args, **kwargs):
+        if fn is not module.pdf_workers.ocr_page:
+            return await original(fn, *args, **kwargs)
+        page_number = args[1]
+        calls.append(page_number)
+        if page_number == 2 and calls.count(2) == 1:
+            raise RuntimeError("tesseract crashed")
+        return f"识别文本 scanned{token} 第{page_number}页 矩阵乘法的结合律"
+
+    monkeypatch.setattr(module.cpu_pool, "run", fake_run)
+
+    # 几乎没有文本层的PDF被判定为扫描版
+    pdf = upload(client, ["", token, ""])
+    assert pdf["is_scanned"]
+
+    def status():
+        return client.get(f"/api/pdfs/{pdf['id']}/ocr").json()
+
+    assert wait_for(lambda: status()["pages_ocr"] == 3)
+    final = status()
+    assert final["pages_pending"] == 0
+    assert final["job"]["status"] == "completed"
+    # 第2页第一次失败，重试时只识别该页
+    assert sorted(calls) == [1, 2, 2, 3]
+
+    results = client.get("/api/search", params={"q": f"scanned{token}", "pdf_id": pdf["id"]}).json()["results"]
+    assert {hit["page_number"] for hit in results} == {1, 2, 3}
+
+    # 没有待识别的页时不再排队
+    assert client.post(f"/api/pdfs/{pdf['id']}/ocr").status_code == 409
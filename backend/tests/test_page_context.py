@@ -0,0 +1,59 @@
+"""页级上下文：只发送所选页附近的切片，并注明与原文档页码的对应关系"""
+import base64
+import io
+import PyPDF2
+from app.config import settings
+from helpers import unique_pages, upload
+
+
+def _pdf_parts(payload):
+    return [
+        part for part in payload["messages"][0]["content"]
+        if part.get("type") == "image_url" and part["image_url"]["url"].startswith("data:application/pdf")
+    ]
+
+
+def _page_count(part):
+    data = part["image_url"]["url"].split(",", 1)[1]
+    return len(PyPDF2.PdfReader(io.BytesIO(base64.b64decode(data))).pages)
+
+
+def test_pages_mode_sends_window_with_offset_note(client, fake_model, monkeypatch):
+    monkeypatch.setattr(settings, "PDF_CONTEXT_MODE", "pages")
+    monkeypatch.setattr(settings, "PDF_CONTEXT_WINDOW", 2)
+    pdf = upload(client, unique_pages(10))
+
+    response = client.post("/api/chat/explain", json={
+        "pdf_id": pdf["id"], "selected_text": "lorem", "page_number": 7, "no_cache": True
+    })
+    assert response.status_code == 200
+    payload = fake_model.requests[-1]
+    [part] = _pdf_parts(payload)
+    assert _page_count(part) == 5
+    assert "原文档第5-9页" in fake_model.prompt_text(payload)
+
+
+def test_window_is_clamped_at_document_end(client, fake_model, monkeypatch):
+    monkeypatch.setattr(settings, "PDF_CONTEXT_MODE", "pages")
+    monkeypatch.setattr(settings, "PDF_CONTEXT_WINDOW", 2)
+    pdf = upload(client, unique_pages(10))
+
+    client.post("/api/chat/explain", json={
+        "pdf_id": pdf["id"], "selected_text": "lorem", "page_number": 10, "no_cache": True
+    })
+    payload = fake_model.requests[-1]
+    assert _page_count(_pdf_parts(payload)[0]) == 3
+    assert "原文档第8-10页" in fake_model.prompt_text(payload)
+
+
+def test_full_mode_sends_whole_document(client, fake_model, monkeypatch):
+    monkeypatch.setattr(settings, "PDF_CONTEXT_MODE", "full")
+    monkeypatch.setattr(settings, "PDF_TRANSPORT", "inline")
+    pdf = upload(client, unique_pages(6))
+
+    client.post("/api/chat/explain", json={
+        "pdf_id": pdf["id"], "selected_text": "lorem", "page_number": 3, "no_cache": True
+    })
+    payload = fake_model.requests[-1]
+    assert _page_count(_pdf_parts(payload)[0]) == 6
+    assert "节选" not in fake_model.prompt_text(payload)
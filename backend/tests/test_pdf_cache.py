@@ -0,0 +1,79 @@
+"""PDF base64缓存：按内容哈希寻址、按总字节数LRU淘汰、重复提问不再读取和编码文件"""
+import base64
+from app.config import settings
+from app.services.pdf_cache import PDFBase64Cache, pdf_cache
+from helpers import make_pdf, unique_pages, upload
+
+
+def _write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_same_content_at_two_paths_shares_entry(tmp_path):
+    cache = PDFBase64Cache(max_bytes=10 ** 6)
+    data = make_pdf(unique_pages(2))
+    first = _write(tmp_path / "a.pdf", data)
+    second = _write(tmp_path / "b.pdf", data)
+
+    assert base64.b64decode(cache.get_pdf_base64(first)) == data
+    assert cache.get_pdf_base64(second) == cache.get_pdf_base64(first)
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 2, 1)
+
+    # 删除其中一个路径时，另一个路径仍引用同一内容
+    cache.invalidate(first)
+    assert cache.stats()["entries"] == 1
+
+
+def test_changed_file_is_reencoded(tmp_path):
+    cache = PDFBase64Cache(max_bytes=10 ** 6)
+    path = _write(tmp_path / "a.pdf", make_pdf(unique_pages(1)))
+    before = cache.get_pdf_base64(path)
+
+    updated = make_pdf(unique_pages(3))
+    _write(tmp_path / "a.pdf", updated)
+    assert cache.get_pdf_base64(path) != before
+    assert base64.b64decode(cache.get_pdf_base64(path)) == updated
+    assert cache.stats()["misses"] == 2
+
+
+def test_evicts_least_recently_used_by_bytes(tmp_path):
+    paths = [_write(tmp_path / f"{index}.pdf", make_pdf(unique_pages(1))) for index in range(3)]
+    size = len(base64.b64encode(open(paths[0], "rb").read()))
+    cache = PDFBase64Cache(max_bytes=size * 2 + size // 2)
+
+    cache.get_pdf_base64(paths[0])
+    cache.get_pdf_base64(paths[1])
+    cache.get_pdf_base64(paths[0])
+    cache.get_pdf_base64(paths[2])
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["total_bytes"] <= cache.max_bytes
+
+    hits = cache.stats()["hits"]
+    cache.get_pdf_base64(paths[0])
+    assert cache.stats()["hits"] == hits + 1
+    cache.get_pdf_base64(paths[1])
+    assert cache.stats()["misses"] == 4
+
+
+def test_oversized_entry_is_not_cached(tmp_path):
+    cache = PDFBase64Cache(max_bytes=10)
+    path = _write(tmp_path / "a.pdf", make_pdf(unique_pages(1)))
+    cache.get_pdf_base64(path)
+    assert cache.stats()["entries"] == 0
+
+
+def test_repeated_questions_reuse_encoding(client, fake_model, monkeypatch):
+    monkeypatch.setattr(settings, "PDF_CONTEXT_MODE", "full")
+    monkeypatch.setattr(settings, "PDF_TRANSPORT", "inline")
+    pdf = upload(client, unique_pages(3))
+    request = {"pdf_id": pdf["id"], "selected_text": "lorem", "page_number": 1, "no_cache": True}
+
+    assert client.post("/api/chat/explain", json=request).status_code == 200
+    misses = pdf_cache.stats()["misses"]
+    hits = pdf_cache.stats()["hits"]
+    assert client.post("/api/chat/explain", json=request).status_code == 200
+    assert pdf_cache.stats()["misses"] == misses
+    assert pdf_cache.stats()["hits"] > hits
+    assert len(fake_model.requests) == 2
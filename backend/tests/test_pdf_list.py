@@ -0,0 +1,52 @@
+"""PDF列表ETag：校验值来自廉价的聚合查询，命中时不查询列表行"""
+from sqlalchemy import event
+from app.database.models import engine
+from app.services.access_tracker import access_tracker
+from helpers import unique_pages, upload
+
+
+class _Statements:
+    def __init__(self):
+        self.sql = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.sql.append(statement)
+
+
+def test_not_modified_is_returned_before_fetching_rows(client):
+    upload(client, unique_pages(1))
+    first = client.get("/api/pdfs/", params={"limit": 5})
+    etag = first.headers["etag"]
+
+    statements = _Statements()
+    event.listen(engine, "before_cursor_execute", statements)
+    try:
+        cached = client.get("/api/pdfs/", params={"limit": 5}, headers={"If-None-Match": etag})
+    finally:
+        event.remove(engine, "before_cursor_execute", statements)
+    assert cached.status_code == 304
+    assert not any("pdfs.original_filename" in sql and "LIMIT" in sql for sql in statements.sql)
+
+
+def test_etag_changes_with_uploads_deletes_and_access(client):
+    def etag():
+        return client.get("/api/pdfs/", params={"limit": 5}).headers["etag"]
+
+    pdf = upload(client, unique_pages(1))
+    before_access = etag()
+    assert etag() == before_access
+
+    client.get(f"/api/pdfs/{pdf['id']}")
+    access_tracker.flush()
+    after_access = etag()
+    assert after_access != before_access
+
+    other = upload(client, unique_pages(1))
+    after_upload = etag()
+    assert after_upload != after_access
+
+    client.delete(f"/api/pdfs/{other['id']}")
+    assert etag() != after_upload
+
+    # 不同查询参数的ETag不同
+    assert client.get("/api/pdfs/", params={"limit": 6}).headers["etag"] != etag()
@@ -0,0 +1,118 @@
+"""服务商文件句柄：复用、失败缓存、并发合并；只有句柄被拒绝时才清除并内联重试"""
+import asyncio
+import httpx
+import pytest
+from app.config import settings
+from app.services.gemini_service import GeminiService
+from app.services.provider_file_service import provider_files
+from helpers import unique_pages, upload
+
+
+def _pdf_path(db, pdf_id):
+    from app.database.models import PDF
+    return db.query(PDF.file_path).filter(PDF.id == pdf_id).scalar()
+
+
+def test_handle_is_uploaded_once_and_reused(client, fake_model, db, monkeypatch):
+    monkeypatch.setattr(settings, "PDF_TRANSPORT", "file")
+    path = _pdf_path(db, upload(client, unique_pages(2))["id"])
+
+    async def fetch_twice():
+        return [await provider_files.get_file_id(path), await provider_files.get_file_id(path)]
+
+    assert asyncio.run(fetch_twice()) == ["file-1", "file-1"]
+    assert fake_model.uploads == 1
+
+
+def test_concurrent_requests_share_one_upload(client, fake_model, db, monkeypatch):
+    monkeypatch.setattr(settings, "PDF_TRANSPORT", "file")
+    path = _pdf_path(db, upload(client, unique_pages(2))["id"])
+
+    async def fetch_concurrently():
+        return await asyncio.gather(*(provider_files.get_file_id(path) for _ in range(5)))
+
+    assert set(asyncio.run(fetch_concurrently())) == {"file-1"}
+    assert fake_model.uploads == 1
+
+
+def test_failed_upload_is_not_retried_within_ttl(client, fake_model, db, monkeypatch):
+    monkeypatch.setattr(settings, "PDF_TRANSPORT", "file")
+    monkeypatch.setattr(settings, "PROVIDER_FILE_FAILURE_TTL", 60)
+    fake_model.fail_uploads = True
+    path = _pdf_path(db, upload(client, unique_pages(2))["id"])
+
+    assert asyncio.run(provider_files.get_file_id(path)) is None
+    assert asyncio.run(provider_files.get_file_id(path)) is None
+    assert fake_model.uploads == 1
+
+    # 失败记录过期后重新尝试
+    monkeypatch.setitem(provider_files._failures, path, 0)
+    fake_model.fail_uploads = False
+    assert asyncio.run(provider_files.get_file_id(path)) == "file-2"
+
+
+def test_inline_mode_never_uploads(client, fake_model, db, monkeypatch):
+    monkeypatch.setattr(settings, "PDF_TRANSPORT", "inline")
+    path = _pdf_path(db, upload(client, unique_pages(1))["id"])
+    assert asyncio.run(provider_files.get_file_id(path)) is None
+    assert fake_model.uploads == 0
+
+
+def _status_error(status: int, body: str) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://provider.test/v1/chat/completions")
+    return httpx.HTTPStatusError(
+        f"{status} error", request=request, response=httpx.Response(status, text=body, request=request)
+    )
+
+
+def _call(service, path, stream=False):
+    async def build_messages(allow_file):
+        part = await service._pdf_content_part(path, allow_file)
+        return [{"role": "user", "content": [{"type": "text", "text": "问题"}, part]}]
+
+    async def run():
+        if stream:
+            return "".join([chunk async for chunk in service._stream_messages(path, build_messages, 100)])
+        return await service._complete_messages(path, build_messages, 100)
+
+    return asyncio.run(run())
+
+
+def _rejecting(error):
+    """带文件句柄的请求抛出error，内联请求正常回复"""
+    def reply(payload):
+        if any(part.get("type") == "file" for part in payload["messages"][0]["content"]):
+            raise error
+        return "内联答案"
+    return reply
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_rejected_handle_is_invalidated_and_retried_inline(client, fake_model, db, monkeypatch, stream):
+    monkeypatch.setattr(settings, "PDF_TRANSPORT", "file")
+    path = _pdf_path(db, upload(client, unique_pages(1))["id"])
+    fake_model.reply = _rejecting(_status_error(404, '{"error": "File file-1 not found"}'))
+
+    assert _call(GeminiService(), path, stream) == "内联答案"
+    assert len(fake_model.requests) == 2
+    # 句柄已清除，下次请求重新上传
+    assert asyncio.run(provider_files.get_file_id(path)) == "file-2"
+
+
+@pytest.mark.parametrize("error", [
+    _status_error(503, "service unavailable"),
+    _status_error(429, "rate limit exceeded for file uploads"),
+    _status_error(400, "max_tokens is too large"),
+    httpx.ReadTimeout("timed out"),
+])
+@pytest.mark.parametrize("stream", [False, True])
+def test_other_failures_keep_handle_and_are_raised(client, fake_model, db, monkeypatch, error, stream):
+    monkeypatch.setattr(settings, "PDF_TRANSPORT", "file")
+    path = _pdf_path(db, upload(client, unique_pages(1))["id"])
+    fake_model.reply = _rejecting(error)
+
+    with pytest.raises(Exception, match="API request failed"):
+        _call(GeminiService(), path, stream)
+    assert len(fake_model.requests) == 1
+    assert asyncio.run(provider_files.get_file_id(path)) == "file-1"
+    assert fake_model.uploads == 1
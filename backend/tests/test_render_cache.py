@@ -0,0 +1,78 @@
+"""页面渲染缓存：按字节数LRU淘汰、重启后按mtime恢复、磁盘访问不在事件循环线程上执行"""
+import asyncio
+import os
+import threading
+from app.services import render_service as module
+from app.services.render_service import DiskLRUCache, PageRenderer
+
+
+def _write(root, key, size):
+    path = os.path.join(root, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+
+def test_evicts_least_recently_used(tmp_path):
+    root = str(tmp_path)
+    cache = DiskLRUCache(root, max_bytes=250)
+    for key in ("a/1.png", "a/2.png"):
+        cache.add(key, os.path.getsize(_write(root, key, 100)))
+    assert cache.get("a/1.png")
+
+    cache.add("a/3.png", os.path.getsize(_write(root, "a/3.png", 100)))
+    assert cache.get("a/2.png") is None
+    assert not os.path.exists(os.path.join(root, "a/2.png"))
+    assert cache.get("a/1.png") and cache.get("a/3.png")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_reload_orders_by_mtime_and_drops_temp_files(tmp_path):
+    root = str(tmp_path)
+    for index, key in enumerate(("old.png", "new.png")):
+        path = _write(root, key, 100)
+        os.utime(path, (1000 + index, 1000 + index))
+    _write(root, "partial.png.tmp", 10)
+
+    cache = DiskLRUCache(root, max_bytes=250)
+    cache.add("third.png", os.path.getsize(_write(root, "third.png", 100)))
+    assert not os.path.exists(os.path.join(root, "partial.png.tmp"))
+    assert cache.get("old.png") is None
+    assert cache.get("new.png")
+
+
+def test_render_keeps_disk_access_off_event_loop(tmp_path, monkeypatch):
+    renderer = PageRenderer()
+    renderer.cache = DiskLRUCache(str(tmp_path), max_bytes=10 ** 6)
+    threads = {}
+
+    def track(name, fn):
+        def wrapper(*args, **kwargs):
+            threads.setdefault(name, threading.get_ident())
+            return fn(*args, **kwargs)
+        return wrapper
+
+    async def fake_run(fn, pdf_path, page, dpi, fmt, output_path, *args, **kwargs):
+        with open(output_path, "wb") as f:
+            f.write(b"image")
+        return 5
+
+    monkeypatch.setattr(renderer, "_pdf_info", lambda pdf_id: ("unused.pdf", 3, "ab" * 32))
+    monkeypatch.setattr(module.cpu_pool, "run", fake_run)
+    monkeypatch.setattr(renderer.cache, "_load", track("load", renderer.cache._load))
+    monkeypatch.setattr(renderer.cache, "get", track("get", renderer.cache.get))
+    monkeypatch.setattr(renderer.cache, "add", track("add", renderer.cache.add))
+
+    async def scenario():
+        loop_thread = threading.get_ident()
+        first, key, _ = await renderer.render(1, 2, 150, "png")
+        second, _, _ = await renderer.render(1, 2, 150, "png")
+        return loop_thread, first, second, key
+
+    loop_thread, first, second, key = asyncio.run(scenario())
+    assert first == second and os.path.exists(first)
+    assert renderer.renders == 1
+    assert renderer.cache.stats()["hits"] == 1
+    assert set(threads) == {"load", "get", "add"}
+    assert loop_thread not in threads.values()
@@ -0,0 +1,75 @@
+"""回复缓存：命中/未命中、命中统计批量写入、按总字节数淘汰"""
+from datetime import datetime, timedelta
+from app.config import settings
+from app.database.models import AIResponseCache
+from app.services.response_cache import response_cache
+from helpers import unique_pages, upload
+
+
+def _entry(db, key):
+    db.expire_all()
+    return db.query(AIResponseCache).filter(AIResponseCache.cache_key == key).first()
+
+
+def test_repeated_explain_is_served_from_cache(client, fake_model):
+    pdf = upload(client, unique_pages(2))
+    request = {"pdf_id": pdf["id"], "selected_text": "lorem  ipsum", "page_number": 1}
+
+    first = client.post("/api/chat/explain", json=request)
+    second = client.post("/api/chat/explain", json={**request, "selected_text": "lorem ipsum\n"})
+    assert first.status_code == second.status_code == 200
+    assert first.json()["explanation"] == second.json()["explanation"]
+    assert len(fake_model.requests) == 1
+
+    client.post("/api/chat/explain", json={**request, "no_cache": True})
+    assert len(fake_model.requests) == 2
+
+
+def test_hits_are_written_in_batches(db):
+    response_cache.flush()
+    key = response_cache.make_key("explain", "test-model", "hash-hits", text="a")
+    response_cache.put(key, "explain", "test-model", "hash-hits", "回复")
+    written_at = _entry(db, key).last_accessed_at
+
+    assert response_cache.get(key) == "回复"
+    assert response_cache.get(key) == "回复"
+    entry = _entry(db, key)
+    assert (entry.hit_count or 0) == 0
+    assert entry.last_accessed_at == written_at
+
+    assert response_cache.flush() == 1
+    entry = _entry(db, key)
+    assert entry.hit_count == 2
+    assert entry.last_accessed_at >= written_at
+
+
+def test_miss_and_expiry(db, monkeypatch):
+    key = response_cache.make_key("explain", "test-model", "hash-expired", text="b")
+    assert response_cache.get(key) is None
+
+    response_cache.put(key, "explain", "test-model", "hash-expired", "旧回复")
+    db.query(AIResponseCache).filter(AIResponseCache.cache_key == key).update(
+        {"created_at": datetime.utcnow() - timedelta(seconds=settings.RESPONSE_CACHE_TTL + 1)}
+    )
+    db.commit()
+    assert response_cache.get(key) is None
+    assert _entry(db, key) is None
+
+
+def test_eviction_by_total_bytes(db, monkeypatch):
+    db.query(AIResponseCache).delete()
+    db.commit()
+    keys = []
+    for index in range(5):
+        key = response_cache.make_key("explain", "test-model", "hash-bytes", text=str(index))
+        response_cache.put(key, "explain", "test-model", "hash-bytes", "x" * 1000)
+        keys.append(key)
+    # 最早写入的条目最近被命中过，不应被淘汰
+    assert response_cache.get(keys[0])
+
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_MAX_BYTES", 2500)
+    response_cache._evict(db)
+
+    remaining = {entry.cache_key for entry in db.query(AIResponseCache).all()}
+    assert remaining == {keys[0], keys[4]}
+    assert response_cache.stats()["bytes"] <= 2500
@@ -0,0 +1,64 @@
+"""全文检索：两字中文词走二元组索引，按PDF过滤和删除不扫描FTS表"""
+from sqlalchemy import text
+from helpers import unique_pages, upload, wait_for
+
+
+def _annotate(client, pdf_id, content, page_number=1):
+    response = client.post("/api/annotations/", json={
+        "pdf_id": pdf_id, "page_number": page_number, "type": "note",
+        "text_content": content, "coordinates": {}
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _search(client, q, **params):
+    response = client.get("/api/search", params={"q": q, **params})
+    assert response.status_code == 200, response.text
+    return response.json()["results"]
+
+
+def test_two_character_chinese_terms(client):
+    pdf = upload(client, unique_pages(1))
+    note = _annotate(client, pdf["id"], "线性代数中的矩阵乘法满足结合律")
+
+    hits = _search(client, "矩阵", pdf_id=pdf["id"])
+    assert [hit["ref_id"] for hit in hits] == [note["id"]]
+    assert "<mark>矩阵</mark>" in hits[0]["snippet"]
+
+    # 单字、句末的字、与长词组合
+    assert _search(client, "律", pdf_id=pdf["id"])
+    assert _search(client, "乘法 结合律", pdf_id=pdf["id"])
+    assert not _search(client, "阵线", pdf_id=pdf["id"])
+    assert not _search(client, "矩阵 行列式", pdf_id=pdf["id"])
+
+
+def test_short_terms_use_index_not_scan(db):
+    plan = " ".join(str(row[-1]) for row in db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT search_index.kind FROM search_index "
+        "JOIN search_bigram ON search_bigram.rowid = search_index.rowid "
+        "JOIN search_entries ON search_entries.id = search_index.rowid "
+        "WHERE search_bigram MATCH :q AND search_entries.pdf_id = 1"
+    ), {"q": '"矩阵" *'}).fetchall())
+    assert "search_bigram VIRTUAL TABLE INDEX" in plan
+    assert "instr" not in plan
+
+
+def test_pdf_filter_and_removal(client, db):
+    first = upload(client, unique_pages(2))
+    second = upload(client, unique_pages(2))
+    _annotate(client, first["id"], "概率论与数理统计")
+    _annotate(client, second["id"], "概率论基础")
+
+    assert {hit["pdf_id"] for hit in _search(client, "概率")} >= {first["id"], second["id"]}
+    assert {hit["pdf_id"] for hit in _search(client, "概率", pdf_id=second["id"])} == {second["id"]}
+    assert wait_for(lambda: _search(client, "lorem", pdf_id=first["id"], kind="page"))
+    assert not _search(client, "lorem", pdf_id=first["id"], kind="annotation")
+
+    assert client.delete(f"/api/pdfs/{second['id']}").status_code == 200
+    assert not _search(client, "概率", pdf_id=second["id"])
+    assert _search(client, "概率", pdf_id=first["id"])
+    remaining = db.execute(text(
+        "SELECT count(*) FROM search_entries WHERE pdf_id = :pdf_id"
+    ), {"pdf_id": second["id"]}).scalar()
+    assert remaining == 0
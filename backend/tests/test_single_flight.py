@@ -0,0 +1,86 @@
+"""请求合并：并发的相同AI调用共享一次模型调用和同一个结果"""
+import asyncio
+import threading
+from app.services.single_flight import SingleFlight
+from helpers import unique_pages, upload
+
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"summary": "共享结果"}
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.do("summary:abc", call) for _ in range(10)))
+        # 前一次调用结束后，相同的键重新调用
+        again = await flight.do("summary:abc", call)
+        return results, again
+
+    results, again = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert all(result is results[0] for result in results)
+    assert again == {"summary": "共享结果"}
+    assert flight.stats() == {"in_flight": 0, "leaders": 2, "coalesced": 9}
+
+
+def test_errors_reach_every_waiter():
+    flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("model unavailable")
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("k", call) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [str(result) for result in results] == ["model unavailable"] * 3
+
+
+def test_late_stream_subscriber_replays_earlier_chunks():
+    flight = SingleFlight()
+    starts = []
+
+    async def start():
+        starts.append(1)
+
+        async def chunks():
+            for chunk in ("一", "二", "三"):
+                await asyncio.sleep(0.02)
+                yield chunk
+        return chunks()
+
+    async def collect(stream):
+        return "".join([chunk async for chunk in stream])
+
+    async def scenario():
+        first = asyncio.ensure_future(collect(flight.stream("explain:x", start)))
+        await asyncio.sleep(0.03)
+        second = await collect(flight.stream("explain:x", start))
+        return await first, second
+
+    assert asyncio.run(scenario()) == ("一二三", "一二三")
+    assert starts == [1]
+
+
+def test_concurrent_identical_explains_call_model_once(client, fake_model):
+    pdf = upload(client, unique_pages(1))
+    fake_model.delay = 0.3
+    request = {"pdf_id": pdf["id"], "selected_text": "lorem dolor", "page_number": 1}
+    results = []
+
+    def explain():
+        response = client.post("/api/chat/explain", json=request)
+        results.append((response.status_code, response.json()["explanation"]))
+
+    threads = [threading.Thread(target=explain) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [(200, "答案")] * 6
+    assert len(fake_model.requests) == 1
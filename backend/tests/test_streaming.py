@@ -0,0 +1,101 @@
+"""SSE流式接口：逐段转发模型输出，流结束后保存完整消息，出错时发送error事件"""
+import json
+import threading
+import pytest
+from app.database.models import Message
+from app.routes import chat_routes, formula_routes
+from helpers import unique_pages, upload
+
+
+def _events(response):
+    """解析SSE响应为 (事件名, 数据) 列表（忽略注释帧）"""
+    events = []
+    for frame in response.text.split("\n\n"):
+        name, data = "message", None
+        for line in frame.splitlines():
+            if line.startswith("event:"):
+                name = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):])
+        if data is not None:
+            events.append((name, data))
+    return events
+
+
+def test_chat_stream_sends_deltas_and_persists_message(client, fake_model, db):
+    pdf = upload(client, unique_pages(1))
+    fake_model.reply = lambda payload: ["矩阵", "乘法", "满足结合律"]
+
+    response = client.post("/api/chat/send/stream", json={"pdf_id": pdf["id"], "message": "什么是矩阵乘法"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.startswith(": connected")
+
+    events = _events(response)
+    assert [data["delta"] for name, data in events if name == "message"] == ["矩阵", "乘法", "满足结合律"]
+    name, done = events[-1]
+    assert name == "done" and done["text"] == "矩阵乘法满足结合律"
+
+    message = db.query(Message).filter(Message.id == done["message_id"]).one()
+    assert (message.role, message.content) == ("assistant", "矩阵乘法满足结合律")
+    assert fake_model.requests[-1]["stream"] is True
+
+
+def test_chat_stream_saves_off_event_loop(client, fake_model, monkeypatch):
+    pdf = upload(client, unique_pages(1))
+    fake_model.reply = lambda payload: ["答案"]
+    threads = []
+    original = chat_routes._save_exchange
+
+    def save_exchange(*args):
+        threads.append(threading.get_ident())
+        return original(*args)
+
+    monkeypatch.setattr(chat_routes, "_save_exchange", save_exchange)
+    events = _events(client.post("/api/chat/send/stream", json={"pdf_id": pdf["id"], "message": "问题"}))
+    assert events[-1][0] == "done" and events[-1][1]["message_id"]
+    assert threads and client.portal.call(threading.get_ident) not in threads
+
+
+def test_explain_and_formula_streams(client, fake_model):
+    pdf = upload(client, unique_pages(1))
+    fake_model.reply = lambda payload: ["一", "二"]
+    request = {"pdf_id": pdf["id"], "selected_text": "lorem", "page_number": 1, "no_cache": True}
+
+    for path in ("/api/chat/explain/stream", "/api/chat/translate/stream", "/api/formula/explain/stream"):
+        events = _events(client.post(path, json=request))
+        assert events[-1] == ("done", {"text": "一二"}), path
+
+
+def test_stream_error_is_reported_as_event(client, fake_model):
+    pdf = upload(client, unique_pages(1))
+
+    def reply(payload):
+        yield "部分"
+        raise RuntimeError("upstream closed")
+
+    fake_model.reply = reply
+    events = _events(client.post("/api/chat/explain/stream", json={
+        "pdf_id": pdf["id"], "selected_text": "lorem", "page_number": 1, "no_cache": True
+    }))
+    assert events[0] == ("message", {"delta": "部分"})
+    assert events[-1][0] == "error"
+    assert "upstream closed" in events[-1][1]["detail"]
+
+
+
+@pytest.mark.parametrize("module, method, path, detail", [
+    (chat_routes, "explain_selected_text", "/api/chat/explain/stream", "Explanation failed"),
+    (chat_routes, "translate_text", "/api/chat/translate/stream", "Translation failed"),
+    (formula_routes, "explain_formula", "/api/formula/explain/stream", "Formula explanation failed"),
+])
+def test_stream_setup_error_returns_500(client, monkeypatch, module, method, path, detail):
+    pdf = upload(client, unique_pages(1))
+
+    async def fail(**kwargs):
+        raise RuntimeError("cache unavailable")
+
+    monkeypatch.setattr(module.gemini_service, method, fail)
+    response = client.post(path, json={"pdf_id": pdf["id"], "selected_text": "lorem", "page_number": 1})
+    assert response.status_code == 500
+    assert response.json()["detail"] == f"{detail}: cache unavailable"
@@ -0,0 +1,71 @@
+"""分层摘要：页段并行摘要后逐级合并，中间摘要存库，章节摘要复用已完成的页段"""
+import re
+from app.config import settings
+from app.database.models import BackgroundJob, PDFTextExtraction
+from app.services.summarization_service import HierarchicalSummarizer
+from app.services.token_usage import token_usage
+from helpers import unique_pages, upload, wait_for
+
+
+def _range_calls(fake_model):
+    """各次页段摘要调用对应的页码范围"""
+    calls = []
+    for payload in fake_model.requests:
+        match = re.search(r"第(\d+)-(\d+)页的内容", fake_model.prompt_text(payload))
+        if match:
+            calls.append((int(match.group(1)), int(match.group(2))))
+    return sorted(calls)
+
+
+def _job_status(db, job_id):
+    db.expire_all()
+    return db.query(BackgroundJob.status).filter(BackgroundJob.id == job_id).scalar()
+
+
+def _extracted(db, pdf_id):
+    db.expire_all()
+    return db.query(PDFTextExtraction.status).filter(PDFTextExtraction.pdf_id == pdf_id).scalar() == "completed"
+
+
+def test_ranges_are_aligned_to_first_page(monkeypatch):
+    monkeypatch.setattr(settings, "SUMMARY_RANGE_PAGES", 10)
+    assert HierarchicalSummarizer._aligned_ranges(1, 25) == [(1, 10), (11, 20), (21, 25)]
+    assert HierarchicalSummarizer._aligned_ranges(7, 23) == [(7, 10), (11, 20), (21, 23)]
+
+
+def test_large_document_is_summarized_hierarchically(client, fake_model, db, monkeypatch):
+    monkeypatch.setattr(settings, "SUMMARY_SINGLE_PASS_PAGES", 10)
+    monkeypatch.setattr(settings, "SUMMARY_RANGE_PAGES", 10)
+    monkeypatch.setattr(settings, "SUMMARY_REDUCE_FANOUT", 2)
+    fake_model.reply = lambda payload: "阶段摘要"
+    pdf = upload(client, unique_pages(45))
+    assert wait_for(lambda: _extracted(db, pdf["id"]))
+
+    response = client.post(f"/api/pdfs/{pdf['id']}/summary")
+    assert response.status_code == 202
+    assert wait_for(lambda: _job_status(db, response.json()["id"]) == "completed")
+    assert _range_calls(fake_model) == [(1, 10), (11, 20), (21, 30), (31, 40), (41, 45)]
+    # 页段摘要基于已提取的文本，不发送PDF
+    assert all(isinstance(payload["messages"][0]["content"], str) for payload in fake_model.requests)
+    assert any("page 45" in fake_model.prompt_text(payload) for payload in fake_model.requests)
+
+    sections = client.get(f"/api/pdfs/{pdf['id']}/summary/sections").json()
+    levels = {(s["level"], s["start_page"], s["end_page"]) for s in sections}
+    assert {(0, 1, 10), (0, 41, 45), (1, 1, 20), (1, 21, 40), (2, 1, 40)} <= levels
+    assert client.get(f"/api/pdfs/{pdf['id']}/summary").status_code == 200
+
+    # 章节摘要复用已存储的页段和合并结果
+    calls = len(fake_model.requests)
+    section = client.post(f"/api/pdfs/{pdf['id']}/summary/range", params={"start": 21, "end": 40}).json()
+    assert (section["level"], section["start_page"], section["end_page"]) == (1, 21, 40)
+    assert len(fake_model.requests) == calls
+
+    # 合并调用的用量记在该文档名下
+    token_usage.flush()
+    actions = {entry["action"] for entry in client.get(f"/api/pdfs/{pdf['id']}/usage").json()["actions"]}
+    assert {"range_summary", "merge_summaries"} <= actions
+
+    section = client.post(f"/api/pdfs/{pdf['id']}/summary/range", params={"start": 11, "end": 30}).json()
+    assert (section["start_page"], section["end_page"]) == (11, 30)
+    assert len(fake_model.requests) == calls + 1
+    assert _range_calls(fake_model) == [(1, 10), (11, 20), (21, 30), (31, 40), (41, 45)]
@@ -0,0 +1,87 @@
+"""逐页文本提取：按批提交进度、中断后续提、同一PDF只排队一次"""
+import threading
+from app.config import settings
+from app.database.models import PDFPageText, PDFTextExtraction
+from app.services import text_index_service as module
+from app.services.text_index_service import TextIndexService, text_index
+from helpers import unique_pages, upload, wait_for
+
+
+def _status(db, pdf_id):
+    db.expire_all()
+    extraction = db.query(PDFTextExtraction).filter(PDFTextExtraction.pdf_id == pdf_id).first()
+    return extraction.status if extraction else None
+
+
+def _upload_extracted(client, db, count):
+    pdf = upload(client, unique_pages(count))
+    assert wait_for(lambda: _status(db, pdf["id"]) == "completed")
+    return pdf
+
+
+def _record_batches(monkeypatch, db, pdf_id):
+    """包装 run_sync，记录每批的页范围和调用时已提交的进度"""
+    calls = []
+    original = module.cpu_pool.run_sync
+
+    def run_sync(fn, file_path, start, end, **kwargs):
+        db.expire_all()
+        extraction = db.query(PDFTextExtraction).filter(PDFTextExtraction.pdf_id == pdf_id).first()
+        calls.append((start, end, extraction.pages_done))
+        return original(fn, file_path, start, end, **kwargs)
+
+    monkeypatch.setattr(module.cpu_pool, "run_sync", run_sync)
+    return calls
+
+
+def test_progress_is_committed_per_batch(client, db, monkeypatch):
+    monkeypatch.setattr(settings, "TEXT_EXTRACTION_BATCH_PAGES", 2)
+    pdf = _upload_extracted(client, db, 5)
+    calls = _record_batches(monkeypatch, db, pdf["id"])
+
+    assert text_index.extract_and_store(pdf["id"]) == "completed"
+    assert calls == [(1, 2, 0), (3, 4, 2), (5, 5, 4)]
+    pages = text_index.get_pages(pdf["id"], 1, 5)
+    assert [page.page_number for page in pages] == [1, 2, 3, 4, 5]
+    assert "page 5" in pages[4].text
+
+
+def test_interrupted_extraction_resumes_after_committed_pages(client, db, monkeypatch):
+    monkeypatch.setattr(settings, "TEXT_EXTRACTION_BATCH_PAGES", 2)
+    pdf = _upload_extracted(client, db, 5)
+
+    # 模拟进程在提交了前两页后退出
+    extraction = db.query(PDFTextExtraction).filter(PDFTextExtraction.pdf_id == pdf["id"]).first()
+    extraction.status = "running"
+    extraction.pages_done = 2
+    db.query(PDFPageText).filter(
+        PDFPageText.pdf_id == pdf["id"], PDFPageText.page_number > 2
+    ).delete(synchronize_session=False)
+    db.commit()
+
+    calls = _record_batches(monkeypatch, db, pdf["id"])
+    assert text_index.extract_and_store(pdf["id"]) == "completed"
+    assert [call[:2] for call in calls] == [(3, 4), (5, 5)]
+    db.expire_all()
+    assert db.query(PDFPageText).filter(PDFPageText.pdf_id == pdf["id"]).count() == 5
+
+
+def test_concurrent_schedule_submits_once(monkeypatch):
+    service = TextIndexService()
+    release = threading.Event()
+    runs = []
+
+    def extract_and_store(pdf_id):
+        runs.append(pdf_id)
+        release.wait(5)
+        return None
+
+    monkeypatch.setattr(service, "extract_and_store", extract_and_store)
+    threads = [threading.Thread(target=service.schedule, args=(424242,)) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    release.set()
+    service._executor.shutdown(wait=True)
+    assert runs == [424242]
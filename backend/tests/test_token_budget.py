@@ -0,0 +1,39 @@
+"""Token预算：对话历史按预算从最新的消息开始保留，长文档占满预算时仍保留最近的消息"""
+from app.config import settings
+from app.services.token_usage import token_usage
+from helpers import unique_pages, upload
+
+
+def _send(client, pdf_id, message):
+    response = client.post("/api/chat/send", json={"pdf_id": pdf_id, "message": message})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_trim_history_keeps_newest_messages():
+    messages = [{"role": "user", "content": f"问题{i} " + "x" * 400} for i in range(6)]
+    kept = token_usage.trim_history(messages, budget=300)
+    assert kept and kept == messages[-len(kept):]
+    assert len(kept) < len(messages)
+
+    assert token_usage.trim_history(messages, budget=0) == []
+    assert token_usage.trim_history(messages, budget=0, min_messages=2) == messages[-2:]
+
+
+def test_history_survives_large_document(client, fake_model, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_CONTEXT_MODE", "full")
+    monkeypatch.setattr(settings, "CHAT_HISTORY_MIN_MESSAGES", 2)
+    pdf = upload(client, unique_pages(300))
+    assert pdf["page_count"] * settings.PDF_TOKENS_PER_PAGE > settings.PROMPT_TOKEN_BUDGET
+    trimmed_before = token_usage.stats()["actions"].get("chat", {}).get("trimmed", 0)
+
+    fake_model.reply = lambda payload: "第一轮回答"
+    _send(client, pdf["id"], "第一个问题是什么")
+    fake_model.reply = lambda payload: "第二轮回答"
+    _send(client, pdf["id"], "第二个问题是什么")
+    _send(client, pdf["id"], "第三个问题")
+
+    prompt = fake_model.prompt_text(fake_model.requests[-1])
+    assert "第二个问题是什么" in prompt and "第二轮回答" in prompt
+    assert "第一个问题是什么" not in prompt
+    assert token_usage.stats()["actions"]["chat"]["trimmed"] > trimmed_before
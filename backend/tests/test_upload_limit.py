@@ -0,0 +1,57 @@
+"""上传大小限制：请求体被解析之前按Content-Length或已接收字节数拒绝"""
+import os
+from app.config import settings
+from helpers import make_pdf, unique_pages
+
+
+def _upload_files():
+    return set(os.listdir(settings.UPLOAD_DIR))
+
+
+def test_declared_length_over_limit_is_rejected_before_reading(client, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_FILE_SIZE", 1024)
+    monkeypatch.setattr(settings, "UPLOAD_FORM_OVERHEAD", 0)
+    before = _upload_files()
+
+    response = client.post(
+        "/api/pdfs/upload",
+        content=b"x" * 4096,
+        headers={"Content-Type": "multipart/form-data; boundary=test"}
+    )
+    assert response.status_code == 413
+    assert "文件过大" in response.json()["detail"]
+    assert _upload_files() == before
+
+
+def test_streamed_body_over_limit_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_FILE_SIZE", 1024)
+    monkeypatch.setattr(settings, "UPLOAD_FORM_OVERHEAD", 0)
+
+    def chunks():
+        for _ in range(8):
+            yield b"x" * 512
+
+    response = client.post(
+        "/api/pdfs/upload",
+        content=chunks(),
+        headers={"Content-Type": "multipart/form-data; boundary=test"}
+    )
+    assert response.status_code == 413
+
+
+def test_file_over_limit_within_form_overhead_is_rejected_by_service(client, monkeypatch):
+    data = make_pdf(unique_pages(3))
+    monkeypatch.setattr(settings, "MAX_FILE_SIZE", len(data) - 1)
+    before = _upload_files()
+
+    response = client.post("/api/pdfs/upload", files={"file": ("big.pdf", data, "application/pdf")})
+    assert response.status_code == 413
+    assert _upload_files() == before
+
+
+def test_upload_within_limit_is_accepted(client):
+    response = client.post(
+        "/api/pdfs/upload",
+        files={"file": ("small.pdf", make_pdf(unique_pages(1)), "application/pdf")}
+    )
+    assert response.status_code == 200
@@ -115,18 +115,20 @@ function setupResizers() {
 
 // ========== PDF管理 ==========
 
-async function loadPDFList() {
+async function loadPDFList(cursor = null) {
     try {
-        const response = await fetch(`${API_BASE_URL}/pdfs/`);
-        const pdfs = await response.json();
+        const params = new URLSearchParams({ limit: 50 });
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`${API_BASE_URL}/pdfs/?${params}`);
+        const { items: pdfs, has_more, next_cursor } = await response.json();
 
         const listContainer = document.getElementById('pdf-list');
-        if (pdfs.length === 0) {
+        if (!cursor && pdfs.length === 0) {
             listContainer.innerHTML = '<p class="empty-message">暂无文档</p>';
             return;
         }
 
-        listContainer.innerHTML = pdfs.map(pdf => `
+        const html = pdfs.map(pdf => `
             <div class="pdf-item" data-pdf-id="${pdf.id}" onclick="loadPDF(${pdf.id}, event)">
                 <div class="pdf-item-title">${pdf.original_filename}</div>
                 <div class="pdf-item-info">
@@ -134,6 +136,18 @@ async function loadPDFList() {
                 </div>
             </div>
         `).join('');
+
+        // 分页加载：移除旧的"加载更多"按钮后追加下一页
+        listContainer.querySelector('.load-more')?.remove();
+        if (cursor) {
+            listContainer.insertAdjacentHTML('beforeend', html);
+        } else {
+            listContainer.innerHTML = html;
+        }
+        if (has_more) {
+            listContainer.insertAdjacentHTML('beforeend',
+                `<div class="pdf-item load-more" onclick="loadPDFList('${next_cursor}')">加载更多...</div>`);
+        }
     } catch (error) {
         console.error('Failed to load PDF list:', error);
         showError('加载文档列表失败');
@@ -201,16 +215,22 @@ async function loadPDF(pdfId, event) {
             if (pdfItem) pdfItem.classList.add('active');
         }
 
+        serverRenderUnavailable = false;
+
         // 加载PDF文档
-        const pdfUrl = `${API_BASE_URL}/pdfs/${pdfId}/file`;
+        const pdfUrl = versionedUrl(`${API_BASE_URL}/pdfs/${pdfId}/file`);
         console.log('Loading PDF from:', pdfUrl);
 
+        // 页面图片由服务端渲染，pdf.js只用于页面尺寸和文本层：
+        // 关闭自动预取和流式加载，按需通过Range请求获取用到的部分
         const loadingTask = pdfjsLib.getDocument({
             url: pdfUrl,
             httpHeaders: {
                 'Accept': 'application/pdf'
             },
-            withCredentials: false
+            withCredentials: false,
+            disableAutoFetch: true,
+            disableStream: true
         });
 
         currentPDFDoc = await loadingTask.promise;
@@ -263,12 +283,15 @@ async function renderPage(pageNum) {
         canvas.height = viewport.height;
         canvas.width = viewport.width;
 
-        const renderContext = {
-            canvasContext: context,
-            viewport: viewport
-        };
+        // 优先使用服务端渲染的页面图片，不可用时回退到pdf.js
+        if (!await drawServerPage(pageNum, canvas, scale)) {
+            const renderContext = {
+                canvasContext: context,
+                viewport: viewport
+            };
 
-        await page.render(renderContext).promise;
+            await page.render(renderContext).promise;
+        }
 
         // 渲染文本层以支持文本选择
         textLayerDiv.innerHTML = '';
@@ -380,15 +403,64 @@ async function renderAllPages() {
     container.innerHTML = '';
     pages.forEach(page => container.appendChild(page));
 
-    // 渲染所有页面（包括文本层）
-    for (let i = 1; i <= totalPages; i++) {
-        await renderPageToCanvas(i, `pdf-canvas-${i}`, `text-layer-${i}`);
-    }
+    // 先按第一页尺寸占位，页面接近可视区域时再渲染（包括文本层）
+    const firstPage = await currentPDFDoc.getPage(1);
+    const placeholder = firstPage.getViewport({ scale: 1.5 });
+    container.querySelectorAll('.pdf-page-canvas').forEach((canvas, index) => {
+        canvas.width = placeholder.width;
+        canvas.height = placeholder.height;
+        // 渲染完成前先显示缩略图（上传后已在后台预先渲染）
+        if (!serverRenderUnavailable) {
+            canvas.style.backgroundImage = `url(${versionedUrl(`${API_BASE_URL}/pdfs/${currentPDF.id}/pages/${index + 1}/thumbnail`)})`;
+            canvas.style.backgroundSize = '100% 100%';
+        }
+    });
+
+    const renderObserver = new IntersectionObserver((entries) => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) {
+                renderObserver.unobserve(entry.target);
+                const pageNum = parseInt(entry.target.dataset.pageNum);
+                renderPageToCanvas(pageNum, `pdf-canvas-${pageNum}`, `text-layer-${pageNum}`);
+            }
+        });
+    }, {
+        root: container,
+        rootMargin: '200% 0px'
+    });
+    container.querySelectorAll('.pdf-page-wrapper').forEach(wrapper => renderObserver.observe(wrapper));
 
     // 设置滚动监听，更新当前页码
     setupScrollObserver();
 }
 
+// 服务端渲染不可用（未安装poppler等）时回退到pdf.js在浏览器中渲染
+let serverRenderUnavailable = false;
+
+// 附加内容哈希：记录ID可能在删除后被复用，只有带版本的URL才会被浏览器长期缓存
+function versionedUrl(url) {
+    if (!currentPDF || !currentPDF.content_hash) return url;
+    return `${url}${url.includes('?') ? '&' : '?'}v=${currentPDF.content_hash}`;
+}
+
+function drawServerPage(pageNum, canvas, scale) {
+    if (serverRenderUnavailable || !currentPDF) return Promise.resolve(false);
+    return new Promise(resolve => {
+        const img = new Image();
+        // 允许从canvas截图（需要CORS）
+        img.crossOrigin = 'anonymous';
+        img.onload = () => {
+            canvas.getContext('2d').drawImage(img, 0, 0, canvas.width, canvas.height);
+            resolve(true);
+        };
+        img.onerror = () => {
+            serverRenderUnavailable = true;
+            resolve(false);
+        };
+        img.src = versionedUrl(`${API_BASE_URL}/pdfs/${currentPDF.id}/pages/${pageNum}/image?dpi=${Math.round(72 * scale)}`);
+    });
+}
+
 async function renderPageToCanvas(pageNum, canvasId, textLayerId) {
     try {
         const page = await currentPDFDoc.getPage(pageNum);
@@ -402,12 +474,15 @@ async function renderPageToCanvas(pageNum, canvasId, textLayerId) {
         canvas.height = viewport.height;
         canvas.width = viewport.width;
 
-        const renderContext = {
-            canvasContext: context,
-            viewport: viewport
-        };
+        // 优先使用服务端渲染的页面图片（有缓存，不占用浏览器CPU）
+        if (!await drawServerPage(pageNum, canvas, scale)) {
+            const renderContext = {
+                canvasContext: context,
+                viewport: viewport
+            };
 
-        await page.render(renderContext).promise;
+            await page.render(renderContext).promise;
+        }
 
         // 渲染文本层（如果提供了 textLayerId）
         if (textLayerId) {
@@ -469,21 +544,16 @@ async function sendMessage() {
     const loadingMsg = addMessage('assistant', '正在思考...', false);
 
     try {
-        const response = await fetch(`${API_BASE_URL}/chat/send`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                pdf_id: currentPDF.id,
-                message: message,
-                selected_text: selectedText || null,
-                page_number: selectedText ? currentPage : null
-            })
-        });
-
-        const result = await response.json();
-
-        // 替换加载消息为实际回复（使用Markdown渲染）
-        updateMessage(loadingMsg, result.response, true);
+        // 流式接收回复，边到达边渲染
+        const result = await streamPost(`${API_BASE_URL}/chat/send/stream`, {
+            pdf_id: currentPDF.id,
+            message: message,
+            selected_text: selectedText || null,
+            page_number: selectedText ? currentPage : null
+        }, (text) => updateMessage(loadingMsg, text, true));
+
+        // 替换加载消息为完整回复（使用Markdown渲染）
+        updateMessage(loadingMsg, result.text, true);
         currentConversationId = result.conversation_id;
 
         // 清空选中文本
@@ -494,6 +564,50 @@ async function sendMessage() {
     }
 }
 
+// 以SSE方式POST请求，每收到一段文本回调一次累计内容，返回 done 事件的数据
+async function streamPost(url, body, onText) {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body)
+    });
+    if (!response.ok || !response.body) {
+        throw new Error(`HTTP ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let text = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            for (const line of frame.split('\n')) {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            }
+            if (!data) continue;
+
+            const payload = JSON.parse(data);
+            if (event === 'error') throw new Error(payload.detail);
+            if (event === 'done') return payload;
+            text += payload.delta;
+            onText(text);
+        }
+    }
+    throw new Error('Stream ended unexpectedly');
+}
+
 function addMessage(role, content, useMarkdown = true) {
     const messagesContainer = document.getElementById('chat-messages');
     const messageDiv = document.createElement('div');
@@ -561,8 +675,9 @@ function updateMessage(messageDiv, content, useMarkdown = true) {
 
 async function loadConversationHistory(pdfId) {
     try {
-        const response = await fetch(`${API_BASE_URL}/chat/${pdfId}/conversations`);
-        const conversations = await response.json();
+        // 只需要最近一个对话及其最近的消息
+        const response = await fetch(`${API_BASE_URL}/chat/${pdfId}/conversations?limit=1&messages=50`);
+        const { conversations } = await response.json();
 
         const messagesContainer = document.getElementById('chat-messages');
         messagesContainer.innerHTML = `
@@ -1108,10 +1223,20 @@ async function generateSummary() {
     showLoading('生成摘要中，这可能需要一些时间...');
 
     try {
-        const response = await fetch(`${API_BASE_URL}/pdfs/${currentPDF.id}/summary`, {
+        let response = await fetch(`${API_BASE_URL}/pdfs/${currentPDF.id}/summary`, {
             method: 'POST'
         });
 
+        // 摘要尚未生成时后台排队，轮询任务完成后再读取
+        if (response.status === 202) {
+            const job = await response.json();
+            await waitForJob(job.id, (progress) => {
+                showLoading(`生成摘要中（${progress.progress}%），这可能需要一些时间...`);
+            });
+            response = await fetch(`${API_BASE_URL}/pdfs/${currentPDF.id}/summary`);
+        }
+
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
         const result = await response.json();
         hideLoading();
 
@@ -1130,6 +1255,21 @@ async function generateSummary() {
     }
 }
 
+// 轮询后台任务直到完成，失败时抛出错误
+async function waitForJob(jobId, onProgress, interval = 2000) {
+    while (true) {
+        const response = await fetch(`${API_BASE_URL}/jobs/${jobId}`);
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        const job = await response.json();
+
+        if (job.status === 'completed') return job;
+        if (job.status === 'failed') throw new Error(job.error || '任务失败');
+        if (onProgress) onProgress(job);
+
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
+
 // ========== 标签页切换 ==========
 
 function switchTab(tabName) {